@@ -0,0 +1,165 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from .resilience import EndpointError
+from .tracing import tracer
+
+
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("ENDPOINT_MAX_IN_FLIGHT", "8"))
+MAX_QUEUE = int(os.getenv("ENDPOINT_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("ENDPOINT_QUEUE_TIMEOUT_SECONDS", "30"))
+
+
+def parse_limits(value: str) -> dict[str, int]:
+    """Per-endpoint overrides from "endpoint-a=4,endpoint-b=16"."""
+    limits = {}
+    for item in value.split(","):
+        name, _, limit = item.strip().partition("=")
+        if name and limit.strip().isdigit():
+            limits[name] = int(limit)
+    return limits
+
+
+class AdmissionRejectedError(EndpointError):
+    """The endpoint's queue is full, or the request waited too long for a slot."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, status_code=503, retry_after=retry_after)
+
+
+class EndpointGate:
+    """Caps in-flight calls to one endpoint and queues the rest, round-robin across users."""
+
+    def __init__(self, max_in_flight: int, max_queue: int, wait_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.wait_timeout = wait_timeout
+        self.in_flight = 0
+        self.depth = 0
+        self._queues: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.peak_depth = 0
+
+    async def acquire(self, user_key: str):
+        if self.in_flight < self.max_in_flight and not self._queues:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejectedError("Endpoint is at capacity, request queue is full", retry_after=1.0)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_key, deque()).append(waiter)
+        self.depth += 1
+        self.queued += 1
+        self.peak_depth = max(self.peak_depth, self.depth)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.wait_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                self._discard(user_key, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise AdmissionRejectedError(
+                    f"Timed out after {self.wait_timeout:.0f}s waiting for endpoint capacity",
+                    retry_after=self.wait_timeout
+                ) from None
+            raise
+        wait = time.monotonic() - started
+        self.waited += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.admitted += 1
+
+    def release(self):
+        """Hand the slot to the next waiter, taking users in turn, or free it."""
+        while self._queues:
+            user_key, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.depth -= 1
+            if queue:
+                self._queues.move_to_end(user_key)
+            else:
+                del self._queues[user_key]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _discard(self, user_key: str, waiter: asyncio.Future):
+        queue = self._queues.get(user_key)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self.depth -= 1
+            if not queue:
+                del self._queues[user_key]
+
+    def snapshot(self, endpoint: str) -> dict:
+        return {
+            "endpoint": endpoint,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.depth,
+            "queued_users": len(self._queues),
+            "peak_queue_depth": self.peak_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(self.total_wait / self.waited * 1000) if self.waited else 0,
+            "max_wait_ms": round(self.max_wait * 1000),
+        }
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        default_max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_queue: int = MAX_QUEUE,
+        wait_timeout: float = QUEUE_TIMEOUT,
+        limits: Optional[dict[str, int]] = None
+    ):
+        self.default_max_in_flight = default_max_in_flight
+        self.max_queue = max_queue
+        self.wait_timeout = wait_timeout
+        self.limits = limits or {}
+        self._gates: dict[str, EndpointGate] = {}
+
+    def gate(self, endpoint: str) -> EndpointGate:
+        if endpoint not in self._gates:
+            self._gates[endpoint] = EndpointGate(
+                self.limits.get(endpoint, self.default_max_in_flight), self.max_queue, self.wait_timeout
+            )
+        return self._gates[endpoint]
+
+    @asynccontextmanager
+    async def admit(self, endpoint: str, user_key: str) -> AsyncIterator[None]:
+        gate = self.gate(endpoint)
+        with tracer.span("endpoint.admission", **{"databricks.endpoint": endpoint}) as span:
+            span.set_attribute("admission.queue_depth", gate.depth)
+            await gate.acquire(user_key)
+        try:
+            yield
+        finally:
+            gate.release()
+
+    def snapshot(self) -> list[dict]:
+        return [gate.snapshot(name) for name, gate in sorted(self._gates.items())]
+
+
+endpoint_admission = AdmissionController(limits=parse_limits(os.getenv("ENDPOINT_CONCURRENCY_LIMITS", "")))
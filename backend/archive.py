@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from .log import get_logger
+from .models import Message
+
+
+# Conversations untouched for this many days move their messages to message_archive; 0 disables
+MESSAGE_ARCHIVE_AFTER_DAYS = float(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", "0"))
+MESSAGE_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("MESSAGE_ARCHIVE_INTERVAL_SECONDS", "3600"))
+MESSAGE_ARCHIVE_BATCH = int(os.getenv("MESSAGE_ARCHIVE_BATCH", "200"))
+# Range-partition messages by month (Postgres backends); converting an existing table
+# rewrites it under an exclusive lock, so enable it in a maintenance window
+MESSAGE_PARTITIONING = os.getenv("MESSAGE_PARTITIONING", "false").lower() == "true"
+PARTITION_MONTHS_AHEAD = int(os.getenv("MESSAGE_PARTITION_MONTHS_AHEAD", "2"))
+
+DAY_MS = 86_400_000
+
+log = get_logger("storage.archive")
+
+
+def pack_messages(messages: list[Message]) -> bytes:
+    """Compressed JSON of a conversation's messages, as stored in message_archive.payload."""
+    rows = [[m.id, m.role.value, m.content, m.timestamp] for m in messages]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def unpack_messages(payload: bytes) -> list[Message]:
+    rows = json.loads(zlib.decompress(payload))
+    return [Message(id=id, role=role, content=content, timestamp=timestamp) for id, role, content, timestamp in rows]
+
+
+def _add_months(year: int, month: int, months: int) -> tuple[int, int]:
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def _month_start_ms(year: int, month: int) -> int:
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def partition_name(year: int, month: int) -> str:
+    return f"messages_p{year}_{month:02d}"
+
+
+def parse_partition_name(name: str) -> Optional[tuple[int, int]]:
+    if not name.startswith("messages_p"):
+        return None
+    year, _, month = name[len("messages_p"):].partition("_")
+    return (int(year), int(month)) if year.isdigit() and month.isdigit() else None
+
+
+def partition_bounds(year: int, month: int) -> tuple[int, int]:
+    """[start, end) of a month in epoch milliseconds (UTC), matching message timestamps."""
+    return _month_start_ms(year, month), _month_start_ms(*_add_months(year, month, 1))
+
+
+def upcoming_months(now_ms: int, ahead: int = PARTITION_MONTHS_AHEAD) -> list[tuple[int, int]]:
+    current = datetime.fromtimestamp(now_ms / 1000, tz=timezone.utc)
+    return [_add_months(current.year, current.month, i) for i in range(ahead + 1)]
+
+
+def create_partition_sql(year: int, month: int) -> str:
+    start, end = partition_bounds(year, month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(year, month)} "
+        f"PARTITION OF messages FOR VALUES FROM ({start}) TO ({end})"
+    )
+
+
+class MessageArchiver:
+    """Background maintenance that keeps the hot messages table bounded.
+
+    Each run creates upcoming monthly partitions (when partitioning is on), drops old
+    partitions that archiving has emptied, and archives cold conversations in batches
+    until none are left. The storage backend supplies the SQL as callables.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        archive_batch: Callable[[int, int], Awaitable[int]],
+        maintain_partitions: Callable[[int], Awaitable[None]],
+        after_days: float = MESSAGE_ARCHIVE_AFTER_DAYS,
+        interval: float = MESSAGE_ARCHIVE_INTERVAL_SECONDS,
+        batch: int = MESSAGE_ARCHIVE_BATCH,
+        partitioning: bool = MESSAGE_PARTITIONING,
+    ):
+        self.backend = backend
+        self._archive_batch = archive_batch
+        self._maintain_partitions = maintain_partitions
+        self.after_days = after_days
+        self.interval = interval
+        self.batch = batch
+        self.partitioning = partitioning
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.last_run: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0 or self.partitioning
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    def cutoff_ms(self) -> int:
+        return int(time.time() * 1000 - self.after_days * DAY_MS)
+
+    async def run_once(self) -> int:
+        if self.partitioning:
+            await self._maintain_partitions(self.cutoff_ms() if self.after_days > 0 else 0)
+        if self.after_days <= 0:
+            return 0
+        archived = 0
+        cutoff = self.cutoff_ms()
+        while True:
+            count = await self._archive_batch(cutoff, self.batch)
+            archived += count
+            if count < self.batch:
+                break
+        self.archived += archived
+        self.last_run = time.time()
+        if archived:
+            log.info("Archived cold conversations", backend=self.backend, conversations=archived)
+        return archived
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                log.exception("Message archiving failed", backend=self.backend, error=e)
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend,
+            "archive_after_days": self.after_days,
+            "partitioning": self.partitioning,
+            "archived": self.archived,
+            "last_run": self.last_run,
+        }
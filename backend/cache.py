@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+from .log import get_logger
+
+T = TypeVar("T")
+log = get_logger("cache")
+
+
+def identity_hash(email: Optional[str], token: Optional[str]) -> str:
+    """Stable cache key for a caller; raw emails and tokens never become dict keys."""
+    identity = email.lower() if email else (token or "anonymous")
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+
+class _Entry(Generic[T]):
+    __slots__ = ("value", "fetched_at")
+
+    def __init__(self, value: T, fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+class TTLCache(Generic[T]):
+    """In-process async cache with TTL, stale-while-revalidate, LRU eviction and single-flight loads.
+
+    Within `ttl` seconds an entry is served as-is. For another `stale_ttl` seconds it is
+    still served, and one background refresh is started. Older entries are loaded again
+    inline. Concurrent loads for the same key share one loader call. Empty results
+    are not cached, so a failed or empty upstream listing is retried on the next request.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0, max_entries: int = 1000):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, _Entry[T]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[T]], bypass: bool = False
+    ) -> T:
+        if not bypass:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry.fetched_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        self._start_load(key, loader).add_done_callback(self._log_background_failure)
+                    return entry.value
+            self.misses += 1
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                return await asyncio.shield(inflight)
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> asyncio.Future:
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._inflight[key] = task
+        return task
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        try:
+            self.loads += 1
+            value = await loader()
+            if value:
+                self._store(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def _store(self, key: Hashable, value: T):
+        self._entries[key] = _Entry(value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _log_background_failure(self, task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("Background refresh failed", cache=self.name, error=task.exception())
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "stale_seconds": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+endpoint_cache: TTLCache[list] = TTLCache(
+    "endpoint-catalog",
+    ttl=float(os.getenv("ENDPOINT_CACHE_TTL_SECONDS", "300")),
+    stale_ttl=float(os.getenv("ENDPOINT_CACHE_STALE_SECONDS", "600")),
+    max_entries=int(os.getenv("ENDPOINT_CACHE_MAX_ENTRIES", "1000")),
+)
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import time
+import zlib
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional
+
+from .log import get_logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# "zstd" or "zlib" compresses long messages; "off" stores everything as text.
+# zstd comes from the `zstandard` requirement; if it is missing, zstd falls back to zlib.
+MESSAGE_COMPRESSION = os.getenv("MESSAGE_COMPRESSION", "off").lower()
+MESSAGE_COMPRESSION_MIN_BYTES = int(os.getenv("MESSAGE_COMPRESSION_MIN_BYTES", "1024"))
+# Per-domain dictionaries, trained from that domain's own long messages
+MESSAGE_COMPRESSION_DICTIONARIES = os.getenv("MESSAGE_COMPRESSION_DICTIONARIES", "true").lower() == "true"
+# How often domains without a dictionary are checked for enough samples to train one
+DICTIONARY_TRAIN_INTERVAL_SECONDS = float(os.getenv("MESSAGE_COMPRESSION_DICTIONARY_INTERVAL_SECONDS", "86400"))
+DICTIONARY_BYTES = 32 * 1024  # zlib preset dictionaries are capped at 32 KiB
+DICTIONARY_SAMPLES = 2000
+DICTIONARY_MIN_SAMPLES = 100
+# Keep the compressed form only when it saves at least this fraction
+MIN_SAVING = 0.1
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+log = get_logger("storage.compression")
+
+
+def zstd_available() -> bool:
+    return zstandard is not None
+
+
+def _build_zlib_dictionary(samples: list[str], size: int) -> bytes:
+    """Frequent word n-grams, most useful last, since zlib matches nearer the end more cheaply."""
+    counts: Counter[str] = Counter()
+    for sample in samples:
+        words = sample.split()
+        for n in (2, 4, 8):
+            for i in range(0, len(words) - n + 1, n // 2 or 1):
+                counts[" ".join(words[i:i + n])] += 1
+    chosen, used = [], 0
+    for phrase, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2:
+            break
+        encoded = (phrase + " ").encode("utf-8")
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+def train_dictionary(algorithm: str, samples: list[str], size: int = DICTIONARY_BYTES) -> bytes:
+    if algorithm == "zstd":
+        return zstandard.train_dictionary(size, [s.encode("utf-8") for s in samples]).as_bytes()
+    return _build_zlib_dictionary(samples, size)
+
+
+class MessageCodec:
+    """Compresses long message content for storage and restores it when rows are read.
+
+    A stored message is (content, codec, blob): short or incompressible messages keep
+    their text and a NULL codec; compressed ones store an empty content and the
+    compressed bytes in blob. The codec is "zstd" or "zlib", optionally followed by
+    ":<dictionary id>" when a per-domain dictionary was used.
+    """
+
+    def __init__(self, mode: str = MESSAGE_COMPRESSION, min_bytes: int = MESSAGE_COMPRESSION_MIN_BYTES,
+                 use_dictionaries: bool = MESSAGE_COMPRESSION_DICTIONARIES):
+        if mode == "zstd" and not zstd_available():
+            log.warning("zstandard is not installed, compressing messages with zlib")
+            mode = "zlib"
+        self.algorithm = mode if mode in ("zstd", "zlib") else None
+        self.min_bytes = min_bytes
+        self.use_dictionaries = use_dictionaries and self.algorithm is not None
+        self._dictionaries: dict[int, tuple[str, bytes]] = {}
+        self._domain_dictionary: dict[str, int] = {}
+        self._zstd_compressors: dict[Optional[int], "zstandard.ZstdCompressor"] = {}
+        self._zstd_decompressors: dict[Optional[int], "zstandard.ZstdDecompressor"] = {}
+        # Writes to existing conversations only carry the id; remember each one's domain
+        self._conversation_domains: OrderedDict[str, Optional[str]] = OrderedDict()
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.algorithm is not None
+
+    def remember_domain(self, conversation_id: str, domain_id: Optional[str]):
+        self._conversation_domains[conversation_id] = domain_id
+        self._conversation_domains.move_to_end(conversation_id)
+        if len(self._conversation_domains) > 10_000:
+            self._conversation_domains.popitem(last=False)
+
+    def domain_of(self, conversation_id: str) -> Optional[str]:
+        return self._conversation_domains.get(conversation_id)
+
+    def add_dictionary(self, dictionary_id: int, domain_id: str, algorithm: str, data: bytes):
+        self._dictionaries[dictionary_id] = (algorithm, data)
+        if algorithm == self.algorithm:
+            self._domain_dictionary[domain_id] = max(dictionary_id, self._domain_dictionary.get(domain_id, 0))
+
+    def has_dictionary(self, dictionary_id: int) -> bool:
+        return dictionary_id in self._dictionaries
+
+    def domains_with_dictionaries(self) -> set[str]:
+        return set(self._domain_dictionary)
+
+    @staticmethod
+    def dictionary_id(codec: Optional[str]) -> Optional[int]:
+        if codec and ":" in codec:
+            return int(codec.split(":", 1)[1])
+        return None
+
+    def _zstd_compressor(self, dictionary_id: Optional[int]):
+        if dictionary_id not in self._zstd_compressors:
+            dict_data = zstandard.ZstdCompressionDict(self._dictionaries[dictionary_id][1]) if dictionary_id else None
+            self._zstd_compressors[dictionary_id] = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+        return self._zstd_compressors[dictionary_id]
+
+    def _zstd_decompressor(self, dictionary_id: Optional[int]):
+        if dictionary_id not in self._zstd_decompressors:
+            dict_data = zstandard.ZstdCompressionDict(self._dictionaries[dictionary_id][1]) if dictionary_id else None
+            self._zstd_decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return self._zstd_decompressors[dictionary_id]
+
+    def _compress(self, algorithm: str, data: bytes, dictionary_id: Optional[int]) -> bytes:
+        if algorithm == "zstd":
+            return self._zstd_compressor(dictionary_id).compress(data)
+        if dictionary_id:
+            compressor = zlib.compressobj(ZLIB_LEVEL, zdict=self._dictionaries[dictionary_id][1])
+            return compressor.compress(data) + compressor.flush()
+        return zlib.compress(data, ZLIB_LEVEL)
+
+    def encode(self, content: str, domain_id: Optional[str] = None) -> tuple[str, Optional[str], Optional[bytes]]:
+        """Storage form of `content`: (text, codec, blob)."""
+        data = content.encode("utf-8")
+        if not self.enabled or len(data) < self.min_bytes:
+            return content, None, None
+        dictionary_id = self._domain_dictionary.get(domain_id) if self.use_dictionaries and domain_id else None
+        blob = self._compress(self.algorithm, data, dictionary_id)
+        if len(blob) > len(data) * (1 - MIN_SAVING):
+            return content, None, None
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(blob)
+        codec = f"{self.algorithm}:{dictionary_id}" if dictionary_id else self.algorithm
+        return "", codec, blob
+
+    def decode(self, content: str, codec: Optional[str], blob: Optional[bytes]) -> str:
+        """Message text from its storage form; rows written before compression pass through."""
+        if not codec:
+            return content
+        algorithm = codec.split(":", 1)[0]
+        dictionary_id = self.dictionary_id(codec)
+        if algorithm == "zstd":
+            if not zstd_available():
+                raise RuntimeError("Message is zstd-compressed but zstandard is not installed")
+            return self._zstd_decompressor(dictionary_id).decompress(blob).decode("utf-8")
+        if dictionary_id:
+            decompressor = zlib.decompressobj(zdict=self._dictionaries[dictionary_id][1])
+            return (decompressor.decompress(blob) + decompressor.flush()).decode("utf-8")
+        return zlib.decompress(blob).decode("utf-8")
+
+    def stats(self) -> dict:
+        return {
+            "algorithm": self.algorithm or "off",
+            "zstd_available": zstd_available(),
+            "min_bytes": self.min_bytes,
+            "dictionaries": {domain: id for domain, id in sorted(self._domain_dictionary.items())},
+            "compressed_messages": self.compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+class DictionaryTrainer:
+    """Trains a dictionary for each domain once it has enough long messages.
+
+    Dictionaries are never replaced, since stored rows reference them by id. The storage
+    backend supplies the SQL as callables: `load` registers the stored dictionaries with
+    the codec, `sample` returns up to n of a domain's long messages as text, and `store`
+    saves a new dictionary and returns its id.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        codec: MessageCodec,
+        domains: Callable[[], Iterable[str]],
+        load: Callable[[], Awaitable[None]],
+        sample: Callable[[str, int], Awaitable[list[str]]],
+        store: Callable[[str, str, bytes, int], Awaitable[int]],
+        interval: float = DICTIONARY_TRAIN_INTERVAL_SECONDS,
+    ):
+        self.backend = backend
+        self.codec = codec
+        self._domains = domains
+        self._load = load
+        self._sample = sample
+        self._store = store
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.trained = 0
+        self.last_run: Optional[float] = None
+
+    def start(self):
+        if self.codec.use_dictionaries and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def run_once(self) -> int:
+        # Pick up dictionaries other instances trained since the last run
+        await self._load()
+        trained = 0
+        for domain_id in self._domains():
+            if domain_id in self.codec.domains_with_dictionaries():
+                continue
+            samples = await self._sample(domain_id, DICTIONARY_SAMPLES)
+            if len(samples) < DICTIONARY_MIN_SAMPLES:
+                continue
+            algorithm = self.codec.algorithm
+            data = await asyncio.to_thread(train_dictionary, algorithm, samples)
+            dictionary_id = await self._store(domain_id, algorithm, data, len(samples))
+            self.codec.add_dictionary(dictionary_id, domain_id, algorithm, data)
+            log.info(
+                "Trained compression dictionary", backend=self.backend, domain=domain_id,
+                dictionary_id=dictionary_id, samples=len(samples), size=len(data)
+            )
+            trained += 1
+        self.trained += trained
+        self.last_run = time.time()
+        return trained
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                log.exception("Compression dictionary training failed", backend=self.backend, error=e)
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.codec.enabled,
+            "backend": self.backend,
+            **self.codec.stats(),
+            "dictionaries_trained": self.trained,
+            "last_training_run": self.last_run,
+        }
@@ -0,0 +1,78 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from .models import Endpoint, Message, MessageRole
+
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))
+DEFAULT_MAX_MESSAGES = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "40"))
+
+# Rough heuristic for English chat text; good enough to keep payloads bounded
+# without pulling a tokenizer into the request path.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def token_budget_for(endpoint: Optional[Endpoint]) -> int:
+    """Per-endpoint budget when configured, otherwise CHAT_CONTEXT_TOKEN_BUDGET."""
+    if endpoint and endpoint.contextTokenBudget:
+        return endpoint.contextTokenBudget
+    return DEFAULT_TOKEN_BUDGET
+
+
+@dataclass
+class ContextWindow:
+    messages: list[dict]
+    history: list[dict]
+    included_messages: int
+    estimated_tokens: int
+    token_budget: int
+    truncated: bool
+
+
+def assemble_context(
+    system_prompt: str,
+    history: list[Message],
+    user_message: str,
+    token_budget: int,
+    total_messages: Optional[int] = None
+) -> ContextWindow:
+    """Build the invocation payload from the newest history that fits the token budget.
+
+    `history` is the most recent slice of the conversation in chronological order;
+    `total_messages` is the conversation's full length, used to report truncation
+    when the slice itself was already limited by the storage query.
+    """
+    used_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_message)
+    included: list[Message] = []
+    for message in reversed(history):
+        cost = estimate_tokens(message.content)
+        if used_tokens + cost > token_budget:
+            break
+        included.append(message)
+        used_tokens += cost
+    included.reverse()
+
+    # Chat templates expect the history after the system prompt to open with a user turn
+    while included and included[0].role != MessageRole.user:
+        used_tokens -= estimate_tokens(included.pop(0).content)
+
+    history_payload = [{"role": m.role.value, "content": m.content} for m in included]
+    total = total_messages if total_messages is not None else len(history)
+    return ContextWindow(
+        messages=[
+            {"role": "system", "content": system_prompt},
+            *history_payload,
+            {"role": "user", "content": user_message}
+        ],
+        history=history_payload,
+        included_messages=len(included),
+        estimated_tokens=used_tokens,
+        token_budget=token_budget,
+        truncated=len(included) < total
+    )
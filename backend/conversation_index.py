@@ -0,0 +1,67 @@
+from bisect import bisect_left, insort
+from typing import Iterator, Optional
+
+from .models import Conversation
+
+
+Key = tuple[int, str]
+
+
+class ConversationIndex:
+    """Per-user conversation ids kept sorted by (updatedAt, id).
+
+    Each user (and the all-users view) has an ascending list of keys; newest-first reads
+    walk it backwards. Finding a key is a binary search, and because updates move a
+    conversation to the newest position, re-inserting is almost always an append.
+    """
+
+    def __init__(self):
+        self._by_user: dict[Optional[str], list[Key]] = {}
+        self._all: list[Key] = []
+        self._entries: dict[str, tuple[Key, Optional[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._entries
+
+    def add(self, conversation: Conversation):
+        if conversation.id in self._entries:
+            self.remove(conversation.id)
+        key = (conversation.updatedAt, conversation.id)
+        self._entries[conversation.id] = (key, conversation.userEmail)
+        insort(self._all, key)
+        insort(self._by_user.setdefault(conversation.userEmail, []), key)
+
+    def remove(self, conversation_id: str):
+        entry = self._entries.pop(conversation_id, None)
+        if entry is None:
+            return
+        key, user_email = entry
+        self._discard(self._all, key)
+        keys = self._by_user.get(user_email)
+        if keys is not None:
+            self._discard(keys, key)
+            if not keys:
+                del self._by_user[user_email]
+
+    def touch(self, conversation: Conversation):
+        """Re-sort a conversation after its updatedAt (or owner) changed."""
+        self.add(conversation)
+
+    @staticmethod
+    def _discard(keys: list[Key], key: Key):
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    def newest_first(
+        self, user_email: Optional[str] = None, before: Optional[Key] = None, limit: Optional[int] = None
+    ) -> Iterator[str]:
+        """Conversation ids newest first, optionally only those strictly older than `before`."""
+        keys = self._by_user.get(user_email, []) if user_email else self._all
+        end = bisect_left(keys, before) if before else len(keys)
+        start = 0 if limit is None else max(end - limit, 0)
+        for i in range(end - 1, start - 1, -1):
+            yield keys[i][1]
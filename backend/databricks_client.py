@@ -1,7 +1,44 @@
 import os
+import json
+import hashlib
+import time
 import httpx
-from typing import Optional
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
 from .models import Endpoint, EndpointType
+from .token_manager import AccessToken, TokenManager
+from .resilience import EndpointError, endpoint_resilience
+from .admission import endpoint_admission
+from .metrics import databricks_request_duration
+from .log import get_logger
+from .tracing import tracer
+
+log = get_logger("databricks")
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _metric_target(path: str) -> str:
+    """Serving endpoint name for invocation calls, otherwise the API path."""
+    parts = path.strip("/").split("/")
+    if len(parts) == 3 and parts[0] == "serving-endpoints" and parts[2] == "invocations":
+        return parts[1]
+    return path
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """One serving endpoint from the workspace listing, already classified."""
+    name: str
+    type: EndpointType
+    ready: bool
 
 
 class DatabricksClient:
@@ -14,42 +51,137 @@ class DatabricksClient:
         self.client_id = os.getenv("DATABRICKS_CLIENT_ID")
         self.client_secret = os.getenv("DATABRICKS_CLIENT_SECRET")
         self.token = os.getenv("DATABRICKS_TOKEN")
-        self._sp_access_token: Optional[str] = None
+        self.sp_tokens = TokenManager("databricks-service-principal", self._fetch_service_principal_token)
+        self._classifications: dict[str, tuple[str, EndpointType]] = {}
+        
+        # Shared connection pool for all workspace traffic
+        self.max_connections = int(os.getenv("DATABRICKS_HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(os.getenv("DATABRICKS_HTTP_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.getenv("DATABRICKS_HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.connect_timeout = float(os.getenv("DATABRICKS_HTTP_CONNECT_TIMEOUT", "10"))
+        self.api_timeout = float(os.getenv("DATABRICKS_API_TIMEOUT", "15"))
+        self.token_timeout = float(os.getenv("DATABRICKS_TOKEN_TIMEOUT", "15"))
+        self.invoke_timeout = float(os.getenv("DATABRICKS_INVOKE_TIMEOUT", "60"))
+        self._http: Optional[httpx.AsyncClient] = None
+        
+    async def start(self):
+        """Create the pooled HTTP client and start service-principal token refresh. Called from the FastAPI lifespan."""
+        if self._http is None:
+            self._http = self._create_http_client()
+        if self.host and not self.token and self.client_id and self.client_secret:
+            await self.sp_tokens.start()
+    
+    async def close(self):
+        await self.sp_tokens.close()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+    
+    def _create_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=self._timeout(self.api_timeout),
+        )
+    
+    @property
+    def http(self) -> httpx.AsyncClient:
+        # Created lazily so the client also works outside the app lifespan (scripts, REPL)
+        if self._http is None:
+            self._http = self._create_http_client()
+        return self._http
+    
+    def _timeout(self, seconds: float) -> httpx.Timeout:
+        return httpx.Timeout(seconds, connect=min(seconds, self.connect_timeout))
+    
+    def pool_stats(self) -> dict:
+        """Connection pool utilisation: connections in use, idle, and requests waiting for one."""
+        stats = {
+            "started": self._http is not None,
+            "http2": _http2_available(),
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "in_use": 0,
+            "idle": 0,
+            "waiters": 0,
+        }
+        # httpx does not expose pool state publicly; read it from the httpcore pool when present
+        pool = getattr(getattr(self._http, "_transport", None), "_pool", None)
+        if pool is not None:
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for conn in connections if conn.is_idle())
+            stats["in_use"] = len(connections) - idle
+            stats["idle"] = idle
+            stats["waiters"] = sum(1 for req in getattr(pool, "_requests", []) if req.is_queued())
+        return stats
         
     def is_configured(self) -> bool:
         if not self.host:
             return False
         return bool(self.token) or (bool(self.client_id) and bool(self.client_secret))
     
-    async def _get_service_principal_token(self) -> str:
-        if self.token:
-            return self.token
-            
-        if self._sp_access_token:
-            return self._sp_access_token
-            
+    async def _fetch_service_principal_token(self) -> AccessToken:
         if not self.client_id or not self.client_secret:
             raise ValueError("Databricks credentials not configured")
             
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.host}/oidc/v1/token",
-                data={
-                    "grant_type": "client_credentials",
-                    "scope": "all-apis"
-                },
-                auth=(self.client_id, self.client_secret)
-            )
-            response.raise_for_status()
-            data = response.json()
-            self._sp_access_token = data["access_token"]
-            return self._sp_access_token
+        response = await self.http.post(
+            f"{self.host}/oidc/v1/token",
+            data={
+                "grant_type": "client_credentials",
+                "scope": "all-apis"
+            },
+            auth=(self.client_id, self.client_secret),
+            timeout=self._timeout(self.token_timeout)
+        )
+        response.raise_for_status()
+        return AccessToken.from_oauth_response(response.json())
+    
+    async def _get_service_principal_token(self) -> str:
+        if self.token:
+            return self.token
+        return await self.sp_tokens.get_token()
     
     async def _get_token(self, user_token: Optional[str] = None) -> str:
         if user_token:
             return user_token
         return await self._get_service_principal_token()
     
+    async def _send(
+        self, method: str, url: str, user_token: Optional[str] = None,
+        headers: Optional[dict] = None, stream: bool = False, **kwargs
+    ) -> httpx.Response:
+        """Send an authenticated request, retrying once with a fresh service-principal token on 401.
+
+        With `stream=True` the caller must close the returned response.
+        """
+        token = await self._get_token(user_token)
+        can_refresh = not user_token and not self.token
+        while True:
+            request = self.http.build_request(
+                method, url, headers={**(headers or {}), "Authorization": f"Bearer {token}"}, **kwargs
+            )
+            started = time.perf_counter()
+            status = "error"
+            try:
+                with tracer.span("databricks.http", **{"http.method": method, "url.path": request.url.path}) as span:
+                    response = await self.http.send(request, stream=stream)
+                    span.set_attribute("http.status_code", response.status_code)
+                status = str(response.status_code)
+            finally:
+                databricks_request_duration.observe(
+                    time.perf_counter() - started, endpoint=_metric_target(request.url.path), status=status
+                )
+            if response.status_code != 401 or not can_refresh:
+                return response
+            await response.aclose()
+            log.info("Service principal token rejected, forcing refresh")
+            token = await self.sp_tokens.force_refresh(stale=token)
+            can_refresh = False
+    
     def _detect_endpoint_type(self, endpoint_data: dict) -> EndpointType:
         name = endpoint_data.get("name", "").lower()
         config = endpoint_data.get("config", {})
@@ -86,200 +218,256 @@ class DatabricksClient:
             
         return EndpointType.custom
     
-    async def list_serving_endpoints(self, user_token: Optional[str] = None) -> list[Endpoint]:
+    async def get_endpoint_catalog(self, user_token: Optional[str] = None) -> list[CatalogEntry]:
+        """Fetch and classify every serving endpoint visible to the caller in one request."""
         if not self.is_configured() and not user_token:
-            print("Databricks not configured and no user token, returning empty list")
+            log.debug("Databricks not configured and no user token, returning empty list")
             return []
             
         try:
-            token = await self._get_token(user_token)
+            response = await self._send("GET", f"{self.host}/api/2.0/serving-endpoints", user_token)
+            response.raise_for_status()
+            data = response.json()
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.host}/api/2.0/serving-endpoints",
-                    headers={"Authorization": f"Bearer {token}"}
+            return [
+                CatalogEntry(
+                    name=ep.get("name", ""),
+                    type=self._classify(ep),
+                    ready=ep.get("state", {}).get("ready") == "READY"
                 )
-                response.raise_for_status()
-                data = response.json()
-                
-            endpoints = []
-            for i, ep in enumerate(data.get("endpoints", [])):
-                endpoint_name = ep.get("name", "")
-                endpoint_type = self._detect_endpoint_type(ep)
-                
-                state = ep.get("state", {})
-                ready = state.get("ready") == "READY"
-                
-                description = f"Databricks serving endpoint"
-                if endpoint_type == EndpointType.agent:
-                    description = f"AI Agent: {endpoint_name}"
-                elif endpoint_type == EndpointType.foundation:
-                    description = f"Foundation model: {endpoint_name}"
-                elif endpoint_type == EndpointType.custom:
-                    description = f"Custom model: {endpoint_name}"
-                    
-                if not ready:
-                    description += " (not ready)"
-                
-                endpoints.append(Endpoint(
-                    id=endpoint_name,
-                    name=endpoint_name,
-                    description=description,
-                    type=endpoint_type,
-                    isDefault=(i == 0)
-                ))
-                
-            return endpoints
+                for ep in data.get("endpoints", [])
+            ]
             
         except Exception as e:
-            print(f"Error fetching Databricks endpoints: {e}")
+            log.warning("Error fetching Databricks endpoints", error=e)
             return []
     
+    def _classify(self, endpoint_data: dict) -> EndpointType:
+        """`_detect_endpoint_type`, memoized per endpoint name and classification-relevant config."""
+        name = endpoint_data.get("name", "")
+        config_hash = hashlib.sha1(json.dumps([
+            endpoint_data.get("task"),
+            endpoint_data.get("route_optimized"),
+            endpoint_data.get("config", {}).get("served_entities", [])
+        ], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        cached = self._classifications.get(name)
+        if cached and cached[0] == config_hash:
+            return cached[1]
+        
+        endpoint_type = self._detect_endpoint_type(endpoint_data)
+        if len(self._classifications) >= 10000:
+            self._classifications.clear()
+        self._classifications[name] = (config_hash, endpoint_type)
+        return endpoint_type
+    
+    @staticmethod
+    def endpoints_view(catalog: list[CatalogEntry]) -> list[Endpoint]:
+        endpoints = []
+        for i, entry in enumerate(catalog):
+            description = f"Databricks serving endpoint"
+            if entry.type == EndpointType.agent:
+                description = f"AI Agent: {entry.name}"
+            elif entry.type == EndpointType.foundation:
+                description = f"Foundation model: {entry.name}"
+            elif entry.type == EndpointType.custom:
+                description = f"Custom model: {entry.name}"
+                
+            if not entry.ready:
+                description += " (not ready)"
+            
+            endpoints.append(Endpoint(
+                id=entry.name,
+                name=entry.name,
+                description=description,
+                type=entry.type,
+                isDefault=(i == 0)
+            ))
+        return endpoints
+    
+    @staticmethod
+    def agents_view(catalog: list[CatalogEntry]) -> list[Endpoint]:
+        return [
+            Endpoint(
+                id=entry.name,
+                name=entry.name,
+                description=f"AI Agent: {entry.name}" + ("" if entry.ready else " (not ready)"),
+                type=EndpointType.agent,
+                isDefault=False
+            )
+            for entry in catalog
+            if entry.type == EndpointType.agent
+        ]
+    
+    @staticmethod
+    def foundation_models_view(catalog: list[CatalogEntry]) -> list[Endpoint]:
+        return [
+            Endpoint(
+                id=entry.name,
+                name=entry.name,
+                description=f"Foundation Model API: {entry.name}",
+                type=EndpointType.foundation,
+                isDefault=False
+            )
+            for entry in catalog
+            if entry.type == EndpointType.foundation
+        ]
+    
+    async def list_serving_endpoints(self, user_token: Optional[str] = None) -> list[Endpoint]:
+        return self.endpoints_view(await self.get_endpoint_catalog(user_token))
+    
     async def call_serving_endpoint(
         self, 
         endpoint_name: str, 
         messages: list[dict],
-        user_token: Optional[str] = None
+        user_token: Optional[str] = None,
+        user_key: str = "anonymous"
     ) -> str:
         if not self.host:
             raise ValueError("Databricks host not configured")
             
+        async def send() -> dict:
+            response = await self._send(
+                "POST",
+                f"{self.host}/serving-endpoints/{endpoint_name}/invocations",
+                user_token,
+                headers={"Content-Type": "application/json"},
+                json={"messages": messages},
+                timeout=self._timeout(self.invoke_timeout)
+            )
+            if response.status_code != 200:
+                raise EndpointError.from_response(response, response.text)
+            return response.json()
+
         try:
-            token = await self._get_token(user_token)
+            with tracer.span("databricks.call", **{"databricks.endpoint": endpoint_name}):
+                async with endpoint_admission.admit(endpoint_name, user_key):
+                    data = await endpoint_resilience.call(endpoint_name, send, hedge=True)
+            log.debug("Databricks raw response", sample=True, endpoint=endpoint_name, response=data)
+            content = self._extract_content(data)
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.host}/serving-endpoints/{endpoint_name}/invocations",
-                    headers={
-                        "Authorization": f"Bearer {token}",
-                        "Content-Type": "application/json"
-                    },
-                    json={"messages": messages}
-                )
-                
-                if response.status_code != 200:
-                    raise Exception(f"Databricks API error: {response.status_code} - {response.text}")
-                
-                data = response.json()
-                print(f"[DEBUG] Databricks raw response: {data}")
-                
-                # Handle various response formats
-                content = None
-                
-                # OpenAI chat completion format
-                if "choices" in data and len(data["choices"]) > 0:
-                    message = data["choices"][0].get("message", {})
-                    content = message.get("content")
-                    
-                    # Handle agent responses where content is a list of objects
-                    if isinstance(content, list):
-                        # Extract text from structured content (agent format)
-                        text_parts = []
-                        for item in content:
-                            if isinstance(item, dict):
-                                if item.get("type") == "text":
-                                    text_parts.append(item.get("text", ""))
-                                elif "text" in item:
-                                    text_parts.append(item["text"])
-                                elif "content" in item:
-                                    text_parts.append(str(item["content"]))
-                            elif isinstance(item, str):
-                                text_parts.append(item)
-                        content = "\n".join(text_parts) if text_parts else str(content)
-                    elif content is None:
-                        content = message.get("text", "")
-                
-                # Predictions format (custom models)
-                if not content and "predictions" in data:
-                    pred = data["predictions"][0] if data["predictions"] else None
-                    if isinstance(pred, str):
-                        content = pred
-                    elif isinstance(pred, dict):
-                        content = pred.get("text", pred.get("content", str(pred)))
-                
-                return content or "I received your message but couldn't generate a response."
+            return content or "I received your message but couldn't generate a response."
                 
         except Exception as e:
-            print(f"Error calling serving endpoint {endpoint_name}: {e}")
+            log.warning("Error calling serving endpoint", endpoint=endpoint_name, error=e)
             raise
 
-    async def list_agents(self, user_token: Optional[str] = None) -> list[Endpoint]:
-        """List only agent endpoints from the workspace based on user access."""
-        if not self.is_configured() and not user_token:
-            return []
-            
-        try:
-            token = await self._get_token(user_token)
+    async def stream_serving_endpoint(
+        self,
+        endpoint_name: str,
+        messages: list[dict],
+        user_token: Optional[str] = None,
+        user_key: str = "anonymous"
+    ) -> AsyncIterator[str]:
+        """Invoke an endpoint with stream=true and yield text deltas as they arrive.
+
+        Endpoints that ignore the stream flag and answer with a single JSON body
+        yield their whole completion as one delta. The admission slot is held until
+        the stream ends.
+        """
+        if not self.host:
+            raise ValueError("Databricks host not configured")
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.host}/api/2.0/serving-endpoints",
-                    headers={"Authorization": f"Bearer {token}"}
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-            agents = []
-            for ep in data.get("endpoints", []):
-                endpoint_type = self._detect_endpoint_type(ep)
-                if endpoint_type == EndpointType.agent:
-                    endpoint_name = ep.get("name", "")
-                    state = ep.get("state", {})
-                    ready = state.get("ready") == "READY"
-                    
-                    description = f"AI Agent: {endpoint_name}"
-                    if not ready:
-                        description += " (not ready)"
-                    
-                    agents.append(Endpoint(
-                        id=endpoint_name,
-                        name=endpoint_name,
-                        description=description,
-                        type=EndpointType.agent,
-                        isDefault=False
-                    ))
-                    
-            return agents
+        async def open_stream() -> httpx.Response:
+            response = await self._send(
+                "POST",
+                f"{self.host}/serving-endpoints/{endpoint_name}/invocations",
+                user_token,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "text/event-stream"
+                },
+                json={"messages": messages, "stream": True},
+                timeout=self._timeout(self.invoke_timeout),
+                stream=True
+            )
+            if response.status_code != 200:
+                body = await response.aread()
+                await response.aclose()
+                raise EndpointError.from_response(response, body.decode(errors="replace"))
+            return response
+
+        async with endpoint_admission.admit(endpoint_name, user_key):
+            # Retries only cover opening the stream; once deltas flow, a failure ends the response
+            response = await endpoint_resilience.call(endpoint_name, open_stream)
+            try:
+                if "text/event-stream" not in response.headers.get("content-type", ""):
+                    data = json.loads(await response.aread())
+                    yield self._extract_content(data) or "I received your message but couldn't generate a response."
+                    return
             
-        except Exception as e:
-            print(f"Error fetching agents: {e}")
-            return []
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    if not payload:
+                        continue
+                    delta = self._extract_delta(json.loads(payload))
+                    if delta:
+                        yield delta
+            finally:
+                await response.aclose()
+
+    @staticmethod
+    def _content_to_text(content) -> Optional[str]:
+        """Flatten agent-style structured content (a list of parts) into plain text."""
+        if not isinstance(content, list):
+            return content
+        text_parts = []
+        for item in content:
+            if isinstance(item, dict):
+                if item.get("type") == "text":
+                    text_parts.append(item.get("text", ""))
+                elif "text" in item:
+                    text_parts.append(item["text"])
+                elif "content" in item:
+                    text_parts.append(str(item["content"]))
+            elif isinstance(item, str):
+                text_parts.append(item)
+        return "\n".join(text_parts) if text_parts else str(content)
+
+    def _extract_content(self, data: dict) -> Optional[str]:
+        """Extract the completion text from the various invocation response formats."""
+        content = None
+        
+        # OpenAI chat completion format
+        if "choices" in data and len(data["choices"]) > 0:
+            message = data["choices"][0].get("message", {})
+            content = message.get("content")
+            if content is None:
+                content = message.get("text", "")
+            else:
+                content = self._content_to_text(content)
+        
+        # Predictions format (custom models)
+        if not content and "predictions" in data:
+            pred = data["predictions"][0] if data["predictions"] else None
+            if isinstance(pred, str):
+                content = pred
+            elif isinstance(pred, dict):
+                content = pred.get("text", pred.get("content", str(pred)))
+        
+        return content
+
+    def _extract_delta(self, chunk: dict) -> Optional[str]:
+        """Extract the text delta from one streamed chat completion chunk."""
+        choices = chunk.get("choices") or []
+        if not choices:
+            return None
+        choice = choices[0]
+        delta = choice.get("delta") or choice.get("message") or {}
+        content = delta.get("content")
+        if content is None:
+            content = delta.get("text") or choice.get("text")
+        return self._content_to_text(content) if content else None
+
+    async def list_agents(self, user_token: Optional[str] = None) -> list[Endpoint]:
+        """List only agent endpoints from the workspace based on user access."""
+        return self.agents_view(await self.get_endpoint_catalog(user_token))
 
     async def list_foundation_model_apis(self, user_token: Optional[str] = None) -> list[Endpoint]:
-        if not self.is_configured() and not user_token:
-            return []
-            
-        try:
-            token = await self._get_token(user_token)
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.host}/api/2.0/serving-endpoints",
-                    headers={"Authorization": f"Bearer {token}"},
-                    params={"filter": "foundation_model_apis"}
-                )
-                
-                if response.status_code != 200:
-                    return []
-                    
-                data = response.json()
-                
-            endpoints = []
-            for ep in data.get("endpoints", []):
-                endpoint_name = ep.get("name", "")
-                endpoints.append(Endpoint(
-                    id=endpoint_name,
-                    name=endpoint_name,
-                    description=f"Foundation Model API: {endpoint_name}",
-                    type=EndpointType.foundation,
-                    isDefault=False
-                ))
-                
-            return endpoints
-            
-        except Exception as e:
-            print(f"Error fetching foundation model APIs: {e}")
-            return []
+        return self.foundation_models_view(await self.get_endpoint_catalog(user_token))
 
 
 databricks_client = DatabricksClient()
@@ -1,8 +1,8 @@
 import os
 import asyncio
-import logging
 import uuid
 import time
+from datetime import datetime
 from typing import Optional
 from contextlib import asynccontextmanager
 
@@ -12,12 +12,34 @@ from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engin
 from sqlalchemy.orm import sessionmaker
 
 from .models import (
-    Message, InsertMessage, Conversation, Domain, InsertDomain,
-    Site, Endpoint, InsertEndpoint, Config, MessageRole, EndpointType
+    Message, InsertMessage, Conversation, ConversationSummary, ConversationPage, SearchPage,
+    Domain, InsertDomain, Site, Endpoint, InsertEndpoint, Config, MessageRole, EndpointType
 )
-from .storage import IStorage
-
-logger = logging.getLogger(__name__)
+from .storage import IStorage, decode_cursor, build_conversation_page
+from .token_manager import AccessToken, TokenManager
+from .log import get_logger
+from .archive import (
+    MessageArchiver, create_partition_sql, pack_messages, parse_partition_name,
+    partition_bounds, unpack_messages, upcoming_months
+)
+from .compression import DictionaryTrainer, MessageCodec
+from .metrics import conversation_archive, db_statements
+from .migrations import MESSAGE_SEARCH_MIGRATION, migrate_sqlalchemy
+from .search import build_search_page, build_search_result, decode_search_cursor, query_terms
+
+log = get_logger("storage.lakebase_sdk")
+
+# Inserts the arrays of _message_params() into the conversation :conv_id
+INSERT_MESSAGES = """
+    INSERT INTO messages (id, conversation_id, role, content, timestamp, codec, content_blob, search_vector)
+    SELECT m.id, :conv_id, m.role, m.content, m.timestamp, m.codec, m.content_blob,
+           to_tsvector('english', COALESCE(m.search_text, m.content))
+    FROM unnest(
+        CAST(:ids AS TEXT[]), CAST(:roles AS TEXT[]), CAST(:contents AS TEXT[]),
+        CAST(:timestamps AS BIGINT[]), CAST(:codecs AS TEXT[]), CAST(:blobs AS BYTEA[]),
+        CAST(:search_texts AS TEXT[])
+    ) AS m(id, role, content, timestamp, codec, content_blob, search_text)
+"""
 
 
 def is_lakebase_configured() -> bool:
@@ -32,14 +54,23 @@ def is_lakebase_configured() -> bool:
 
 class LakebaseSDKStorage(IStorage):
     """LakeBase storage using Databricks SDK for OAuth token management."""
+
+    POOL_SIZE = 5
+    MAX_OVERFLOW = 10
     
     def __init__(self):
         self.engine: Optional[AsyncEngine] = None
         self.session_maker: Optional[sessionmaker] = None
         self.workspace_client = None
-        self.postgres_token: Optional[str] = None
-        self.token_refresh_task: Optional[asyncio.Task] = None
-        self.last_token_refresh: float = 0
+        self.tokens = TokenManager("lakebase-database", self._fetch_database_token)
+        self.archiver = MessageArchiver(
+            "LakebaseSDKStorage", self._archive_cold_conversations, self._maintain_message_partitions
+        )
+        self.codec = MessageCodec()
+        self.dictionaries = DictionaryTrainer(
+            "LakebaseSDKStorage", self.codec, lambda: list(self.memory_cache["domains"]),
+            self._load_dictionaries, self._dictionary_samples, self._store_dictionary
+        )
         
         self.memory_cache = {
             "domains": {},
@@ -51,16 +82,14 @@ class LakebaseSDKStorage(IStorage):
     async def initialize(self):
         """Initialize database connection with OAuth token management."""
         try:
-            print("[LAKEBASE] Starting initialization...")
+            log.info("Starting initialization")
             from databricks.sdk import WorkspaceClient
             
-            print("[LAKEBASE] Creating WorkspaceClient...")
             self.workspace_client = WorkspaceClient()
-            print("[LAKEBASE] WorkspaceClient created successfully")
+            log.debug("WorkspaceClient created")
             
-            print("[LAKEBASE] Generating OAuth token...")
-            await self._generate_token()
-            print(f"[LAKEBASE] Token generated: {'yes' if self.postgres_token else 'no'}")
+            await self.tokens.start()
+            log.info("Database token generated", has_token=bool(self.tokens.current))
             
             pghost = os.environ.get("PGHOST")
             pgdatabase = os.environ.get("PGDATABASE")
@@ -80,8 +109,8 @@ class LakebaseSDKStorage(IStorage):
                 url,
                 pool_pre_ping=False,
                 echo=False,
-                pool_size=5,
-                max_overflow=10,
+                pool_size=self.POOL_SIZE,
+                max_overflow=self.MAX_OVERFLOW,
                 pool_timeout=30,
                 pool_recycle=3600,
                 connect_args={
@@ -93,7 +122,11 @@ class LakebaseSDKStorage(IStorage):
             
             @event.listens_for(self.engine.sync_engine, "do_connect")
             def provide_token(dialect, conn_rec, cargs, cparams):
-                cparams["password"] = self.postgres_token
+                cparams["password"] = self.tokens.current
+
+            @event.listens_for(self.engine.sync_engine, "before_cursor_execute")
+            def count_statement(conn, cursor, statement, parameters, context, executemany):
+                db_statements.inc(backend="LakebaseSDKStorage")
             
             self.session_maker = sessionmaker(
                 bind=self.engine, class_=AsyncSession, expire_on_commit=False
@@ -101,99 +134,74 @@ class LakebaseSDKStorage(IStorage):
             
             await self._create_tables()
             await self._initialize_defaults()
+            self.archiver.start()
+            self.dictionaries.start()
             
-            self.token_refresh_task = asyncio.create_task(self._token_refresh_loop())
-            
-            logger.info("LakeBase SDK storage initialized successfully")
+            log.info("LakeBase SDK storage initialized")
             
         except Exception as e:
-            logger.error(f"Failed to initialize LakeBase SDK storage: {e}")
+            log.error("Failed to initialize LakeBase SDK storage", error=e)
             raise
 
-    async def _generate_token(self):
-        """Generate a new OAuth token for database access."""
-        try:
-            # For LakeBase, we need to get an OAuth access token
-            # Try multiple methods to get a valid token
-            
-            # Method 1: Try database credential generation (newer SDK)
-            instance_name = os.environ.get("LAKEBASE_INSTANCE_NAME")
-            if not instance_name:
-                pghost = os.environ.get("PGHOST", "")
-                if pghost and ".database." in pghost:
-                    instance_name = pghost.split(".database.")[0]
-                    print(f"[LAKEBASE] Extracted instance name from PGHOST: {instance_name}")
-            
-            if instance_name and hasattr(self.workspace_client, 'database'):
-                try:
-                    print(f"[LAKEBASE] Generating credential for instance: {instance_name}")
-                    cred = self.workspace_client.database.generate_database_credential(
-                        request_id=str(uuid.uuid4()),
-                        instance_names=[instance_name],
-                    )
-                    self.postgres_token = cred.token
-                    print(f"[LAKEBASE] Credential generated, token length: {len(self.postgres_token) if self.postgres_token else 0}")
-                    return
-                except Exception as e:
-                    print(f"[LAKEBASE] database.generate_database_credential failed: {e}")
-            
-            # Method 2: Get OAuth token via service principal
-            client_id = os.environ.get("DATABRICKS_CLIENT_ID")
-            client_secret = os.environ.get("DATABRICKS_CLIENT_SECRET")
-            host = os.environ.get("DATABRICKS_HOST", "")
-            if not host.startswith("http"):
-                host = f"https://{host}"
-            
-            if client_id and client_secret and host:
-                print("[LAKEBASE] Generating OAuth token via service principal...")
-                import httpx
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{host}/oidc/v1/token",
-                        data={
-                            "grant_type": "client_credentials",
-                            "scope": "all-apis"
-                        },
-                        auth=(client_id, client_secret)
-                    )
-                    if response.status_code == 200:
-                        data = response.json()
-                        self.postgres_token = data.get("access_token", "")
-                        print(f"[LAKEBASE] OAuth token generated, length: {len(self.postgres_token)}")
-                        return
-                    else:
-                        print(f"[LAKEBASE] OAuth token request failed: {response.status_code} - {response.text}")
-            
-            # Method 3: Use workspace client token
-            print("[LAKEBASE] Trying workspace client token...")
-            token = self.workspace_client.config.token
-            if callable(token):
-                self.postgres_token = token()
-            else:
-                self.postgres_token = token or os.environ.get("DATABRICKS_TOKEN", "")
-            print(f"[LAKEBASE] Workspace token length: {len(self.postgres_token) if self.postgres_token else 0}")
-            
-            self.last_token_refresh = time.time()
-            logger.info("Database OAuth token generated successfully")
-            
-        except Exception as e:
-            logger.error(f"Failed to generate database token: {e}")
-            self.postgres_token = os.environ.get("DATABRICKS_TOKEN", "")
-
-    async def _token_refresh_loop(self):
-        """Background task to refresh tokens every 50 minutes."""
-        while True:
+    async def _fetch_database_token(self) -> AccessToken:
+        """Get an OAuth token for database access, trying each credential source in turn."""
+        # Method 1: Try database credential generation (newer SDK)
+        instance_name = os.environ.get("LAKEBASE_INSTANCE_NAME")
+        if not instance_name:
+            pghost = os.environ.get("PGHOST", "")
+            if pghost and ".database." in pghost:
+                instance_name = pghost.split(".database.")[0]
+                log.debug("Extracted instance name from PGHOST", instance=instance_name)
+        
+        if instance_name and hasattr(self.workspace_client, 'database'):
+            try:
+                log.debug("Generating database credential", instance=instance_name)
+                # The SDK call is blocking; keep it off the event loop
+                cred = await asyncio.to_thread(
+                    self.workspace_client.database.generate_database_credential,
+                    request_id=str(uuid.uuid4()),
+                    instance_names=[instance_name],
+                )
+                log.debug("Database credential generated", token_length=len(cred.token) if cred.token else 0)
+                return AccessToken(value=cred.token, expires_in=self._seconds_until(getattr(cred, "expiration_time", None)))
+            except Exception as e:
+                log.warning("database.generate_database_credential failed", error=e)
+        
+        # Method 2: Reuse the service principal OAuth token managed by the Databricks client
+        from .databricks_client import databricks_client
+        if databricks_client.client_id and databricks_client.client_secret and databricks_client.host:
             try:
-                await asyncio.sleep(50 * 60)
-                logger.info("Refreshing database OAuth token...")
-                await self._generate_token()
-            except asyncio.CancelledError:
-                break
+                log.debug("Using service principal OAuth token")
+                token = await databricks_client.sp_tokens.get_token()
+                return AccessToken(value=token, expires_in=databricks_client.sp_tokens.expires_in)
             except Exception as e:
-                logger.error(f"Token refresh failed: {e}")
+                log.warning("OAuth token request failed", error=e)
+        
+        # Method 3: Use workspace client token
+        log.debug("Trying workspace client token")
+        token = self.workspace_client.config.token
+        if callable(token):
+            token = await asyncio.to_thread(token)
+        token = token or os.environ.get("DATABRICKS_TOKEN", "")
+        if not token:
+            raise ValueError("No database token available")
+        log.debug("Using workspace client token", token_length=len(token))
+        return AccessToken(value=token)
+
+    @staticmethod
+    def _seconds_until(expiration) -> Optional[float]:
+        """Seconds until a credential's expiration_time (datetime or ISO string), if known."""
+        if not expiration:
+            return None
+        try:
+            if isinstance(expiration, str):
+                expiration = datetime.fromisoformat(expiration.replace("Z", "+00:00"))
+            return expiration.timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
 
     async def _create_tables(self):
-        """Create database tables if they don't exist, or verify they exist."""
+        """Create the base tables if they don't exist, then apply pending schema migrations."""
         # First, check if tables exist in a separate connection
         tables_exist = False
         try:
@@ -201,26 +209,49 @@ class LakebaseSDKStorage(IStorage):
                 try:
                     await conn.execute(text("SELECT 1 FROM conversations LIMIT 1"))
                     await conn.execute(text("SELECT 1 FROM messages LIMIT 1"))
-                    print("[LAKEBASE] Tables already exist, skipping creation")
-                    logger.info("Database tables already exist")
+                    log.info("Database tables already exist, skipping creation")
                     tables_exist = True
                 except Exception as check_error:
                     error_str = str(check_error).lower()
                     if "does not exist" in error_str or "relation" in error_str:
-                        print("[LAKEBASE] Tables do not exist, will attempt creation")
+                        log.info("Tables do not exist, will attempt creation")
                     else:
-                        print(f"[LAKEBASE] Could not check tables: {check_error}")
+                        log.warning("Could not check tables", error=check_error)
                     await conn.rollback()
         except Exception as e:
-            print(f"[LAKEBASE] Error checking tables: {e}")
-        
-        if tables_exist:
-            return
+            log.warning("Error checking tables", error=e)
         
+        if not tables_exist:
+            await self._create_base_tables()
+        # Indexes and later columns are versioned in migrations.py
+        if MESSAGE_SEARCH_MIGRATION in await migrate_sqlalchemy(self.engine):
+            await self._vectorize_compressed_messages()
+
+    async def _vectorize_compressed_messages(self):
+        """Compute the search vector of messages compressed before search was added."""
+        async with self.session_maker() as session:
+            while True:
+                result = await session.execute(text(
+                    """SELECT id, role, content, timestamp, codec, content_blob FROM messages
+                       WHERE search_vector IS NULL AND codec IS NOT NULL
+                       LIMIT 500"""
+                ))
+                messages = await self._messages_from_rows(session, result.fetchall())
+                if not messages:
+                    return
+                await session.execute(
+                    text("""UPDATE messages m SET search_vector = to_tsvector('english', v.content)
+                            FROM unnest(CAST(:ids AS TEXT[]), CAST(:contents AS TEXT[])) AS v(id, content)
+                            WHERE m.id = v.id"""),
+                    {"ids": [m.id for m in messages], "contents": [m.content for m in messages]}
+                )
+                await session.commit()
+
+    async def _create_base_tables(self):
         # Try to create tables in a fresh transaction
         try:
             async with self.engine.begin() as conn:
-                print("[LAKEBASE] Creating database tables...")
+                log.info("Creating database tables")
                 await conn.execute(text("""
                     CREATE TABLE IF NOT EXISTS conversations (
                         id TEXT PRIMARY KEY,
@@ -244,23 +275,12 @@ class LakebaseSDKStorage(IStorage):
                     )
                 """))
                 
-                await conn.execute(text("""
-                    CREATE INDEX IF NOT EXISTS idx_conversations_user_email 
-                    ON conversations(user_email)
-                """))
-                
-                await conn.execute(text("""
-                    CREATE INDEX IF NOT EXISTS idx_messages_conversation_id 
-                    ON messages(conversation_id)
-                """))
-                
-            logger.info("Database tables created/verified")
+            log.info("Database tables created/verified")
             
         except Exception as e:
             error_msg = str(e).lower()
             if "permission denied" in error_msg or "insufficient privilege" in error_msg:
-                print("[LAKEBASE] No CREATE permission - please create tables manually in Databricks SQL Editor:")
-                print("""
+                log.error("""No CREATE permission - please create tables manually in Databricks SQL Editor:
 -- Run this SQL in Databricks SQL Editor:
 CREATE TABLE IF NOT EXISTS conversations (
     id TEXT PRIMARY KEY,
@@ -280,9 +300,8 @@ CREATE TABLE IF NOT EXISTS messages (
     content TEXT NOT NULL,
     timestamp BIGINT NOT NULL
 );
-
-CREATE INDEX IF NOT EXISTS idx_conversations_user_email ON conversations(user_email);
-CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id);
+-- Then grant the app CREATE on the schema (or run the statements in backend/migrations.py)
+-- so it can apply its indexes and schema migrations.
                 """)
                 # Re-raise to trigger fallback to in-memory storage
                 raise
@@ -324,18 +343,39 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
         # by refresh_endpoints_from_databricks() after initialization
         pass
 
+    def pool_stats(self) -> dict[str, int]:
+        if not self.engine:
+            return {}
+        pool = self.engine.pool
+        return {
+            "max": self.POOL_SIZE + self.MAX_OVERFLOW,
+            "open": pool.checkedin() + pool.checkedout(),
+            "idle": pool.checkedin(),
+            "in_use": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+        }
+
+    async def connect_listener(self) -> asyncpg.Connection:
+        """A dedicated connection outside the engine's pool, for the conversation cache's LISTEN/NOTIFY."""
+        url = self.engine.url
+        return await asyncpg.connect(
+            host=url.host, port=url.port, user=url.username, database=url.database,
+            password=self.tokens.current, ssl="require",
+            server_settings={"application_name": "anglo_strata"},
+        )
+
     async def shutdown(self):
         """Clean up resources."""
-        if self.token_refresh_task:
-            self.token_refresh_task.cancel()
-            try:
-                await self.token_refresh_task
-            except asyncio.CancelledError:
-                pass
+        await self.archiver.close()
+        await self.dictionaries.close()
+        await self.tokens.close()
         
         if self.engine:
             await self.engine.dispose()
 
+    async def close(self):
+        await self.shutdown()
+
     async def refresh_endpoints_from_databricks(self) -> list[Endpoint]:
         from .databricks_client import databricks_client
         
@@ -348,9 +388,9 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
                 self.memory_cache["endpoints"].clear()
                 for endpoint in db_endpoints:
                     self.memory_cache["endpoints"][endpoint.id] = endpoint
-                logger.info(f"Loaded {len(db_endpoints)} endpoints from Databricks")
+                log.info("Loaded endpoints from Databricks", count=len(db_endpoints))
         except Exception as e:
-            logger.error(f"Error refreshing endpoints: {e}")
+            log.warning("Error refreshing endpoints from Databricks", error=e)
             
         return list(self.memory_cache["endpoints"].values())
 
@@ -367,14 +407,19 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
                 )
             
             rows = result.fetchall()
+            messages_by_conversation = await self._get_messages_for(session, [row.id for row in rows])
+            # Listing everything reads archived messages in place rather than rehydrating them
+            archived = await self._get_archived_messages_for(session, [row.id for row in rows if row.archived_at])
+            for conversation_id, messages in archived.items():
+                merged = messages + messages_by_conversation.get(conversation_id, [])
+                messages_by_conversation[conversation_id] = sorted(merged, key=lambda m: m.timestamp)
             conversations = []
             
             for row in rows:
-                messages = await self._get_messages(session, row.id)
                 conversations.append(Conversation(
                     id=row.id,
                     title=row.title,
-                    messages=messages,
+                    messages=messages_by_conversation.get(row.id, []),
                     endpointId=row.endpoint_id,
                     domainId=row.domain_id,
                     siteId=row.site_id,
@@ -390,17 +435,277 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
             text("SELECT * FROM messages WHERE conversation_id = :conv_id ORDER BY timestamp ASC"),
             {"conv_id": conversation_id}
         )
-        rows = result.fetchall()
+        return await self._messages_from_rows(session, result.fetchall())
+
+    async def _messages_from_rows(self, session: AsyncSession, rows) -> list[Message]:
+        """Messages from rows of the messages table, decompressing content stored compressed."""
+        missing = {
+            id for id in (self.codec.dictionary_id(row.codec) for row in rows)
+            if id and not self.codec.has_dictionary(id)
+        }
+        if missing:
+            # Trained by another instance since this one last loaded dictionaries
+            await self._fetch_dictionaries(session, list(missing))
         return [
             Message(
                 id=row.id,
                 role=MessageRole(row.role),
-                content=row.content,
+                content=self.codec.decode(row.content, row.codec, row.content_blob),
                 timestamp=row.timestamp
             )
             for row in rows
         ]
 
+    def _message_params(self, messages: list[Message], domain_id: Optional[str]) -> dict:
+        """Array parameters to unnest() into messages, with long contents compressed.
+
+        search_texts repeats the text of compressed messages only, since their stored
+        content is empty and the search vector must still be computed from it.
+        """
+        encoded = [self.codec.encode(m.content, domain_id) for m in messages]
+        return {
+            "ids": [m.id for m in messages],
+            "roles": [m.role.value for m in messages],
+            "contents": [content for content, _, _ in encoded],
+            "timestamps": [m.timestamp for m in messages],
+            "codecs": [codec for _, codec, _ in encoded],
+            "blobs": [blob for _, _, blob in encoded],
+            "search_texts": [m.content if codec else None for m, (_, codec, _) in zip(messages, encoded)],
+        }
+
+    async def _get_messages_for(self, session: AsyncSession, conversation_ids: list[str]) -> dict[str, list[Message]]:
+        """Fetch messages for many conversations in one query, grouped by conversation."""
+        grouped: dict[str, list[Message]] = {}
+        if not conversation_ids:
+            return grouped
+        result = await session.execute(
+            text("SELECT * FROM messages WHERE conversation_id = ANY(:conv_ids) ORDER BY conversation_id, timestamp ASC"),
+            {"conv_ids": conversation_ids}
+        )
+        rows = result.fetchall()
+        for row, message in zip(rows, await self._messages_from_rows(session, rows)):
+            grouped.setdefault(row.conversation_id, []).append(message)
+        return grouped
+
+    async def _get_archived_messages_for(self, session: AsyncSession, conversation_ids: list[str]) -> dict[str, list[Message]]:
+        if not conversation_ids:
+            return {}
+        result = await session.execute(
+            text("SELECT conversation_id, payload FROM message_archive WHERE conversation_id = ANY(:conv_ids)"),
+            {"conv_ids": conversation_ids}
+        )
+        return {row.conversation_id: unpack_messages(row.payload) for row in result.fetchall()}
+
+    async def _rehydrate(self, session: AsyncSession, conversation_id: str) -> bool:
+        """Move an archived conversation's messages back into messages and commit; False if it was not archived."""
+        result = await session.execute(
+            text("DELETE FROM message_archive WHERE conversation_id = :conv_id RETURNING payload"),
+            {"conv_id": conversation_id}
+        )
+        row = result.fetchone()
+        if row is None:
+            return False
+        messages = unpack_messages(row.payload)
+        # The insert trigger counts the restored messages again, so take them off first
+        await session.execute(
+            text(f"""WITH restored AS ({INSERT_MESSAGES})
+                    UPDATE conversations SET archived_at = NULL, message_count = message_count - :restored WHERE id = :conv_id"""),
+            {
+                "conv_id": conversation_id,
+                "restored": len(messages),
+                **self._message_params(messages, self.codec.domain_of(conversation_id)),
+            }
+        )
+        await session.commit()
+        conversation_archive.inc(backend="LakebaseSDKStorage", direction="rehydrate")
+        return True
+
+    async def _fetch_dictionaries(self, session: AsyncSession, ids: Optional[list[int]] = None):
+        if ids is None:
+            result = await session.execute(
+                text("SELECT id, domain_id, codec, dictionary FROM compression_dictionaries ORDER BY id")
+            )
+        else:
+            result = await session.execute(
+                text("SELECT id, domain_id, codec, dictionary FROM compression_dictionaries WHERE id = ANY(:ids)"),
+                {"ids": ids}
+            )
+        for row in result.fetchall():
+            self.codec.add_dictionary(row.id, row.domain_id, row.codec, row.dictionary)
+
+    async def _load_dictionaries(self):
+        async with self.session_maker() as session:
+            await self._fetch_dictionaries(session)
+
+    async def _dictionary_samples(self, domain_id: str, limit: int) -> list[str]:
+        """Up to `limit` long messages of a domain's conversations, to train its dictionary on."""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                text("""SELECT m.id, m.role, m.content, m.timestamp, m.codec, m.content_blob
+                        FROM messages m JOIN conversations c ON c.id = m.conversation_id
+                        WHERE c.domain_id = :domain_id AND (m.codec IS NOT NULL OR octet_length(m.content) >= :min_bytes)
+                        LIMIT :limit"""),
+                {"domain_id": domain_id, "min_bytes": self.codec.min_bytes, "limit": limit}
+            )
+            return [m.content for m in await self._messages_from_rows(session, result.fetchall())]
+
+    async def _store_dictionary(self, domain_id: str, algorithm: str, data: bytes, samples: int) -> int:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                text("""INSERT INTO compression_dictionaries (domain_id, codec, dictionary, samples, created_at)
+                        VALUES (:domain_id, :codec, :dictionary, :samples, :created_at) RETURNING id"""),
+                {
+                    "domain_id": domain_id, "codec": algorithm, "dictionary": data,
+                    "samples": samples, "created_at": int(time.time() * 1000),
+                }
+            )
+            dictionary_id = result.scalar()
+            await session.commit()
+        return dictionary_id
+
+    async def _archive_cold_conversations(self, cutoff: int, limit: int) -> int:
+        """Move the messages of up to `limit` conversations last updated before `cutoff` to message_archive."""
+        async with self.session_maker() as session:
+            result = await session.execute(
+                text("""SELECT id FROM conversations
+                        WHERE archived_at IS NULL AND updated_at < :cutoff AND message_count > 0
+                        ORDER BY updated_at
+                        LIMIT :limit
+                        FOR UPDATE SKIP LOCKED"""),
+                {"cutoff": cutoff, "limit": limit}
+            )
+            ids = [row.id for row in result.fetchall()]
+            if not ids:
+                return 0
+            grouped = await self._get_messages_for(session, ids)
+            payloads = await asyncio.to_thread(lambda: [pack_messages(grouped.get(id, [])) for id in ids])
+            await session.execute(
+                text("""WITH archived AS (
+                            INSERT INTO message_archive (conversation_id, message_count, payload, archived_at)
+                            SELECT a.id, a.message_count, a.payload, :archived_at
+                            FROM unnest(CAST(:ids AS TEXT[]), CAST(:counts AS INTEGER[]), CAST(:payloads AS BYTEA[]))
+                                AS a(id, message_count, payload)
+                        ), cleared AS (
+                            DELETE FROM messages WHERE conversation_id = ANY(:ids)
+                        )
+                        UPDATE conversations SET archived_at = :archived_at WHERE id = ANY(:ids)"""),
+                {
+                    "ids": ids,
+                    "counts": [len(grouped.get(id, [])) for id in ids],
+                    "payloads": payloads,
+                    "archived_at": int(time.time() * 1000),
+                }
+            )
+            await session.commit()
+        conversation_archive.inc(len(ids), backend="LakebaseSDKStorage", direction="archive")
+        return len(ids)
+
+    async def _maintain_message_partitions(self, drop_before: int):
+        """Create the upcoming monthly partitions and drop old ones that archiving emptied."""
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for year, month in upcoming_months(int(time.time() * 1000)):
+                try:
+                    await conn.execute(text(create_partition_sql(year, month)))
+                except Exception as e:
+                    # Typically rows for that month already sit in the default partition
+                    log.warning("Could not create message partition", year=year, month=month, error=e)
+            if not drop_before:
+                return
+            result = await conn.execute(text(
+                """SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                   WHERE i.inhparent = to_regclass('messages')"""
+            ))
+            partitions = [row.relname for row in result.fetchall()]
+        for name in partitions:
+            month = parse_partition_name(name)
+            if month is None or partition_bounds(*month)[1] > drop_before:
+                continue
+            async with self.engine.begin() as conn:
+                await conn.execute(text(f"LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE"))
+                empty = (await conn.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {name})"))).scalar()
+                if empty:
+                    await conn.execute(text(f"DROP TABLE {name}"))
+                    log.info("Dropped empty message partition", partition=name)
+
+    async def get_conversation_summaries(
+        self, user_email: Optional[str] = None,
+        limit: int = 50, cursor: Optional[str] = None
+    ) -> ConversationPage:
+        position = decode_cursor(cursor)
+        where_clauses = []
+        params = {"limit": limit + 1}
+        if user_email:
+            where_clauses.append("c.user_email = :email")
+            params["email"] = user_email
+        if position:
+            where_clauses.append("(c.updated_at, c.id) < (:cursor_updated_at, :cursor_id)")
+            params["cursor_updated_at"], params["cursor_id"] = position
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+
+        async with self.session_maker() as session:
+            result = await session.execute(
+                text(f"""SELECT c.id, c.title, c.endpoint_id, c.domain_id, c.site_id, c.updated_at,
+                                c.message_count
+                         FROM conversations c
+                         {where_sql}
+                         ORDER BY c.updated_at DESC, c.id DESC
+                         LIMIT :limit"""),
+                params
+            )
+            rows = result.fetchall()
+        summaries = [
+            ConversationSummary(
+                id=row.id,
+                title=row.title,
+                endpointId=row.endpoint_id,
+                domainId=row.domain_id,
+                siteId=row.site_id,
+                updatedAt=row.updated_at,
+                messageCount=row.message_count
+            )
+            for row in rows
+        ]
+        return build_conversation_page(summaries, limit)
+
+    async def search_conversations(
+        self, user_email: Optional[str], query: str,
+        limit: int = 20, cursor: Optional[str] = None
+    ) -> SearchPage:
+        offset = decode_search_cursor(cursor)
+        params = {"query": query, "limit": limit + 1, "offset": offset}
+        user_sql = ""
+        if user_email:
+            user_sql = "AND c.user_email = :email"
+            params["email"] = user_email
+
+        async with self.session_maker() as session:
+            # Archived conversations have no hot messages, so they are not searched
+            result = await session.execute(
+                text(f"""SELECT * FROM (
+                             SELECT DISTINCT ON (m.conversation_id)
+                                    m.conversation_id, c.title, m.id, m.role, m.content, m.timestamp, m.codec, m.content_blob,
+                                    ts_rank_cd(m.search_vector, q.query) AS rank,
+                                    COUNT(*) OVER (PARTITION BY m.conversation_id) AS matches
+                             FROM messages m
+                             JOIN conversations c ON c.id = m.conversation_id
+                             CROSS JOIN websearch_to_tsquery('english', :query) AS q(query)
+                             WHERE m.search_vector @@ q.query {user_sql}
+                             ORDER BY m.conversation_id, rank DESC, m.timestamp DESC
+                         ) best
+                         ORDER BY rank DESC, timestamp DESC, conversation_id
+                         LIMIT :limit OFFSET :offset"""),
+                params
+            )
+            rows = result.fetchall()
+            messages = await self._messages_from_rows(session, rows)
+        wanted = query_terms(query)
+        results = [
+            build_search_result(row.conversation_id, row.title, message, wanted, row.matches, row.rank)
+            for row, message in zip(rows, messages)
+        ]
+        return build_search_page(results, limit, offset)
+
     async def get_conversation(self, id: str) -> Optional[Conversation]:
         async with self.session_maker() as session:
             result = await session.execute(
@@ -412,6 +717,9 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
             if not row:
                 return None
             
+            self.codec.remember_domain(id, row.domain_id)
+            if row.archived_at:
+                await self._rehydrate(session, id)
             messages = await self._get_messages(session, id)
             return Conversation(
                 id=row.id,
@@ -425,6 +733,41 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
                 updatedAt=row.updated_at
             )
 
+    async def get_conversation_summary(self, id: str) -> Optional[ConversationSummary]:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                text("""SELECT c.id, c.title, c.endpoint_id, c.domain_id, c.site_id, c.updated_at,
+                               c.message_count
+                        FROM conversations c
+                        WHERE c.id = :id"""),
+                {"id": id}
+            )
+            row = result.fetchone()
+        if not row:
+            return None
+        self.codec.remember_domain(id, row.domain_id)
+        return ConversationSummary(
+            id=row.id,
+            title=row.title,
+            endpointId=row.endpoint_id,
+            domainId=row.domain_id,
+            siteId=row.site_id,
+            updatedAt=row.updated_at,
+            messageCount=row.message_count
+        )
+
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> list[Message]:
+        if limit <= 0:
+            return []
+        query = text("SELECT * FROM messages WHERE conversation_id = :conv_id ORDER BY timestamp DESC LIMIT :limit")
+        params = {"conv_id": conversation_id, "limit": limit}
+        async with self.session_maker() as session:
+            rows = (await session.execute(query, params)).fetchall()
+            # Archived conversations have no hot messages; restore and read again
+            if not rows and await self._rehydrate(session, conversation_id):
+                rows = (await session.execute(query, params)).fetchall()
+            return await self._messages_from_rows(session, list(reversed(rows)))
+
     async def create_conversation(
         self, endpoint_id: str, title: str,
         domain_id: Optional[str] = None, site_id: Optional[str] = None,
@@ -444,6 +787,7 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
                 }
             )
             await session.commit()
+        self.codec.remember_domain(conv_id, domain_id)
         
         return Conversation(
             id=conv_id,
@@ -459,22 +803,28 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
 
     async def add_message(self, conversation_id: str, message: InsertMessage) -> Message:
         msg_id = str(uuid.uuid4())
+        content, codec, blob = self.codec.encode(message.content, self.codec.domain_of(conversation_id))
         
         async with self.session_maker() as session:
             await session.execute(
-                text("""INSERT INTO messages (id, conversation_id, role, content, timestamp)
-                       VALUES (:id, :conv_id, :role, :content, :timestamp)"""),
+                text("""INSERT INTO messages (id, conversation_id, role, content, timestamp, codec, content_blob, search_vector)
+                       VALUES (:id, :conv_id, :role, :content, :timestamp, :codec, :content_blob,
+                               to_tsvector('english', :search_text))"""),
                 {
                     "id": msg_id, "conv_id": conversation_id,
-                    "role": message.role.value, "content": message.content,
-                    "timestamp": message.timestamp
+                    "role": message.role.value, "content": content,
+                    "timestamp": message.timestamp, "codec": codec, "content_blob": blob,
+                    "search_text": message.content
                 }
             )
-            await session.execute(
-                text("UPDATE conversations SET updated_at = :updated_at WHERE id = :id"),
+            result = await session.execute(
+                text("UPDATE conversations SET updated_at = :updated_at WHERE id = :id RETURNING archived_at"),
                 {"updated_at": int(time.time() * 1000), "id": conversation_id}
             )
+            archived_at = result.scalar()
             await session.commit()
+            if archived_at:
+                await self._rehydrate(session, conversation_id)
         
         return Message(
             id=msg_id,
@@ -483,6 +833,52 @@ CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation
             timestamp=message.timestamp
         )
 
+    async def record_chat_turn(
+        self, conversation_id: str, messages: list[InsertMessage],
+        new_conversation: Optional[Conversation] = None
+    ) -> list[Message]:
+        new_messages = [
+            Message(id=str(uuid.uuid4()), role=m.role, content=m.content, timestamp=m.timestamp)
+            for m in messages
+        ]
+        if new_conversation:
+            self.codec.remember_domain(conversation_id, new_conversation.domainId)
+        params = {
+            "conv_id": conversation_id,
+            "updated_at": int(time.time() * 1000),
+            **self._message_params(new_messages, self.codec.domain_of(conversation_id)),
+        }
+        
+        async with self.session_maker() as session:
+            if new_conversation:
+                params.update({
+                    "title": new_conversation.title, "endpoint_id": new_conversation.endpointId,
+                    "domain_id": new_conversation.domainId, "site_id": new_conversation.siteId,
+                    "user_email": new_conversation.userEmail, "created_at": new_conversation.createdAt,
+                })
+                await session.execute(
+                    text(f"""WITH conversation AS (
+                                INSERT INTO conversations (id, title, endpoint_id, domain_id, site_id, user_email, created_at, updated_at)
+                                VALUES (:conv_id, :title, :endpoint_id, :domain_id, :site_id, :user_email, :created_at, :updated_at)
+                            )
+                            {INSERT_MESSAGES}"""),
+                    params
+                )
+            else:
+                result = await session.execute(
+                    text(f"""WITH inserted AS ({INSERT_MESSAGES})
+                            UPDATE conversations SET updated_at = :updated_at WHERE id = :conv_id
+                            RETURNING archived_at"""),
+                    params
+                )
+                archived_at = result.scalar()
+            await session.commit()
+            # Written to while (or just after) being archived: bring the history back
+            if not new_conversation and archived_at:
+                await self._rehydrate(session, conversation_id)
+        
+        return new_messages
+
     async def update_conversation(self, id: str, updates: dict) -> Optional[Conversation]:
         async with self.session_maker() as session:
             result = await session.execute(
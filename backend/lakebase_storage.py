@@ -1,6 +1,9 @@
 import os
 import re
-from typing import Optional
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
 from uuid import uuid4
 import time
 from dataclasses import dataclass
@@ -9,10 +12,19 @@ from databricks import sql
 from databricks.sql.client import Connection, Cursor
 
 from .models import (
-    Message, InsertMessage, Conversation, Domain, InsertDomain,
-    Site, Endpoint, InsertEndpoint, Config, MessageRole, EndpointType
+    Message, InsertMessage, Conversation, ConversationSummary, ConversationPage, SearchPage,
+    Domain, InsertDomain, Site, Endpoint, InsertEndpoint, Config, MessageRole, EndpointType
 )
-from .storage import IStorage
+from .storage import IStorage, decode_cursor, build_conversation_page
+from .log import get_logger
+from .metrics import db_statements
+from .search import InvertedIndex, build_search_page, build_search_result, decode_search_cursor, query_terms
+
+T = TypeVar("T")
+log = get_logger("storage.lakebase")
+
+# Messages fetched per round trip while (re)building the search index
+SEARCH_INDEX_BATCH = 5000
 
 
 @dataclass
@@ -24,6 +36,11 @@ class LakeBaseConfig:
     token: Optional[str] = None
     client_id: Optional[str] = None
     client_secret: Optional[str] = None
+    max_concurrency: int = 4
+    write_batch_size: int = 50
+    write_batch_delay_ms: int = 10
+    # The in-process search index is rebuilt this often to pick up other instances' writes; 0 builds it once
+    search_refresh_seconds: float = 3600
 
 
 def create_lakebase_config() -> Optional[LakeBaseConfig]:
@@ -51,14 +68,153 @@ def create_lakebase_config() -> Optional[LakeBaseConfig]:
         schema=schema,
         token=token,
         client_id=client_id,
-        client_secret=client_secret
+        client_secret=client_secret,
+        max_concurrency=int(os.environ.get("DATABRICKS_SQL_MAX_CONCURRENCY", "4")),
+        write_batch_size=int(os.environ.get("DATABRICKS_SQL_WRITE_BATCH_SIZE", "50")),
+        write_batch_delay_ms=int(os.environ.get("DATABRICKS_SQL_WRITE_BATCH_DELAY_MS", "10")),
+        search_refresh_seconds=float(os.environ.get("DATABRICKS_SQL_SEARCH_REFRESH_SECONDS", "3600"))
+    )
+
+
+def _values_list(prefix: str, columns: list[str], count: int) -> str:
+    """Build `(:prefix_col0, ...), (...)` parameter-marker rows for a multi-row statement."""
+    return ", ".join(
+        "(" + ", ".join(f":{prefix}_{column}{i}" for column in columns) + ")"
+        for i in range(count)
     )
 
 
+class MessageWriteBatcher:
+    """Write-behind batcher for message inserts.
+
+    Concurrent add_message calls are coalesced into one multi-row INSERT plus one
+    MERGE that bumps conversations.updated_at, flushed when the batch reaches
+    `max_batch` rows or `max_delay` seconds after the first pending row. Callers
+    await their row's flush, so a returned message is always persisted.
+    """
+
+    def __init__(self, storage: "LakeBaseStorage", max_batch: int, max_delay: float):
+        self._storage = storage
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._pending: list[tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_tasks: set[asyncio.Task] = set()
+        self.flushes = 0
+        self.rows_written = 0
+
+    async def submit(self, rows: list[dict]) -> None:
+        loop = asyncio.get_running_loop()
+        futures = []
+        for row in rows:
+            future = loop.create_future()
+            self._pending.append((row, future))
+            futures.append(future)
+
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._start_flush)
+
+        await asyncio.gather(*futures)
+
+    def _start_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self):
+        # Serialised so batches reach the warehouse in submission order
+        async with self._flush_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                rows = [row for row, _ in batch]
+                try:
+                    await self._storage._run(lambda cursor: self._write(cursor, rows))
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    self.flushes += 1
+                    self.rows_written += len(rows)
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(None)
+
+    @staticmethod
+    def _write(cursor: Cursor, rows: list[dict]):
+        columns = ["id", "conversation_id", "role", "content", "timestamp"]
+        params = {}
+        for i, row in enumerate(rows):
+            for column in columns:
+                params[f"m_{column}{i}"] = row[column]
+        cursor.execute(
+            f"INSERT INTO messages (id, conversation_id, role, content, timestamp) VALUES {_values_list('m', columns, len(rows))}",
+            params
+        )
+
+        latest: dict[str, int] = {}
+        for row in rows:
+            latest[row["conversation_id"]] = max(latest.get(row["conversation_id"], 0), row["updated_at"])
+        bump_params = {}
+        for i, (conversation_id, updated_at) in enumerate(latest.items()):
+            bump_params[f"c_id{i}"] = conversation_id
+            bump_params[f"c_updated_at{i}"] = updated_at
+        cursor.execute(
+            f"""
+            MERGE INTO conversations AS t
+            USING (SELECT * FROM VALUES {_values_list('c', ['id', 'updated_at'], len(latest))} AS s(id, updated_at)) AS s
+            ON t.id = s.id
+            WHEN MATCHED THEN UPDATE SET t.updated_at = s.updated_at
+            """,
+            bump_params
+        )
+
+
+class _CountingCursor:
+    """Counts executed statements for strata_db_statements_total; all else goes to the cursor."""
+
+    def __init__(self, cursor: Cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        db_statements.inc(backend="LakeBaseStorage")
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+
 class LakeBaseStorage(IStorage):
     def __init__(self, config: LakeBaseConfig):
         self.config = config
-        self.connection: Optional[Connection] = None
+        # The connector is blocking and its connections are not thread-safe, so all
+        # warehouse I/O runs on a bounded executor with one connection per worker thread.
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, config.max_concurrency), thread_name_prefix="lakebase-sql"
+        )
+        self._local = threading.local()
+        self._connections: list[Connection] = []
+        self._connections_lock = threading.Lock()
+        self._submitted = 0
+        self._message_batcher = MessageWriteBatcher(
+            self, config.write_batch_size, config.write_batch_delay_ms / 1000
+        )
+        # The warehouse has no full-text search, so messages are indexed in process
+        self.search_index = InvertedIndex()
+        self._search_task: Optional[asyncio.Task] = None
+        # The rebuild scan's thread, which close() waits for after stopping it
+        self._search_scan: Optional[asyncio.Future] = None
+        self._search_stop = threading.Event()
+        # While a rebuild runs: this instance's writes, replayed onto the new index, and their message ids
+        self._search_backlog: Optional[list[tuple]] = None
+        self._search_live_ids: Optional[set[str]] = None
         self.memory_cache = {
             "domains": {},
             "sites": {},
@@ -66,17 +222,7 @@ class LakeBaseStorage(IStorage):
             "config": Config()
         }
 
-    def _escape_string(self, value: str) -> str:
-        if not value:
-            return ""
-        return value.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n").replace("\r", "\\r")
-
-    def _escape_id(self, value: str) -> str:
-        if not value:
-            return ""
-        return re.sub(r"[^a-zA-Z0-9_-]", "", value)
-
-    async def initialize(self):
+    def _connect(self) -> Connection:
         auth_params = {}
         if self.config.token:
             auth_params["access_token"] = self.config.token
@@ -84,7 +230,7 @@ class LakeBaseStorage(IStorage):
             auth_params["client_id"] = self.config.client_id
             auth_params["client_secret"] = self.config.client_secret
 
-        self.connection = sql.connect(
+        return sql.connect(
             server_hostname=self.config.server_hostname,
             http_path=self.config.http_path,
             catalog=self.config.catalog,
@@ -92,12 +238,49 @@ class LakeBaseStorage(IStorage):
             **auth_params
         )
 
+    def _thread_connection(self) -> Connection:
+        """Return the calling executor thread's connection, opening it on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    async def _run(self, work: Callable[[Cursor], T]) -> T:
+        """Run blocking cursor work on the executor so it never stalls the event loop."""
+        def run_with_cursor() -> T:
+            cursor = self._thread_connection().cursor()
+            try:
+                return work(_CountingCursor(cursor))
+            finally:
+                cursor.close()
+
+        self._submitted += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, run_with_cursor)
+        finally:
+            self._submitted -= 1
+
+    def pool_stats(self) -> dict[str, int]:
+        workers = self._executor._max_workers
+        with self._connections_lock:
+            connections = len(self._connections)
+        return {
+            "max": workers,
+            "open": connections,
+            "in_use": min(self._submitted, workers),
+            "waiting": max(self._submitted - workers, 0),
+        }
+
+    async def initialize(self):
         await self._create_tables()
         await self._load_cache()
+        self._search_task = asyncio.create_task(self._maintain_search_index())
 
     async def _create_tables(self):
-        cursor = self.connection.cursor()
-        try:
+        def work(cursor: Cursor):
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS conversations (
                     id STRING,
@@ -155,48 +338,44 @@ class LakeBaseStorage(IStorage):
                     system_prompt STRING
                 )
             """)
-        finally:
-            cursor.close()
+
+        return await self._run(work)
 
     async def _load_cache(self):
-        cursor = self.connection.cursor()
-        try:
+        def work(cursor: Cursor):
             cursor.execute("SELECT * FROM domains")
-            rows = cursor.fetchall()
-            if rows:
-                for row in rows:
-                    domain = Domain(
-                        id=row[0], name=row[1], description=row[2],
-                        systemPrompt=row[3], icon=row[4]
-                    )
-                    self.memory_cache["domains"][domain.id] = domain
-
+            domain_rows = cursor.fetchall()
             cursor.execute("SELECT * FROM sites")
-            rows = cursor.fetchall()
-            if rows:
-                for row in rows:
-                    site = Site(id=row[0], name=row[1], location=row[2], type=row[3])
-                    self.memory_cache["sites"][site.id] = site
-
+            site_rows = cursor.fetchall()
             cursor.execute("SELECT * FROM endpoints")
-            rows = cursor.fetchall()
-            if rows:
-                for row in rows:
-                    endpoint = Endpoint(
-                        id=row[0], name=row[1], description=row[2],
-                        type=EndpointType(row[3]), isDefault=row[4], domainId=row[5]
-                    )
-                    self.memory_cache["endpoints"][endpoint.id] = endpoint
+            endpoint_rows = cursor.fetchall()
+            return domain_rows, site_rows, endpoint_rows
 
-            if not self.memory_cache["domains"]:
-                await self._initialize_default_data()
+        domain_rows, site_rows, endpoint_rows = await self._run(work)
 
-        finally:
-            cursor.close()
+        for row in domain_rows or []:
+            domain = Domain(
+                id=row[0], name=row[1], description=row[2],
+                systemPrompt=row[3], icon=row[4]
+            )
+            self.memory_cache["domains"][domain.id] = domain
+
+        for row in site_rows or []:
+            site = Site(id=row[0], name=row[1], location=row[2], type=row[3])
+            self.memory_cache["sites"][site.id] = site
+
+        for row in endpoint_rows or []:
+            endpoint = Endpoint(
+                id=row[0], name=row[1], description=row[2],
+                type=EndpointType(row[3]), isDefault=row[4], domainId=row[5]
+            )
+            self.memory_cache["endpoints"][endpoint.id] = endpoint
+
+        if not self.memory_cache["domains"]:
+            await self._initialize_default_data()
 
     async def _initialize_default_data(self):
-        cursor = self.connection.cursor()
-        try:
+        def work(cursor: Cursor):
             default_domains = [
                 ("generic", "General Assistant", "General-purpose AI assistant for Anglo American", "You are a helpful AI assistant for Anglo American, a global mining company.", "Bot"),
                 ("mining-ops", "Mining Operations", "Mining operations, production, and equipment management", "You are a mining operations specialist for Anglo American.", "Pickaxe"),
@@ -207,7 +386,10 @@ class LakeBaseStorage(IStorage):
                 ("finance", "Finance & Analytics", "Financial analysis and business analytics", "You are a finance and analytics specialist for Anglo American.", "BarChart3"),
             ]
             for d in default_domains:
-                cursor.execute(f"INSERT INTO domains VALUES ('{d[0]}', '{self._escape_string(d[1])}', '{self._escape_string(d[2])}', '{self._escape_string(d[3])}', '{d[4]}')")
+                cursor.execute(
+                    "INSERT INTO domains VALUES (:id, :name, :description, :system_prompt, :icon)",
+                    {"id": d[0], "name": d[1], "description": d[2], "system_prompt": d[3], "icon": d[4]}
+                )
                 self.memory_cache["domains"][d[0]] = Domain(id=d[0], name=d[1], description=d[2], systemPrompt=d[3], icon=d[4])
 
             default_sites = [
@@ -225,7 +407,10 @@ class LakeBaseStorage(IStorage):
                 ("woodsmith", "Woodsmith", "UK", "Polyhalite"),
             ]
             for s in default_sites:
-                cursor.execute(f"INSERT INTO sites VALUES ('{s[0]}', '{self._escape_string(s[1])}', '{self._escape_string(s[2])}', '{s[3]}')")
+                cursor.execute(
+                    "INSERT INTO sites VALUES (:id, :name, :location, :type)",
+                    {"id": s[0], "name": s[1], "location": s[2], "type": s[3]}
+                )
                 self.memory_cache["sites"][s[0]] = Site(id=s[0], name=s[1], location=s[2], type=s[3])
 
             default_endpoints = [
@@ -234,49 +419,225 @@ class LakeBaseStorage(IStorage):
                 ("databricks-mixtral-8x7b", "Mixtral 8x7B", "Mistral AI mixture of experts", "foundation", False, None),
             ]
             for e in default_endpoints:
-                cursor.execute(f"INSERT INTO endpoints VALUES ('{e[0]}', '{self._escape_string(e[1])}', '{self._escape_string(e[2])}', '{e[3]}', {str(e[4]).lower()}, NULL)")
+                cursor.execute(
+                    "INSERT INTO endpoints VALUES (:id, :name, :description, :type, :is_default, NULL)",
+                    {"id": e[0], "name": e[1], "description": e[2], "type": e[3], "is_default": e[4]}
+                )
                 self.memory_cache["endpoints"][e[0]] = Endpoint(id=e[0], name=e[1], description=e[2], type=EndpointType(e[3]), isDefault=e[4], domainId=e[5])
 
-        finally:
-            cursor.close()
+        return await self._run(work)
 
     async def get_conversations(self, user_email: Optional[str] = None) -> list[Conversation]:
-        cursor = self.connection.cursor()
-        try:
+        def work(cursor: Cursor):
             if user_email:
-                safe_email = self._escape_string(user_email)
-                cursor.execute(f"SELECT * FROM conversations WHERE user_email = '{safe_email}' ORDER BY updated_at DESC")
+                cursor.execute(
+                    "SELECT * FROM conversations WHERE user_email = :email ORDER BY updated_at DESC",
+                    {"email": user_email}
+                )
             else:
                 cursor.execute("SELECT * FROM conversations ORDER BY updated_at DESC")
             rows = cursor.fetchall()
-            
+
+            messages_by_conversation: dict[str, list[Message]] = {}
+            if rows:
+                id_params = {f"id{i}": row[0] for i, row in enumerate(rows)}
+                id_list = ", ".join(f":{name}" for name in id_params)
+                cursor.execute(
+                    f"SELECT * FROM messages WHERE conversation_id IN ({id_list}) ORDER BY conversation_id, timestamp ASC",
+                    id_params
+                )
+                for m in cursor.fetchall():
+                    messages_by_conversation.setdefault(m[1], []).append(
+                        Message(id=m[0], role=MessageRole(m[2]), content=m[3], timestamp=m[4])
+                    )
+
             conversations = []
             for row in rows:
-                cursor.execute(f"SELECT * FROM messages WHERE conversation_id = '{self._escape_id(row[0])}' ORDER BY timestamp ASC")
-                message_rows = cursor.fetchall()
-                messages = [
-                    Message(id=m[0], role=MessageRole(m[2]), content=m[3], timestamp=m[4])
-                    for m in message_rows
-                ]
                 conversations.append(Conversation(
-                    id=row[0], title=row[1], messages=messages,
+                    id=row[0], title=row[1], messages=messages_by_conversation.get(row[0], []),
                     endpointId=row[2], domainId=row[3], siteId=row[4],
                     userEmail=row[5], createdAt=row[6], updatedAt=row[7]
                 ))
             return conversations
+
+        return await self._run(work)
+
+    async def _maintain_search_index(self):
+        while True:
+            try:
+                await self._rebuild_search_index()
+            except Exception as e:
+                log.exception("Building the search index failed", error=e)
+            if self.config.search_refresh_seconds <= 0:
+                return
+            await asyncio.sleep(self.config.search_refresh_seconds)
+
+    async def _rebuild_search_index(self):
+        """Index every stored message into a fresh index, then swap it in.
+
+        Searches keep using the previous index meanwhile. This instance's writes during the
+        scan are skipped by it and replayed afterwards, so none is lost or indexed twice.
+        """
+        started = time.perf_counter()
+        index = InvertedIndex()
+        backlog: list[tuple] = []
+        live_ids: set[str] = set()
+        self._search_backlog, self._search_live_ids = backlog, live_ids
+        loop = asyncio.get_running_loop()
+
+        async def index_rows(rows):
+            for message_id, conversation_id, content, timestamp in rows:
+                if message_id not in live_ids:
+                    index.add(conversation_id, message_id, content or "", timestamp)
+
+        async def index_conversations(rows):
+            for conversation_id, owner in rows:
+                index.add_conversation(conversation_id, owner)
+
+        def scan():
+            # Its own thread and connection, so the scan never holds a request worker
+            connection = self._connect()
+            try:
+                cursor = _CountingCursor(connection.cursor())
+                cursor.execute("SELECT id, user_email FROM conversations")
+                rows = cursor.fetchall()
+                if self._search_stop.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(index_conversations(rows), loop).result()
+                cursor.execute("SELECT id, conversation_id, content, timestamp FROM messages")
+                while not self._search_stop.is_set():
+                    rows = cursor.fetchmany(SEARCH_INDEX_BATCH)
+                    if not rows or self._search_stop.is_set():
+                        break
+                    # Wait for each batch, so rows never pile up faster than the loop indexes them
+                    asyncio.run_coroutine_threadsafe(index_rows(rows), loop).result()
+            finally:
+                connection.close()
+
+        try:
+            self._search_scan = asyncio.ensure_future(asyncio.to_thread(scan))
+            await asyncio.shield(self._search_scan)
+            if self._search_stop.is_set():
+                return
+            for event in backlog:
+                self._apply_search_event(index, event)
         finally:
-            cursor.close()
+            self._search_backlog = self._search_live_ids = None
+        self.search_index = index
+        log.info(
+            "Built search index", documents=index.documents,
+            duration_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+
+    @staticmethod
+    def _apply_search_event(index: InvertedIndex, event: tuple):
+        kind, conversation_id, data = event
+        if kind == "conversation":
+            index.add_conversation(conversation_id, data)
+        elif kind == "messages":
+            for message in data:
+                index.add(conversation_id, message.id, message.content, message.timestamp)
+        elif kind == "delete":
+            index.remove_conversation(conversation_id)
+
+    def _index_search_event(self, kind: str, conversation_id: str, data=None):
+        self._apply_search_event(self.search_index, (kind, conversation_id, data))
+        if self._search_backlog is not None:
+            self._search_backlog.append((kind, conversation_id, data))
+
+    def _note_search_writes(self, messages: list[Message]):
+        """Called before messages are written, so a running rebuild scan skips them."""
+        if self._search_live_ids is not None:
+            self._search_live_ids.update(m.id for m in messages)
+
+    async def search_conversations(
+        self, user_email: Optional[str], query: str,
+        limit: int = 20, cursor: Optional[str] = None
+    ) -> SearchPage:
+        offset = decode_search_cursor(cursor)
+        wanted = query_terms(query)
+        hits = self.search_index.search(wanted, user_email, limit + 1, offset)
+        if not hits:
+            return SearchPage(items=[])
+
+        def work(db_cursor: Cursor):
+            id_params = {f"id{i}": hit.message_id for i, hit in enumerate(hits)}
+            id_list = ", ".join(f":{name}" for name in id_params)
+            db_cursor.execute(
+                f"""SELECT m.id, m.role, m.content, m.timestamp, c.title
+                    FROM messages m JOIN conversations c ON c.id = m.conversation_id
+                    WHERE m.id IN ({id_list})""",
+                id_params
+            )
+            return {row[0]: row for row in db_cursor.fetchall()}
+
+        rows = await self._run(work)
+        results = []
+        for hit in hits:
+            # Deleted by another instance since the index was built
+            row = rows.get(hit.message_id)
+            if row is None:
+                continue
+            message = Message(id=row[0], role=MessageRole(row[1]), content=row[2], timestamp=row[3])
+            results.append(build_search_result(hit.conversation_id, row[4], message, wanted, hit.matches, hit.rank))
+        return build_search_page(results, limit, offset)
+
+    async def get_conversation_summaries(
+        self, user_email: Optional[str] = None,
+        limit: int = 50, cursor: Optional[str] = None
+    ) -> ConversationPage:
+        position = decode_cursor(cursor)
+        where_clauses = []
+        params = {}
+        if user_email:
+            where_clauses.append("user_email = :email")
+            params["email"] = user_email
+        if position:
+            where_clauses.append("(updated_at < :cursor_updated_at OR (updated_at = :cursor_updated_at AND id < :cursor_id))")
+            params["cursor_updated_at"], params["cursor_id"] = position
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+
+        def work(db_cursor: Cursor):
+            db_cursor.execute(f"""
+                SELECT id, title, endpoint_id, domain_id, site_id, updated_at FROM conversations
+                {where_sql}
+                ORDER BY updated_at DESC, id DESC
+                LIMIT {int(limit) + 1}
+            """, params)
+            rows = db_cursor.fetchall()
+
+            counts: dict[str, int] = {}
+            if rows:
+                id_params = {f"id{i}": row[0] for i, row in enumerate(rows)}
+                id_list = ", ".join(f":{name}" for name in id_params)
+                db_cursor.execute(
+                    f"SELECT conversation_id, COUNT(*) FROM messages WHERE conversation_id IN ({id_list}) GROUP BY conversation_id",
+                    id_params
+                )
+                counts = {r[0]: r[1] for r in db_cursor.fetchall()}
+
+            summaries = [
+                ConversationSummary(
+                    id=row[0], title=row[1], endpointId=row[2], domainId=row[3],
+                    siteId=row[4], updatedAt=row[5], messageCount=counts.get(row[0], 0)
+                )
+                for row in rows
+            ]
+            return build_conversation_page(summaries, limit)
+
+        return await self._run(work)
 
     async def get_conversation(self, id: str) -> Optional[Conversation]:
-        cursor = self.connection.cursor()
-        safe_id = self._escape_id(id)
-        try:
-            cursor.execute(f"SELECT * FROM conversations WHERE id = '{safe_id}'")
+        def work(cursor: Cursor):
+            cursor.execute("SELECT * FROM conversations WHERE id = :id", {"id": id})
             row = cursor.fetchone()
             if not row:
                 return None
 
-            cursor.execute(f"SELECT * FROM messages WHERE conversation_id = '{safe_id}' ORDER BY timestamp ASC")
+            cursor.execute(
+                "SELECT * FROM messages WHERE conversation_id = :id ORDER BY timestamp ASC",
+                {"id": id}
+            )
             message_rows = cursor.fetchall()
             messages = [
                 Message(id=m[0], role=MessageRole(m[2]), content=m[3], timestamp=m[4])
@@ -287,92 +648,165 @@ class LakeBaseStorage(IStorage):
                 endpointId=row[2], domainId=row[3], siteId=row[4],
                 userEmail=row[5], createdAt=row[6], updatedAt=row[7]
             )
-        finally:
-            cursor.close()
+
+        return await self._run(work)
+
+    async def get_conversation_summary(self, id: str) -> Optional[ConversationSummary]:
+        def work(cursor: Cursor):
+            cursor.execute(
+                """SELECT id, title, endpoint_id, domain_id, site_id, updated_at,
+                          (SELECT COUNT(*) FROM messages WHERE conversation_id = :id)
+                   FROM conversations WHERE id = :id""",
+                {"id": id}
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return ConversationSummary(
+                id=row[0], title=row[1], endpointId=row[2], domainId=row[3],
+                siteId=row[4], updatedAt=row[5], messageCount=row[6]
+            )
+
+        return await self._run(work)
+
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> list[Message]:
+        if limit <= 0:
+            return []
+
+        def work(cursor: Cursor):
+            cursor.execute(
+                f"SELECT * FROM messages WHERE conversation_id = :id ORDER BY timestamp DESC LIMIT {int(limit)}",
+                {"id": conversation_id}
+            )
+            return [
+                Message(id=m[0], role=MessageRole(m[2]), content=m[3], timestamp=m[4])
+                for m in reversed(cursor.fetchall())
+            ]
+
+        return await self._run(work)
 
     async def create_conversation(
         self, endpoint_id: str, title: str,
         domain_id: Optional[str] = None, site_id: Optional[str] = None,
         user_email: Optional[str] = None
     ) -> Conversation:
-        cursor = self.connection.cursor()
         conv_id = str(uuid4())
         now = int(time.time() * 1000)
-        safe_endpoint = self._escape_id(endpoint_id)
-        safe_domain = self._escape_id(domain_id) if domain_id else None
-        safe_site = self._escape_id(site_id) if site_id else None
-        safe_email = self._escape_string(user_email) if user_email else None
 
-        try:
-            cursor.execute(f"""
-                INSERT INTO conversations VALUES (
-                    '{conv_id}', '{self._escape_string(title)}', '{safe_endpoint}',
-                    {f"'{safe_domain}'" if safe_domain else "NULL"},
-                    {f"'{safe_site}'" if safe_site else "NULL"},
-                    {f"'{safe_email}'" if safe_email else "NULL"},
-                    {now}, {now}
-                )
-            """)
-            return Conversation(
-                id=conv_id, title=title, messages=[],
-                endpointId=endpoint_id, domainId=domain_id, siteId=site_id,
-                userEmail=user_email, createdAt=now, updatedAt=now
+        def work(cursor: Cursor):
+            cursor.execute(
+                """INSERT INTO conversations VALUES (
+                    :id, :title, :endpoint_id, :domain_id, :site_id, :user_email, :created_at, :updated_at
+                )""",
+                {
+                    "id": conv_id, "title": title, "endpoint_id": endpoint_id,
+                    "domain_id": domain_id, "site_id": site_id, "user_email": user_email,
+                    "created_at": now, "updated_at": now
+                }
             )
-        finally:
-            cursor.close()
+
+        await self._run(work)
+        self._index_search_event("conversation", conv_id, user_email)
+        return Conversation(
+            id=conv_id, title=title, messages=[],
+            endpointId=endpoint_id, domainId=domain_id, siteId=site_id,
+            userEmail=user_email, createdAt=now, updatedAt=now
+        )
 
     async def add_message(self, conversation_id: str, message: InsertMessage) -> Message:
-        cursor = self.connection.cursor()
         msg_id = str(uuid4())
-        safe_conv_id = self._escape_id(conversation_id)
         safe_role = message.role.value if message.role.value in ["user", "assistant", "system"] else "user"
-
-        try:
-            cursor.execute(f"""
-                INSERT INTO messages VALUES (
-                    '{msg_id}', '{safe_conv_id}', '{safe_role}',
-                    '{self._escape_string(message.content)}', {message.timestamp}
+        stored = Message(id=msg_id, role=message.role, content=message.content, timestamp=message.timestamp)
+        self._note_search_writes([stored])
+
+        await self._message_batcher.submit([{
+            "id": msg_id,
+            "conversation_id": conversation_id,
+            "role": safe_role,
+            "content": message.content,
+            "timestamp": message.timestamp,
+            "updated_at": int(time.time() * 1000),
+        }])
+        self._index_search_event("messages", conversation_id, [stored])
+        return stored
+
+    async def record_chat_turn(
+        self, conversation_id: str, messages: list[InsertMessage],
+        new_conversation: Optional[Conversation] = None
+    ) -> list[Message]:
+        # The warehouse has no multi-statement transactions; the conversation row is
+        # written first and all of the turn's messages go out in a single batch.
+        if new_conversation:
+            def work(cursor: Cursor):
+                cursor.execute(
+                    """INSERT INTO conversations VALUES (
+                        :id, :title, :endpoint_id, :domain_id, :site_id, :user_email, :created_at, :updated_at
+                    )""",
+                    {
+                        "id": conversation_id, "title": new_conversation.title,
+                        "endpoint_id": new_conversation.endpointId, "domain_id": new_conversation.domainId,
+                        "site_id": new_conversation.siteId, "user_email": new_conversation.userEmail,
+                        "created_at": new_conversation.createdAt, "updated_at": new_conversation.updatedAt
+                    }
                 )
-            """)
-            cursor.execute(f"UPDATE conversations SET updated_at = {int(time.time() * 1000)} WHERE id = '{safe_conv_id}'")
-            return Message(id=msg_id, role=message.role, content=message.content, timestamp=message.timestamp)
-        finally:
-            cursor.close()
 
-    async def update_conversation(self, id: str, updates: dict) -> Optional[Conversation]:
-        cursor = self.connection.cursor()
-        safe_id = self._escape_id(id)
+            await self._run(work)
+            self._index_search_event("conversation", conversation_id, new_conversation.userEmail)
         
+        now = int(time.time() * 1000)
+        new_messages = [
+            Message(id=str(uuid4()), role=m.role, content=m.content, timestamp=m.timestamp)
+            for m in messages
+        ]
+        self._note_search_writes(new_messages)
+        await self._message_batcher.submit([
+            {
+                "id": m.id,
+                "conversation_id": conversation_id,
+                "role": m.role.value,
+                "content": m.content,
+                "timestamp": m.timestamp,
+                "updated_at": now,
+            }
+            for m in new_messages
+        ])
+        self._index_search_event("messages", conversation_id, new_messages)
+        return new_messages
+
+    async def update_conversation(self, id: str, updates: dict) -> Optional[Conversation]:
+        field_mapping = {
+            'title': 'title',
+            'endpointId': 'endpoint_id',
+            'domainId': 'domain_id',
+            'siteId': 'site_id'
+        }
         set_clauses = []
-        if "title" in updates:
-            set_clauses.append(f"title = '{self._escape_string(updates['title'])}'")
-        if "endpointId" in updates:
-            set_clauses.append(f"endpoint_id = '{self._escape_id(updates['endpointId'])}'")
-        if "domainId" in updates:
-            val = updates["domainId"]
-            domain_val = f"'{self._escape_id(val)}'" if val else "NULL"
-            set_clauses.append(f"domain_id = {domain_val}")
-        if "siteId" in updates:
-            val = updates["siteId"]
-            site_val = f"'{self._escape_id(val)}'" if val else "NULL"
-            set_clauses.append(f"site_id = {site_val}")
-        set_clauses.append(f"updated_at = {int(time.time() * 1000)}")
+        params = {"id": id, "updated_at": int(time.time() * 1000)}
+        for key, value in updates.items():
+            if key in field_mapping:
+                db_field = field_mapping[key]
+                set_clauses.append(f"{db_field} = :{db_field}")
+                params[db_field] = value if key in ("title", "endpointId") else value or None
+        set_clauses.append("updated_at = :updated_at")
 
-        try:
-            cursor.execute(f"UPDATE conversations SET {', '.join(set_clauses)} WHERE id = '{safe_id}'")
-            return await self.get_conversation(id)
-        finally:
-            cursor.close()
+        def work(cursor: Cursor):
+            cursor.execute(f"UPDATE conversations SET {', '.join(set_clauses)} WHERE id = :id", params)
+
+        await self._run(work)
+        return await self.get_conversation(id)
 
     async def delete_conversation(self, id: str) -> bool:
-        cursor = self.connection.cursor()
-        safe_id = self._escape_id(id)
-        try:
-            cursor.execute(f"DELETE FROM messages WHERE conversation_id = '{safe_id}'")
-            cursor.execute(f"DELETE FROM conversations WHERE id = '{safe_id}'")
+        # Drain pending message writes so none land after the delete
+        await self._message_batcher.flush()
+
+        def work(cursor: Cursor):
+            cursor.execute("DELETE FROM messages WHERE conversation_id = :id", {"id": id})
+            cursor.execute("DELETE FROM conversations WHERE id = :id", {"id": id})
             return True
-        finally:
-            cursor.close()
+
+        deleted = await self._run(work)
+        self._index_search_event("delete", id)
+        return deleted
 
     async def get_domains(self) -> list[Domain]:
         return list(self.memory_cache["domains"].values())
@@ -381,7 +815,6 @@ class LakeBaseStorage(IStorage):
         return self.memory_cache["domains"].get(id)
 
     async def create_domain(self, domain: InsertDomain) -> Domain:
-        cursor = self.connection.cursor()
         base_id = re.sub(r"[^a-z0-9-]", "", domain.name.lower().replace(" ", "-"))
         domain_id = base_id
         counter = 1
@@ -389,67 +822,66 @@ class LakeBaseStorage(IStorage):
             domain_id = f"{base_id}-{counter}"
             counter += 1
 
-        try:
-            cursor.execute(f"""
-                INSERT INTO domains VALUES (
-                    '{domain_id}', '{self._escape_string(domain.name)}',
-                    '{self._escape_string(domain.description)}',
-                    '{self._escape_string(domain.systemPrompt)}',
-                    '{self._escape_string(domain.icon or "")}'
-                )
-            """)
-            new_domain = Domain(id=domain_id, **domain.model_dump())
-            self.memory_cache["domains"][domain_id] = new_domain
-            return new_domain
-        finally:
-            cursor.close()
+        def work(cursor: Cursor):
+            cursor.execute(
+                "INSERT INTO domains VALUES (:id, :name, :description, :system_prompt, :icon)",
+                {
+                    "id": domain_id, "name": domain.name, "description": domain.description,
+                    "system_prompt": domain.systemPrompt, "icon": domain.icon or ""
+                }
+            )
+
+        await self._run(work)
+        new_domain = Domain(id=domain_id, **domain.model_dump())
+        self.memory_cache["domains"][domain_id] = new_domain
+        return new_domain
 
     async def update_domain(self, id: str, updates: dict) -> Optional[Domain]:
         domain = self.memory_cache["domains"].get(id)
         if not domain:
             return None
 
-        cursor = self.connection.cursor()
-        safe_id = self._escape_id(id)
+        field_mapping = {
+            'name': 'name',
+            'description': 'description',
+            'systemPrompt': 'system_prompt',
+            'icon': 'icon'
+        }
         set_clauses = []
-        if "name" in updates:
-            set_clauses.append(f"name = '{self._escape_string(updates['name'])}'")
-        if "description" in updates:
-            set_clauses.append(f"description = '{self._escape_string(updates['description'] or '')}'")
-        if "systemPrompt" in updates:
-            set_clauses.append(f"system_prompt = '{self._escape_string(updates['systemPrompt'] or '')}'")
-        if "icon" in updates:
-            set_clauses.append(f"icon = '{self._escape_string(updates['icon'] or '')}'")
-
-        try:
-            if set_clauses:
-                cursor.execute(f"UPDATE domains SET {', '.join(set_clauses)} WHERE id = '{safe_id}'")
-            
-            updated_data = domain.model_dump()
-            updated_data.update(updates)
-            updated_domain = Domain(**updated_data)
-            self.memory_cache["domains"][id] = updated_domain
-            return updated_domain
-        finally:
-            cursor.close()
+        params = {"id": id}
+        for key, value in updates.items():
+            if key in field_mapping:
+                db_field = field_mapping[key]
+                set_clauses.append(f"{db_field} = :{db_field}")
+                params[db_field] = value or ""
+
+        def work(cursor: Cursor):
+            cursor.execute(f"UPDATE domains SET {', '.join(set_clauses)} WHERE id = :id", params)
+
+        if set_clauses:
+            await self._run(work)
+        
+        updated_data = domain.model_dump()
+        updated_data.update(updates)
+        updated_domain = Domain(**updated_data)
+        self.memory_cache["domains"][id] = updated_domain
+        return updated_domain
 
     async def delete_domain(self, id: str) -> bool:
-        cursor = self.connection.cursor()
-        safe_id = self._escape_id(id)
-        try:
-            cursor.execute(f"DELETE FROM domains WHERE id = '{safe_id}'")
-            if id in self.memory_cache["domains"]:
-                del self.memory_cache["domains"][id]
-                return True
-            return False
-        finally:
-            cursor.close()
+        def work(cursor: Cursor):
+            cursor.execute("DELETE FROM domains WHERE id = :id", {"id": id})
+
+        await self._run(work)
+        if id in self.memory_cache["domains"]:
+            del self.memory_cache["domains"][id]
+            return True
+        return False
 
     async def refresh_endpoints_from_databricks(self) -> list[Endpoint]:
         from .databricks_client import databricks_client
         
         if not databricks_client.is_configured():
-            print("Databricks not configured, keeping cached endpoints")
+            log.info("Databricks not configured, keeping cached endpoints")
             return list(self.memory_cache["endpoints"].values())
         
         try:
@@ -459,12 +891,12 @@ class LakeBaseStorage(IStorage):
                 self.memory_cache["endpoints"].clear()
                 for endpoint in db_endpoints:
                     self.memory_cache["endpoints"][endpoint.id] = endpoint
-                print(f"Loaded {len(db_endpoints)} endpoints from Databricks")
+                log.info("Loaded endpoints from Databricks", count=len(db_endpoints))
             else:
-                print("No endpoints from Databricks, keeping cached endpoints")
+                log.info("No endpoints from Databricks, keeping cached endpoints")
                 
         except Exception as e:
-            print(f"Error refreshing endpoints from Databricks: {e}")
+            log.warning("Error refreshing endpoints from Databricks", error=e)
             
         return list(self.memory_cache["endpoints"].values())
 
@@ -484,7 +916,6 @@ class LakeBaseStorage(IStorage):
         return self.memory_cache["endpoints"].get(id)
 
     async def create_endpoint(self, endpoint: InsertEndpoint) -> Endpoint:
-        cursor = self.connection.cursor()
         base_id = re.sub(r"[^a-z0-9-]", "", endpoint.name.lower().replace(" ", "-"))
         endpoint_id = base_id
         counter = 1
@@ -493,69 +924,67 @@ class LakeBaseStorage(IStorage):
             counter += 1
 
         safe_type = endpoint.type.value if endpoint.type.value in ["foundation", "custom", "agent"] else "custom"
-        safe_domain = self._escape_id(endpoint.domainId) if endpoint.domainId else None
 
-        try:
-            cursor.execute(f"""
-                INSERT INTO endpoints VALUES (
-                    '{endpoint_id}', '{self._escape_string(endpoint.name)}',
-                    '{self._escape_string(endpoint.description)}', '{safe_type}',
-                    {str(endpoint.isDefault).lower()},
-                    {f"'{safe_domain}'" if safe_domain else "NULL"}
-                )
-            """)
-            new_endpoint = Endpoint(id=endpoint_id, **endpoint.model_dump())
-            self.memory_cache["endpoints"][endpoint_id] = new_endpoint
-            return new_endpoint
-        finally:
-            cursor.close()
+        def work(cursor: Cursor):
+            cursor.execute(
+                "INSERT INTO endpoints VALUES (:id, :name, :description, :type, :is_default, :domain_id)",
+                {
+                    "id": endpoint_id, "name": endpoint.name, "description": endpoint.description,
+                    "type": safe_type, "is_default": endpoint.isDefault, "domain_id": endpoint.domainId or None
+                }
+            )
+
+        await self._run(work)
+        new_endpoint = Endpoint(id=endpoint_id, **endpoint.model_dump())
+        self.memory_cache["endpoints"][endpoint_id] = new_endpoint
+        return new_endpoint
 
     async def update_endpoint(self, id: str, updates: dict) -> Optional[Endpoint]:
         endpoint = self.memory_cache["endpoints"].get(id)
         if not endpoint:
             return None
 
-        cursor = self.connection.cursor()
-        safe_id = self._escape_id(id)
         set_clauses = []
+        params = {"id": id}
         if "name" in updates:
-            set_clauses.append(f"name = '{self._escape_string(updates['name'])}'")
+            set_clauses.append("name = :name")
+            params["name"] = updates["name"]
         if "description" in updates:
-            set_clauses.append(f"description = '{self._escape_string(updates['description'] or '')}'")
+            set_clauses.append("description = :description")
+            params["description"] = updates["description"] or ""
         if "type" in updates:
             safe_type = updates["type"].value if hasattr(updates["type"], "value") else updates["type"]
             if safe_type in ["foundation", "custom", "agent"]:
-                set_clauses.append(f"type = '{safe_type}'")
+                set_clauses.append("type = :type")
+                params["type"] = safe_type
         if "isDefault" in updates:
-            set_clauses.append(f"is_default = {str(updates['isDefault']).lower()}")
+            set_clauses.append("is_default = :is_default")
+            params["is_default"] = bool(updates["isDefault"])
         if "domainId" in updates:
-            val = updates["domainId"]
-            domain_val = f"'{self._escape_id(val)}'" if val else "NULL"
-            set_clauses.append(f"domain_id = {domain_val}")
+            set_clauses.append("domain_id = :domain_id")
+            params["domain_id"] = updates["domainId"] or None
 
-        try:
-            if set_clauses:
-                cursor.execute(f"UPDATE endpoints SET {', '.join(set_clauses)} WHERE id = '{safe_id}'")
-            
-            updated_data = endpoint.model_dump()
-            updated_data.update(updates)
-            updated_endpoint = Endpoint(**updated_data)
-            self.memory_cache["endpoints"][id] = updated_endpoint
-            return updated_endpoint
-        finally:
-            cursor.close()
+        def work(cursor: Cursor):
+            cursor.execute(f"UPDATE endpoints SET {', '.join(set_clauses)} WHERE id = :id", params)
+
+        if set_clauses:
+            await self._run(work)
+        
+        updated_data = endpoint.model_dump()
+        updated_data.update(updates)
+        updated_endpoint = Endpoint(**updated_data)
+        self.memory_cache["endpoints"][id] = updated_endpoint
+        return updated_endpoint
 
     async def delete_endpoint(self, id: str) -> bool:
-        cursor = self.connection.cursor()
-        safe_id = self._escape_id(id)
-        try:
-            cursor.execute(f"DELETE FROM endpoints WHERE id = '{safe_id}'")
-            if id in self.memory_cache["endpoints"]:
-                del self.memory_cache["endpoints"][id]
-                return True
-            return False
-        finally:
-            cursor.close()
+        def work(cursor: Cursor):
+            cursor.execute("DELETE FROM endpoints WHERE id = :id", {"id": id})
+
+        await self._run(work)
+        if id in self.memory_cache["endpoints"]:
+            del self.memory_cache["endpoints"][id]
+            return True
+        return False
 
     async def get_config(self) -> Config:
         return self.memory_cache["config"]
@@ -565,5 +994,23 @@ class LakeBaseStorage(IStorage):
         return config
 
     async def close(self):
-        if self.connection:
-            self.connection.close()
+        # Stops a rebuild scan at its next batch. The loop must keep running while the scan
+        # thread finishes, since it waits on the loop to index the batch it holds.
+        self._search_stop.set()
+        if self._search_task:
+            self._search_task.cancel()
+            try:
+                await self._search_task
+            except asyncio.CancelledError:
+                pass
+        if self._search_scan and not self._search_scan.done():
+            try:
+                await self._search_scan
+            except Exception as e:
+                log.warning("Search index scan failed while closing", error=e)
+        await self._message_batcher.flush()
+        await asyncio.to_thread(self._executor.shutdown, True)
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
@@ -0,0 +1,197 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+
+ROOT_LOGGER = "strata"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-subsystem overrides, e.g. "databricks=DEBUG,storage=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "512"))
+# Fraction of sampled (high-volume) debug events that are kept
+DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+def parse_levels(value: str) -> dict[str, str]:
+    levels = {}
+    for item in value.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def truncate(value: Any, limit: int = MAX_FIELD_CHARS) -> Any:
+    """Keep numbers and flags as they are; cut everything else to `limit` characters."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} more chars)"
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; drops them instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Messages carry no %-args and fields are already truncated; only the traceback
+        # has to be rendered here, while the exception is still available.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _subsystem(record: logging.LogRecord) -> str:
+    return record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name
+
+
+def _text_value(value: Any) -> str:
+    text = str(value)
+    return json.dumps(text) if not text or any(c.isspace() or c in '="' for c in text) else text
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        fields = " ".join(f"{key}={_text_value(value)}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{timestamp} {record.levelname} [{_subsystem(record)}] {record.getMessage()}"
+        if fields:
+            line = f"{line} {fields}"
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "subsystem": _subsystem(record),
+            "msg": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class StructuredLogger:
+    """Logger for one subsystem that takes structured fields as keyword arguments.
+
+    Nothing is formatted unless the level is enabled, and `sample=True` events are kept
+    only at LOG_DEBUG_SAMPLE_RATE, so high-volume debug logging stays cheap on hot paths.
+    """
+
+    def __init__(self, subsystem: str):
+        self.subsystem = subsystem
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
+
+    def _log(self, level: int, msg: str, fields: dict, exc_info: bool = False, sample: bool = False):
+        if not self._logger.isEnabledFor(level):
+            return
+        if sample:
+            if random.random() >= DEBUG_SAMPLE_RATE:
+                _state.sampled_out += 1
+                return
+            fields["sample_rate"] = DEBUG_SAMPLE_RATE
+        self._logger.log(
+            level, msg, exc_info=exc_info,
+            extra={"fields": {key: truncate(value) for key, value in fields.items()}}
+        )
+
+    def debug(self, msg: str, sample: bool = False, **fields):
+        self._log(logging.DEBUG, msg, fields, sample=sample)
+
+    def info(self, msg: str, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg: str, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg: str, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg: str, **fields):
+        """Log at ERROR with the active exception's traceback."""
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+class _LoggingState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handler: Optional[NonBlockingQueueHandler] = None
+        self.listener: Optional[QueueListener] = None
+        self.sampled_out = 0
+
+
+_state = _LoggingState()
+
+
+def configure_logging():
+    """Route the "strata" logger tree through a bounded queue to a stdout writer thread."""
+    with _state.lock:
+        if _state.handler is not None:
+            return
+        log_queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        _state.handler = NonBlockingQueueHandler(log_queue)
+        root.addHandler(_state.handler)
+        for subsystem, level in parse_levels(LOG_LEVELS).items():
+            logging.getLogger(f"{ROOT_LOGGER}.{subsystem}").setLevel(level)
+
+        _state.listener = QueueListener(log_queue, output)
+        _state.listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    with _state.lock:
+        if _state.listener is not None:
+            _state.listener.stop()
+            _state.listener = None
+
+
+def get_logger(subsystem: str) -> StructuredLogger:
+    configure_logging()
+    return StructuredLogger(subsystem)
+
+
+def logging_stats() -> dict:
+    return {
+        "level": LOG_LEVEL,
+        "subsystem_levels": parse_levels(LOG_LEVELS),
+        "format": LOG_FORMAT,
+        "debug_sample_rate": DEBUG_SAMPLE_RATE,
+        "queued": _state.handler.queue.qsize() if _state.handler else 0,
+        "dropped": _state.handler.dropped if _state.handler else 0,
+        "sampled_out": _state.sampled_out,
+    }
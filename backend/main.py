@@ -1,6 +1,12 @@
+import asyncio
 import os
+import re
+import json
+import time
 import httpx
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from uuid import uuid4
 from fastapi import FastAPI, HTTPException, Query, Request, Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, StreamingResponse, Response
@@ -9,13 +15,23 @@ from pydantic import BaseModel, ValidationError
 from typing import Optional
 
 from .models import (
-    ChatRequest, ChatResponse, Config, Domain, InsertDomain,
-    Endpoint, InsertEndpoint, Site, Conversation, Message,
+    ChatRequest, ChatResponse, ContextInfo, Config, Domain, InsertDomain,
+    Endpoint, InsertEndpoint, Site, Conversation, ConversationPage, SearchPage, Message,
     InsertMessage, MessageRole, EndpointType
 )
-from .storage import initialize_storage, get_storage, IStorage
+from .storage import initialize_storage, close_storage, get_storage, build_conversation, IStorage
+from .context import ContextWindow, DEFAULT_MAX_MESSAGES, assemble_context, token_budget_for
 from .user_context import UserContext, get_user_context, get_dev_user_context
 from .databricks_client import databricks_client
+from .cache import endpoint_cache, identity_hash
+from .resilience import CircuitOpenError, EndpointError, endpoint_resilience
+from .admission import AdmissionRejectedError, endpoint_admission
+from .response_cache import response_cache
+from .log import get_logger, logging_stats
+from .tracing import Span, tracer
+from .metrics import (
+    chat_in_flight, http_request_duration, register_http_pool, register_storage_pool, registry
+)
 
 
 class UserInfo(BaseModel):
@@ -27,20 +43,94 @@ class UserInfo(BaseModel):
 storage: Optional[IStorage] = None
 http_client: Optional[httpx.AsyncClient] = None
 VITE_DEV_SERVER = "http://127.0.0.1:5173"
+log = get_logger("api")
+chat_log = get_logger("chat")
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global storage, http_client
+    await databricks_client.start()
     storage = await initialize_storage()
+    register_storage_pool(storage)
+    register_http_pool(databricks_client.pool_stats)
     http_client = httpx.AsyncClient(timeout=30.0)
     yield
+    await close_storage()
     await http_client.aclose()
+    await databricks_client.close()
 
 
 app = FastAPI(title="Anglo Strata API", lifespan=lifespan)
 
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so /api/conversations/{id} is one series, not one per id
+        route = request.scope.get("route")
+        if route is not None:
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                method=request.method, route=getattr(route, "path", "unknown"), status=str(status)
+            )
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Assign a request id (honouring a well-formed X-Request-ID) and open the request's root span."""
+    incoming = request.headers.get("X-Request-ID", "")
+    request_id = incoming if REQUEST_ID_PATTERN.match(incoming) else uuid4().hex
+    request.state.request_id = request_id
+
+    root = tracer.start_trace(
+        f"{request.method} {request.url.path}", **{"http.method": request.method, "request.id": request_id}
+    )
+    with tracer.activate(root):
+        try:
+            response = await call_next(request)
+        except BaseException as e:
+            if root:
+                root.record_exception(e)
+                root.end()
+            raise
+    response.headers["X-Request-ID"] = request_id
+    if root is None:
+        return response
+
+    route = request.scope.get("route")
+    if route is not None:
+        root.name = f"{request.method} {route.path}"
+        root.set_attribute("http.route", route.path)
+    root.set_attribute("http.status_code", response.status_code)
+    if response.status_code >= 500:
+        root.status = Span.ERROR
+    # Streaming bodies are still being produced; end the span once the last chunk is sent
+    response.body_iterator = end_span_after(response.body_iterator, root)
+    return response
+
+
+async def end_span_after(body, span: Span):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        span.end()
+
+
+@app.get("/api/metrics")
+async def get_metrics() -> Response:
+    """Prometheus text exposition of request, storage, Databricks and pool metrics."""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/api/domains")
 async def get_domains() -> list[Domain]:
     return await storage.get_domains()
@@ -81,17 +171,25 @@ async def get_current_user(request: Request) -> UserInfo:
     )
 
 
+def user_cache_key(kind: str, user_ctx: UserContext) -> tuple[str, str]:
+    return (kind, identity_hash(user_ctx.email, user_ctx.access_token))
+
+
 @app.get("/api/endpoints")
 async def get_endpoints(request: Request, domainId: str = Query(None)) -> list[Endpoint]:
     user_ctx = get_user_context(request)
     
     if user_ctx.access_token and databricks_client.host:
         try:
-            endpoints = await databricks_client.list_serving_endpoints(user_ctx.access_token)
+            catalog = await endpoint_cache.get_or_load(
+                user_cache_key("catalog", user_ctx),
+                lambda: databricks_client.get_endpoint_catalog(user_ctx.access_token)
+            )
+            endpoints = databricks_client.endpoints_view(catalog)
             if endpoints:
                 return endpoints
         except Exception as e:
-            print(f"Failed to fetch user endpoints: {e}")
+            log.warning("Failed to fetch user endpoints", error=e)
     
     endpoints = await storage.get_endpoints(domainId)
     if endpoints and not any(e.isDefault for e in endpoints):
@@ -104,21 +202,26 @@ async def get_agents(request: Request) -> list[Endpoint]:
     """List available agents from Databricks workspace based on user access."""
     user_ctx = get_user_context(request)
     
-    print(f"[DEBUG] Fetching agents - user_email: {user_ctx.email}, has_token: {bool(user_ctx.access_token)}, databricks_host: {databricks_client.host or 'not set'}")
+    log.debug(
+        "Fetching agents", user_email=user_ctx.email, has_token=bool(user_ctx.access_token),
+        databricks_host=databricks_client.host or "not set"
+    )
     
     if user_ctx.access_token and databricks_client.host:
         try:
-            agents = await databricks_client.list_agents(user_ctx.access_token)
-            print(f"[DEBUG] Found {len(agents)} agents from Databricks")
+            catalog = await endpoint_cache.get_or_load(
+                user_cache_key("catalog", user_ctx),
+                lambda: databricks_client.get_endpoint_catalog(user_ctx.access_token)
+            )
+            agents = databricks_client.agents_view(catalog)
+            log.debug("Found agents from Databricks", count=len(agents))
             return agents
         except Exception as e:
-            print(f"[DEBUG] Failed to fetch agents: {e}")
-    else:
-        print(f"[DEBUG] Skipping Databricks - access_token: {bool(user_ctx.access_token)}, host: {bool(databricks_client.host)}")
+            log.warning("Failed to fetch agents", error=e)
     
     all_endpoints = await storage.get_endpoints()
     agents = [e for e in all_endpoints if e.type.value == "agent"]
-    print(f"[DEBUG] Returning {len(agents)} agents from storage")
+    log.debug("Returning agents from storage", count=len(agents))
     return agents
 
 
@@ -129,24 +232,100 @@ async def get_debug_config(request: Request) -> dict:
     return {
         "databricks_host": databricks_client.host or "not configured",
         "databricks_configured": databricks_client.is_configured(),
+        "service_principal_token": databricks_client.sp_tokens.status(),
         "user_email": user_ctx.email,
         "has_access_token": bool(user_ctx.access_token),
         "is_authenticated": user_ctx.is_authenticated,
-        "storage_type": type(storage).__name__ if storage else "not initialized"
+        "storage_type": storage.backend_name if storage else "not initialized"
     }
 
 
+@app.get("/api/debug/http-pool")
+async def get_http_pool_stats() -> dict:
+    """Databricks HTTP connection pool utilisation."""
+    return databricks_client.pool_stats()
+
+
+@app.get("/api/debug/logging")
+async def get_logging_stats() -> dict:
+    """Log levels, sampling and queue drops of the structured logger."""
+    return logging_stats()
+
+
+@app.get("/api/debug/tracing")
+async def get_tracing_stats() -> dict:
+    """Whether traces are exported, and how many were written or dropped."""
+    return tracer.stats()
+
+
+@app.get("/api/debug/archive")
+async def get_archive_stats() -> dict:
+    """Message archiving and partition maintenance of the active storage backend."""
+    archiver = getattr(storage, "archiver", None)
+    return archiver.stats() if archiver else {"enabled": False}
+
+
+@app.get("/api/debug/compression")
+async def get_compression_stats() -> dict:
+    """Message compression and per-domain dictionaries of the active storage backend."""
+    dictionaries = getattr(storage, "dictionaries", None)
+    return dictionaries.stats() if dictionaries else {"enabled": False}
+
+
+@app.get("/api/debug/search")
+async def get_search_stats() -> dict:
+    """Size of the in-process search index (MemStorage and the SQL warehouse backend)."""
+    search_index = getattr(storage, "search_index", None)
+    return {"enabled": True, **search_index.stats()} if search_index else {"enabled": False}
+
+
+@app.get("/api/debug/storage-cache")
+async def get_storage_cache_stats() -> dict:
+    """Hit rates of the conversation cache in front of database backends."""
+    cache_stats = getattr(storage, "cache_stats", None)
+    return cache_stats() if cache_stats else {"enabled": False}
+
+
+@app.get("/api/debug/admission")
+async def get_admission_stats() -> list[dict]:
+    """In-flight calls, queue depth and wait times per serving endpoint."""
+    return endpoint_admission.snapshot()
+
+
+@app.get("/api/debug/response-cache")
+async def get_response_cache_stats() -> dict:
+    """Hit rates of the opt-in chat response cache."""
+    return response_cache.stats()
+
+
+@app.get("/api/debug/endpoint-cache")
+async def get_endpoint_cache_stats() -> dict:
+    """Hit/miss counters for the per-user serving-endpoint listing cache."""
+    return endpoint_cache.stats()
+
+
+@app.get("/api/endpoints/health")
+async def get_endpoints_health() -> list[dict]:
+    """Circuit breaker state, retry counts and latency percentiles per serving endpoint."""
+    return endpoint_resilience.snapshot()
+
+
 @app.post("/api/endpoints/refresh")
 async def refresh_endpoints(request: Request) -> list[Endpoint]:
     user_ctx = get_user_context(request)
     
     if user_ctx.access_token and databricks_client.host:
         try:
-            endpoints = await databricks_client.list_serving_endpoints(user_ctx.access_token)
+            catalog = await endpoint_cache.get_or_load(
+                user_cache_key("catalog", user_ctx),
+                lambda: databricks_client.get_endpoint_catalog(user_ctx.access_token),
+                bypass=True
+            )
+            endpoints = databricks_client.endpoints_view(catalog)
             if endpoints:
                 return endpoints
         except Exception as e:
-            print(f"Failed to refresh user endpoints: {e}")
+            log.warning("Failed to refresh user endpoints", error=e)
     
     endpoints = await storage.refresh_endpoints_from_databricks()
     return endpoints
@@ -178,6 +357,35 @@ async def get_conversations(request: Request) -> list[Conversation]:
     return await storage.get_conversations(user_ctx.email)
 
 
+@app.get("/api/conversations/summaries")
+async def get_conversation_summaries(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None)
+) -> ConversationPage:
+    """Lightweight sidebar listing: conversation metadata without messages."""
+    user_ctx = get_user_context(request)
+    try:
+        return await storage.get_conversation_summaries(user_ctx.email, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/conversations/search")
+async def search_conversations(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = Query(None)
+) -> SearchPage:
+    """Full-text search over the user's conversation history, best matches first."""
+    user_ctx = get_user_context(request)
+    try:
+        return await storage.search_conversations(user_ctx.email, q, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/api/conversations/{id}")
 async def get_conversation(id: str) -> Conversation:
     conversation = await storage.get_conversation(id)
@@ -194,84 +402,305 @@ async def delete_conversation(id: str):
     return {"success": True}
 
 
-@app.post("/api/chat")
-async def chat(http_request: Request, request: ChatRequest) -> ChatResponse:
-    user_ctx = get_user_context(http_request)
-    
-    endpoint = await storage.get_endpoint(request.endpointId)
-    domain = await storage.get_domain(request.domainId or "generic")
-    site = await storage.get_site(request.siteId or "all-sites")
+@dataclass
+class ChatTurn:
+    conversation_id: str
+    new_conversation: Optional[Conversation]
+    user_message: InsertMessage
+    domain_id: str
+    endpoint_name: str
+    domain_name: str
+    site_name: str
+    context: ContextWindow
+    total_messages: int
+    user_token: Optional[str]
+    user_key: str
+    can_call_databricks: bool
+
+    @property
+    def messages(self) -> list[dict]:
+        return self.context.messages
+
+    @property
+    def conversation_context(self) -> list[dict]:
+        return self.context.history
+
+    def context_info(self) -> ContextInfo:
+        return ContextInfo(
+            includedMessages=self.context.included_messages,
+            totalMessages=self.total_messages,
+            estimatedTokens=self.context.estimated_tokens,
+            tokenBudget=self.context.token_budget,
+            truncated=self.context.truncated
+        )
+
+
+async def prepare_chat_turn(request: ChatRequest, user_ctx: UserContext) -> ChatTurn:
+    """Resolve endpoint/domain/site and assemble a token-budgeted context window.
+
+    Only the newest CHAT_CONTEXT_MAX_MESSAGES messages are read from storage.
+    Nothing is written here; the whole turn is persisted by `record_turn` once the
+    assistant response is known.
+    """
+    with tracer.span("chat.lookup", **{"chat.endpoint_id": request.endpointId}):
+        endpoint = await storage.get_endpoint(request.endpointId)
+        domain = await storage.get_domain(request.domainId or "generic")
+        site = await storage.get_site(request.siteId or "all-sites")
 
+    new_conversation = None
+    history: list[Message] = []
+    total_messages = 0
     if request.conversationId:
-        conversation = await storage.get_conversation(request.conversationId)
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
+        with tracer.span("chat.load_conversation", **{"chat.conversation_id": request.conversationId}) as span:
+            summary = await storage.get_conversation_summary(request.conversationId)
+            if not summary:
+                raise HTTPException(status_code=404, detail="Conversation not found")
+            conversation_id = summary.id
+            total_messages = summary.messageCount
+            if total_messages:
+                history = await storage.get_recent_messages(conversation_id, DEFAULT_MAX_MESSAGES)
+            span.set_attribute("chat.messages_loaded", len(history))
     else:
         title = request.message[:50] + ("..." if len(request.message) > 50 else "")
-        conversation = await storage.create_conversation(
+        new_conversation = build_conversation(
             request.endpointId, title, request.domainId, request.siteId, user_ctx.email
         )
+        conversation_id = new_conversation.id
 
-    conversation_context = [
-        {"role": msg.role.value, "content": msg.content}
-        for msg in conversation.messages
-    ]
+    site_context = f" Focus on data and context specific to {site.name} ({site.location})." if site and site.id != "all-sites" else ""
+    system_prompt = (domain.systemPrompt if domain else "You are a helpful AI assistant.") + site_context
 
-    await storage.add_message(
-        conversation.id,
-        InsertMessage(role=MessageRole.user, content=request.message, timestamp=int(__import__("time").time() * 1000))
+    with tracer.span("chat.assemble_context") as span:
+        context = assemble_context(
+            system_prompt, history, request.message, token_budget_for(endpoint), total_messages
+        )
+        span.set_attribute("chat.context_messages", context.included_messages)
+        span.set_attribute("chat.context_tokens", context.estimated_tokens)
+        span.set_attribute("chat.context_truncated", context.truncated)
+
+    user_token = user_ctx.access_token
+    return ChatTurn(
+        conversation_id=conversation_id,
+        new_conversation=new_conversation,
+        user_message=InsertMessage(role=MessageRole.user, content=request.message, timestamp=int(time.time() * 1000)),
+        domain_id=request.domainId or "generic",
+        endpoint_name=endpoint.name if endpoint else request.endpointId,
+        domain_name=domain.name if domain else "General",
+        site_name=site.name if site else "All Sites",
+        context=context,
+        total_messages=total_messages,
+        user_token=user_token,
+        user_key=identity_hash(user_ctx.email, user_token),
+        can_call_databricks=bool(databricks_client.host and (user_token or databricks_client.is_configured())),
     )
 
-    site_context = f" Focus on data and context specific to {site.name} ({site.location})." if site and site.id != "all-sites" else ""
-    system_prompt = (domain.systemPrompt if domain else "You are a helpful AI assistant.") + site_context
 
-    endpoint_name = endpoint.name if endpoint else request.endpointId
-    # Use endpoint ID directly - real endpoints from Databricks have the correct names
-    # Only strip "databricks-" prefix for legacy default endpoints
-    databricks_endpoint_name = request.endpointId
+async def record_turn(turn: ChatTurn, ai_response: str) -> Message:
+    """Store the user and assistant messages (and a new conversation) in one storage call.
+
+    Shielded, so a client disconnecting mid-write does not drop the answered turn.
+    """
+    with tracer.span("chat.record_turn", **{"chat.new_conversation": turn.new_conversation is not None}):
+        messages = await asyncio.shield(storage.record_chat_turn(
+            turn.conversation_id,
+            [
+                turn.user_message,
+                InsertMessage(role=MessageRole.assistant, content=ai_response, timestamp=int(time.time() * 1000)),
+            ],
+            turn.new_conversation
+        ))
+    return messages[-1]
+
+
+async def record_unanswered_turn(turn: ChatTurn):
+    """Store the user message (and a new conversation) of a turn that got no answer.
+
+    Shielded, so the write completes even when the request is cancelled because the
+    client went away; a failure is logged so it never hides the original error.
+    """
+    try:
+        with tracer.span("chat.record_unanswered_turn", **{"chat.new_conversation": turn.new_conversation is not None}):
+            await asyncio.shield(
+                storage.record_chat_turn(turn.conversation_id, [turn.user_message], turn.new_conversation)
+            )
+    except Exception as e:
+        chat_log.error("Failed to store the user message of an unanswered turn", conversation_id=turn.conversation_id, error=e)
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        *conversation_context,
-        {"role": "user", "content": request.message}
-    ]
 
-    user_token = user_ctx.access_token
-    can_call_databricks = databricks_client.host and (user_token or databricks_client.is_configured())
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(http_request: Request, request: ChatRequest) -> Response:
+    with chat_in_flight.track(mode="sync"):
+        response = await answer_chat(http_request, request)
+    # Serialized here rather than by FastAPI so the cost shows up in the trace
+    with tracer.span("chat.serialize"):
+        body = response.model_dump_json()
+    return Response(body, media_type="application/json")
+
+
+async def answer_chat(http_request: Request, request: ChatRequest) -> ChatResponse:
+    user_ctx = get_user_context(http_request)
+    turn = await prepare_chat_turn(request, user_ctx)
+    # Use endpoint ID directly - real endpoints from Databricks have the correct names
+    databricks_endpoint_name = request.endpointId
     
-    print(f"[CHAT] Endpoint: {databricks_endpoint_name}, Host: {databricks_client.host}, HasUserToken: {bool(user_token)}, IsConfigured: {databricks_client.is_configured()}, CanCall: {can_call_databricks}")
+    chat_log.debug(
+        "Chat request", request_id=user_ctx.request_id, endpoint=databricks_endpoint_name,
+        has_user_token=bool(turn.user_token), can_call=turn.can_call_databricks
+    )
     
-    if can_call_databricks:
-        try:
-            print(f"[CHAT] Calling Databricks endpoint: {databricks_endpoint_name}")
-            ai_response = await databricks_client.call_serving_endpoint(
-                databricks_endpoint_name, 
-                messages, 
-                user_token
-            )
-            print(f"[CHAT] Databricks response received ({len(ai_response)} chars)")
-        except Exception as e:
-            print(f"[CHAT] Databricks API error: {e}")
+    try:
+        ai_response = None
+        if turn.can_call_databricks:
+            ai_response = response_cache.get(databricks_endpoint_name, turn.user_key, turn.domain_id, turn.messages)
+            if ai_response is not None:
+                chat_log.debug("Response cache hit", request_id=user_ctx.request_id, endpoint=databricks_endpoint_name)
+                tracer.current_span().set_attribute("chat.response_cache_hit", True)
+        if turn.can_call_databricks and ai_response is None:
+            try:
+                chat_log.debug("Calling Databricks endpoint", endpoint=databricks_endpoint_name)
+                ai_response = await databricks_client.call_serving_endpoint(
+                    databricks_endpoint_name, 
+                    turn.messages, 
+                    turn.user_token,
+                    turn.user_key
+                )
+                chat_log.debug("Databricks response received", endpoint=databricks_endpoint_name, chars=len(ai_response))
+                response_cache.put(databricks_endpoint_name, turn.user_key, turn.domain_id, turn.messages, ai_response)
+            except EndpointError as e:
+                chat_log.warning(
+                    "Databricks API error", request_id=user_ctx.request_id, endpoint=databricks_endpoint_name,
+                    status=e.status_code, error=e
+                )
+                raise endpoint_http_error(e)
+            except Exception as e:
+                chat_log.error(
+                    "Databricks call failed, using mock response", request_id=user_ctx.request_id,
+                    endpoint=databricks_endpoint_name, error=e
+                )
+
+        if ai_response is None:
             ai_response = generate_mock_response(
-                request.message, endpoint_name,
-                domain.name if domain else "General",
-                site.name if site else "All Sites",
-                conversation_context
+                request.message, turn.endpoint_name, turn.domain_name, turn.site_name,
+                turn.conversation_context
             )
-    else:
-        ai_response = generate_mock_response(
-            request.message, endpoint_name,
-            domain.name if domain else "General",
-            site.name if site else "All Sites",
-            conversation_context
-        )
+    except BaseException:
+        # Endpoint errors and cancellation must not lose the user's message
+        await record_unanswered_turn(turn)
+        raise
+
+    assistant_message = await record_turn(turn, ai_response)
 
-    assistant_message = await storage.add_message(
-        conversation.id,
-        InsertMessage(role=MessageRole.assistant, content=ai_response, timestamp=int(__import__("time").time() * 1000))
+    return ChatResponse(
+        message=assistant_message,
+        conversationId=turn.conversation_id,
+        context=turn.context_info()
     )
 
-    return ChatResponse(message=assistant_message, conversationId=conversation.id)
+
+def endpoint_http_error(error: EndpointError) -> HTTPException:
+    """503 with Retry-After while the endpoint is unavailable, saturated or rate limited, 502 otherwise."""
+    if isinstance(error, (CircuitOpenError, AdmissionRejectedError)) or error.status_code == 429:
+        headers = {"Retry-After": str(max(int(error.retry_after or 1), 1))}
+        return HTTPException(status_code=503, detail=str(error), headers=headers)
+    return HTTPException(status_code=502, detail=str(error))
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(http_request: Request, request: ChatRequest) -> StreamingResponse:
+    """Streaming variant of /api/chat that relays token deltas as Server-Sent Events.
+
+    Emits a `conversation` event with the conversation id, one `delta` event per
+    chunk, and a final `done` event carrying the persisted assistant message.
+    """
+    user_ctx = get_user_context(http_request)
+    turn = await prepare_chat_turn(request, user_ctx)
+    databricks_endpoint_name = request.endpointId
+
+    async def event_stream():
+        with chat_in_flight.track(mode="stream"):
+            async for event in stream_events():
+                yield event
+
+    async def stream_events():
+        # The conversation id is announced before the answer exists; whatever happens
+        # next (endpoint error, client disconnect), the turn's user message is stored
+        recorded = False
+        try:
+            yield format_sse("conversation", {"conversationId": turn.conversation_id})
+
+            chunks: list[str] = []
+            cached = response_cache.get(databricks_endpoint_name, turn.user_key, turn.domain_id, turn.messages) if turn.can_call_databricks else None
+            if cached is not None:
+                chat_log.debug("Response cache hit", request_id=user_ctx.request_id, endpoint=databricks_endpoint_name)
+                tracer.current_span().set_attribute("chat.response_cache_hit", True)
+                chunks.append(cached)
+                yield format_sse("delta", {"content": cached})
+            elif turn.can_call_databricks:
+                # Not a `with` block: the span stays open across yields to the client
+                span = tracer.start_span("databricks.stream", **{"databricks.endpoint": databricks_endpoint_name})
+                try:
+                    chat_log.debug("Streaming Databricks endpoint", request_id=user_ctx.request_id, endpoint=databricks_endpoint_name)
+                    async for delta in databricks_client.stream_serving_endpoint(
+                        databricks_endpoint_name, turn.messages, turn.user_token, turn.user_key
+                    ):
+                        chunks.append(delta)
+                        yield format_sse("delta", {"content": delta})
+                    response_cache.put(databricks_endpoint_name, turn.user_key, turn.domain_id, turn.messages, "".join(chunks))
+                except EndpointError as e:
+                    span.record_exception(e)
+                    chat_log.warning(
+                        "Databricks streaming error", request_id=user_ctx.request_id, endpoint=databricks_endpoint_name,
+                        status=e.status_code, error=e
+                    )
+                    if not chunks:
+                        error = endpoint_http_error(e)
+                        yield format_sse("error", {"message": error.detail, "status": error.status_code})
+                        return
+                    yield format_sse("error", {"message": "Response stream was interrupted"})
+                except Exception as e:
+                    span.record_exception(e)
+                    chat_log.error(
+                        "Databricks streaming failed", request_id=user_ctx.request_id,
+                        endpoint=databricks_endpoint_name, error=e
+                    )
+                    if chunks:
+                        yield format_sse("error", {"message": "Response stream was interrupted"})
+                finally:
+                    span.set_attribute("databricks.chunks", len(chunks))
+                    span.end()
+
+            if not chunks:
+                mock_response = generate_mock_response(
+                    request.message, turn.endpoint_name, turn.domain_name, turn.site_name,
+                    turn.conversation_context
+                )
+                chunks.append(mock_response)
+                yield format_sse("delta", {"content": mock_response})
+
+            # Set first: if the client leaves now, the shielded write still completes
+            recorded = True
+            assistant_message = await record_turn(turn, "".join(chunks))
+            response = ChatResponse(
+                message=assistant_message,
+                conversationId=turn.conversation_id,
+                context=turn.context_info()
+            )
+            with tracer.span("chat.serialize"):
+                done = format_sse("done", response.model_dump(mode="json"))
+            yield done
+        finally:
+            if not recorded:
+                await record_unanswered_turn(turn)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/api/config")
@@ -0,0 +1,285 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+
+from .log import get_logger
+from .storage import DelegatingStorage, IStorage
+from .tracing import tracer
+
+log = get_logger("metrics")
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[LabelValues, float] = {}
+        self._callbacks: list[Callable[[], Iterable[tuple[dict[str, str], float]]]] = []
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """Count the enclosed block as in progress."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def collect_with(self, callback: Callable[[], Iterable[tuple[dict[str, str], float]]]):
+        """Register a callback that yields (labels, value) pairs at scrape time."""
+        self._callbacks.append(callback)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        for callback in self._callbacks:
+            try:
+                for labels, value in callback():
+                    values[self._key(labels)] = value
+            except Exception as e:
+                log.warning("Collecting metric failed", metric=self.name, error=e)
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts (non-cumulative, last slot is +Inf), sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, ([*s[0]], s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "strata_http_request_duration_seconds",
+    "Time until the response starts, by route template.",
+    ("method", "route", "status")
+)
+storage_operation_duration = registry.histogram(
+    "strata_storage_operation_duration_seconds",
+    "IStorage method latency by backend.",
+    ("backend", "operation", "outcome")
+)
+db_statements = registry.counter(
+    "strata_db_statements_total",
+    "SQL statements sent to the database, by storage backend.",
+    ("backend",)
+)
+databricks_request_duration = registry.histogram(
+    "strata_databricks_request_duration_seconds",
+    "Databricks workspace call latency until response headers, by serving endpoint or API path.",
+    ("endpoint", "status")
+)
+token_refresh_duration = registry.histogram(
+    "strata_token_refresh_duration_seconds",
+    "OAuth token fetch latency.",
+    ("token", "outcome")
+)
+conversation_archive = registry.counter(
+    "strata_conversation_archive_total",
+    "Conversations whose messages moved to (archive) or back from (rehydrate) the message archive.",
+    ("backend", "direction")
+)
+storage_cache = registry.counter(
+    "strata_storage_cache_total",
+    "Conversation cache lookups by read (hit, miss) and dropped entries (invalidate, local or remote).",
+    ("operation", "result")
+)
+chat_in_flight = registry.gauge(
+    "strata_chat_in_flight",
+    "Chat requests currently being answered.",
+    ("mode",)
+)
+storage_pool = registry.gauge(
+    "strata_storage_pool_connections",
+    "Database connection pool utilisation of the active storage backend.",
+    ("backend", "state")
+)
+http_pool = registry.gauge(
+    "strata_databricks_http_pool_connections",
+    "Databricks HTTP client pool utilisation.",
+    ("state",)
+)
+
+
+class InstrumentedStorage(DelegatingStorage):
+    """Times and traces every IStorage call so all backends report the same series."""
+
+    async def _call(self, operation: str, *args, **kwargs):
+        backend = self.backend_name
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracer.span(f"storage.{operation}", **{"db.backend": backend}):
+                result = await super()._call(operation, *args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            storage_operation_duration.observe(
+                time.perf_counter() - started, backend=backend, operation=operation, outcome=outcome
+            )
+
+
+def register_storage_pool(storage: IStorage):
+    def collect():
+        backend = storage.backend_name
+        for state, value in storage.pool_stats().items():
+            yield {"backend": backend, "state": state}, value
+
+    storage_pool.collect_with(collect)
+
+
+def register_http_pool(stats: Callable[[], dict]):
+    def collect():
+        current = stats()
+        for state in ("in_use", "idle", "waiters", "max_connections"):
+            yield {"state": state}, current.get(state, 0)
+
+    http_pool.collect_with(collect)
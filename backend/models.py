@@ -34,6 +34,40 @@ class Conversation(BaseModel):
     updatedAt: int
 
 
+class ConversationSummary(BaseModel):
+    id: str
+    title: str
+    endpointId: str
+    domainId: Optional[str] = None
+    siteId: Optional[str] = None
+    updatedAt: int
+    messageCount: int
+
+
+class ConversationPage(BaseModel):
+    items: list[ConversationSummary]
+    nextCursor: Optional[str] = None
+
+
+class SearchResult(BaseModel):
+    """A conversation matching a search, represented by its best matching message."""
+    conversationId: str
+    conversationTitle: str
+    messageId: str
+    role: MessageRole
+    snippet: str
+    # [start, end) character offsets of the matched words within snippet
+    highlights: list[tuple[int, int]]
+    timestamp: int
+    matches: int
+    rank: float
+
+
+class SearchPage(BaseModel):
+    items: list[SearchResult]
+    nextCursor: Optional[str] = None
+
+
 class Domain(BaseModel):
     id: str
     name: str
@@ -69,6 +103,7 @@ class Endpoint(BaseModel):
     type: EndpointType
     isDefault: bool
     domainId: Optional[str] = None
+    contextTokenBudget: Optional[int] = None
 
 
 class InsertEndpoint(BaseModel):
@@ -77,6 +112,7 @@ class InsertEndpoint(BaseModel):
     type: EndpointType
     isDefault: bool
     domainId: Optional[str] = None
+    contextTokenBudget: Optional[int] = None
 
 
 class ChatRequest(BaseModel):
@@ -87,9 +123,18 @@ class ChatRequest(BaseModel):
     siteId: Optional[str] = None
 
 
+class ContextInfo(BaseModel):
+    includedMessages: int
+    totalMessages: int
+    estimatedTokens: int
+    tokenBudget: int
+    truncated: bool
+
+
 class ChatResponse(BaseModel):
     message: Message
     conversationId: str
+    context: Optional[ContextInfo] = None
 
 
 class Config(BaseModel):
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import json
 from typing import Optional
 from uuid import uuid4
@@ -6,10 +7,21 @@ import time
 import asyncpg
 
 from .models import (
-    Message, InsertMessage, Conversation, Domain, InsertDomain,
-    Site, Endpoint, InsertEndpoint, Config, MessageRole, EndpointType
+    Message, InsertMessage, Conversation, ConversationSummary, ConversationPage, SearchPage,
+    Domain, InsertDomain, Site, Endpoint, InsertEndpoint, Config, MessageRole, EndpointType
 )
-from .storage import IStorage
+from .storage import IStorage, decode_cursor, build_conversation_page
+from .log import get_logger
+from .archive import (
+    MessageArchiver, create_partition_sql, pack_messages, parse_partition_name,
+    partition_bounds, unpack_messages, upcoming_months
+)
+from .compression import DictionaryTrainer, MessageCodec
+from .metrics import conversation_archive, db_statements
+from .migrations import MESSAGE_SEARCH_MIGRATION, migrate_asyncpg
+from .search import build_search_page, build_search_result, decode_search_cursor, query_terms
+
+log = get_logger("storage.postgres")
 
 
 def get_postgres_url() -> Optional[str]:
@@ -32,6 +44,14 @@ class PostgresStorage(IStorage):
     def __init__(self, database_url: str):
         self.database_url = database_url
         self.pool: Optional[asyncpg.Pool] = None
+        self.archiver = MessageArchiver(
+            "PostgresStorage", self._archive_cold_conversations, self._maintain_message_partitions
+        )
+        self.codec = MessageCodec()
+        self.dictionaries = DictionaryTrainer(
+            "PostgresStorage", self.codec, lambda: list(self.memory_cache["domains"]),
+            self._load_dictionaries, self._dictionary_samples, self._store_dictionary
+        )
         self.memory_cache = {
             "domains": {},
             "sites": {},
@@ -41,10 +61,36 @@ class PostgresStorage(IStorage):
 
     async def initialize(self):
         """Initialize connection pool and create tables."""
-        self.pool = await asyncpg.create_pool(self.database_url, min_size=1, max_size=10)
+        self.pool = await asyncpg.create_pool(
+            self.database_url, min_size=1, max_size=10, init=self._init_connection
+        )
         await self._create_tables()
         await self._initialize_defaults()
-        print("PostgreSQL storage initialized successfully")
+        self.archiver.start()
+        self.dictionaries.start()
+        log.info("PostgreSQL storage initialized")
+
+    @staticmethod
+    async def _init_connection(conn: asyncpg.Connection):
+        # Query loggers need asyncpg >= 0.29; older versions simply report no statements
+        if hasattr(conn, "add_query_logger"):
+            conn.add_query_logger(lambda record: db_statements.inc(backend="PostgresStorage"))
+
+    async def close(self):
+        await self.archiver.close()
+        await self.dictionaries.close()
+        if self.pool:
+            await self.pool.close()
+
+    def pool_stats(self) -> dict[str, int]:
+        if not self.pool:
+            return {}
+        size, idle = self.pool.get_size(), self.pool.get_idle_size()
+        return {"max": self.pool.get_max_size(), "open": size, "idle": idle, "in_use": size - idle}
+
+    async def connect_listener(self) -> asyncpg.Connection:
+        """A dedicated connection outside the pool, for the conversation cache's LISTEN/NOTIFY."""
+        return await asyncpg.connect(self.database_url)
 
     async def _create_tables(self):
         async with self.pool.acquire() as conn:
@@ -70,16 +116,28 @@ class PostgresStorage(IStorage):
                     timestamp BIGINT NOT NULL
                 )
             """)
-            
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_conversations_user_email 
-                ON conversations(user_email)
-            """)
-            
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_messages_conversation_id 
-                ON messages(conversation_id)
-            """)
+
+            # Indexes and later columns are versioned in migrations.py
+            if MESSAGE_SEARCH_MIGRATION in await migrate_asyncpg(conn):
+                await self._vectorize_compressed_messages(conn)
+
+    async def _vectorize_compressed_messages(self, conn):
+        """Compute the search vector of messages compressed before search was added."""
+        while True:
+            rows = await conn.fetch(
+                """SELECT id, role, content, timestamp, codec, content_blob FROM messages
+                   WHERE search_vector IS NULL AND codec IS NOT NULL
+                   LIMIT 500"""
+            )
+            if not rows:
+                return
+            messages = await self._messages_from_rows(conn, rows)
+            await conn.execute(
+                """UPDATE messages m SET search_vector = to_tsvector('english', v.content)
+                   FROM unnest($1::text[], $2::text[]) AS v(id, content)
+                   WHERE m.id = v.id""",
+                [m.id for m in messages], [m.content for m in messages]
+            )
 
     async def _initialize_defaults(self):
         """Initialize default domains, sites, and endpoints in memory."""
@@ -132,9 +190,9 @@ class PostgresStorage(IStorage):
                 self.memory_cache["endpoints"].clear()
                 for endpoint in db_endpoints:
                     self.memory_cache["endpoints"][endpoint.id] = endpoint
-                print(f"Loaded {len(db_endpoints)} endpoints from Databricks")
+                log.info("Loaded endpoints from Databricks", count=len(db_endpoints))
         except Exception as e:
-            print(f"Error refreshing endpoints from Databricks: {e}")
+            log.warning("Error refreshing endpoints from Databricks", error=e)
             
         return list(self.memory_cache["endpoints"].values())
 
@@ -148,13 +206,18 @@ class PostgresStorage(IStorage):
             else:
                 rows = await conn.fetch("SELECT * FROM conversations ORDER BY updated_at DESC")
             
+            messages_by_conversation = await self._get_messages_for(conn, [row['id'] for row in rows])
+            # Listing everything reads archived messages in place rather than rehydrating them
+            archived = await self._get_archived_messages_for(conn, [row['id'] for row in rows if row['archived_at']])
+            for conversation_id, messages in archived.items():
+                merged = messages + messages_by_conversation.get(conversation_id, [])
+                messages_by_conversation[conversation_id] = sorted(merged, key=lambda m: m.timestamp)
             conversations = []
             for row in rows:
-                messages = await self._get_messages(conn, row['id'])
                 conversations.append(Conversation(
                     id=row['id'],
                     title=row['title'],
-                    messages=messages,
+                    messages=messages_by_conversation.get(row['id'], []),
                     endpointId=row['endpoint_id'],
                     domainId=row['domain_id'],
                     siteId=row['site_id'],
@@ -169,22 +232,267 @@ class PostgresStorage(IStorage):
             "SELECT * FROM messages WHERE conversation_id = $1 ORDER BY timestamp ASC",
             conversation_id
         )
+        return await self._messages_from_rows(conn, rows)
+
+    async def _messages_from_rows(self, conn, rows) -> list[Message]:
+        """Messages from rows of the messages table, decompressing content stored compressed."""
+        missing = {
+            id for id in (self.codec.dictionary_id(row['codec']) for row in rows)
+            if id and not self.codec.has_dictionary(id)
+        }
+        if missing:
+            # Trained by another instance since this one last loaded dictionaries
+            await self._fetch_dictionaries(conn, list(missing))
         return [
             Message(
                 id=row['id'],
                 role=MessageRole(row['role']),
-                content=row['content'],
+                content=self.codec.decode(row['content'], row['codec'], row['content_blob']),
                 timestamp=row['timestamp']
             )
             for row in rows
         ]
 
+    def _message_columns(self, messages: list[Message], domain_id: Optional[str]) -> tuple[list, ...]:
+        """Arrays to unnest() into messages, with long contents compressed.
+
+        The last array repeats the text of compressed messages only, since their stored
+        content is empty and the search vector must still be computed from it.
+        """
+        encoded = [self.codec.encode(m.content, domain_id) for m in messages]
+        return (
+            [m.id for m in messages],
+            [m.role.value for m in messages],
+            [content for content, _, _ in encoded],
+            [m.timestamp for m in messages],
+            [codec for _, codec, _ in encoded],
+            [blob for _, _, blob in encoded],
+            [m.content if codec else None for m, (_, codec, _) in zip(messages, encoded)],
+        )
+
+    async def _get_messages_for(self, conn, conversation_ids: list[str]) -> dict[str, list[Message]]:
+        """Fetch messages for many conversations in one query, grouped by conversation."""
+        grouped: dict[str, list[Message]] = {}
+        if not conversation_ids:
+            return grouped
+        rows = await conn.fetch(
+            "SELECT * FROM messages WHERE conversation_id = ANY($1::text[]) ORDER BY conversation_id, timestamp ASC",
+            conversation_ids
+        )
+        for row, message in zip(rows, await self._messages_from_rows(conn, rows)):
+            grouped.setdefault(row['conversation_id'], []).append(message)
+        return grouped
+
+    async def _get_archived_messages_for(self, conn, conversation_ids: list[str]) -> dict[str, list[Message]]:
+        if not conversation_ids:
+            return {}
+        rows = await conn.fetch(
+            "SELECT conversation_id, payload FROM message_archive WHERE conversation_id = ANY($1::text[])",
+            conversation_ids
+        )
+        return {row['conversation_id']: unpack_messages(row['payload']) for row in rows}
+
+    async def _rehydrate(self, conn, conversation_id: str) -> bool:
+        """Move an archived conversation's messages back into messages; False if it was not archived."""
+        async with conn.transaction():
+            payload = await conn.fetchval(
+                "DELETE FROM message_archive WHERE conversation_id = $1 RETURNING payload", conversation_id
+            )
+            if payload is None:
+                return False
+            messages = unpack_messages(payload)
+            # The insert trigger counts the restored messages again, so take them off first
+            await conn.execute(
+                """WITH restored AS (
+                       INSERT INTO messages (id, conversation_id, role, content, timestamp, codec, content_blob, search_vector)
+                       SELECT m.id, $1, m.role, m.content, m.timestamp, m.codec, m.content_blob,
+                              to_tsvector('english', COALESCE(m.search_text, m.content))
+                       FROM unnest($3::text[], $4::text[], $5::text[], $6::bigint[], $7::text[], $8::bytea[], $9::text[])
+                           AS m(id, role, content, timestamp, codec, content_blob, search_text)
+                   )
+                   UPDATE conversations SET archived_at = NULL, message_count = message_count - $2 WHERE id = $1""",
+                conversation_id, len(messages),
+                *self._message_columns(messages, self.codec.domain_of(conversation_id))
+            )
+        conversation_archive.inc(backend="PostgresStorage", direction="rehydrate")
+        return True
+
+    async def _fetch_dictionaries(self, conn, ids: Optional[list[int]] = None):
+        if ids is None:
+            rows = await conn.fetch("SELECT id, domain_id, codec, dictionary FROM compression_dictionaries ORDER BY id")
+        else:
+            rows = await conn.fetch(
+                "SELECT id, domain_id, codec, dictionary FROM compression_dictionaries WHERE id = ANY($1::int[])", ids
+            )
+        for row in rows:
+            self.codec.add_dictionary(row['id'], row['domain_id'], row['codec'], row['dictionary'])
+
+    async def _load_dictionaries(self):
+        async with self.pool.acquire() as conn:
+            await self._fetch_dictionaries(conn)
+
+    async def _dictionary_samples(self, domain_id: str, limit: int) -> list[str]:
+        """Up to `limit` long messages of a domain's conversations, to train its dictionary on."""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """SELECT m.id, m.role, m.content, m.timestamp, m.codec, m.content_blob
+                   FROM messages m JOIN conversations c ON c.id = m.conversation_id
+                   WHERE c.domain_id = $1 AND (m.codec IS NOT NULL OR octet_length(m.content) >= $2)
+                   LIMIT $3""",
+                domain_id, self.codec.min_bytes, limit
+            )
+            return [m.content for m in await self._messages_from_rows(conn, rows)]
+
+    async def _store_dictionary(self, domain_id: str, algorithm: str, data: bytes, samples: int) -> int:
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(
+                """INSERT INTO compression_dictionaries (domain_id, codec, dictionary, samples, created_at)
+                   VALUES ($1, $2, $3, $4, $5) RETURNING id""",
+                domain_id, algorithm, data, samples, int(time.time() * 1000)
+            )
+
+    async def _archive_cold_conversations(self, cutoff: int, limit: int) -> int:
+        """Move the messages of up to `limit` conversations last updated before `cutoff` to message_archive."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                ids = [row['id'] for row in await conn.fetch(
+                    """SELECT id FROM conversations
+                       WHERE archived_at IS NULL AND updated_at < $1 AND message_count > 0
+                       ORDER BY updated_at
+                       LIMIT $2
+                       FOR UPDATE SKIP LOCKED""",
+                    cutoff, limit
+                )]
+                if not ids:
+                    return 0
+                grouped = await self._get_messages_for(conn, ids)
+                payloads = await asyncio.to_thread(lambda: [pack_messages(grouped.get(id, [])) for id in ids])
+                await conn.execute(
+                    """WITH archived AS (
+                           INSERT INTO message_archive (conversation_id, message_count, payload, archived_at)
+                           SELECT a.id, a.message_count, a.payload, $4
+                           FROM unnest($1::text[], $2::int[], $3::bytea[]) AS a(id, message_count, payload)
+                       ), cleared AS (
+                           DELETE FROM messages WHERE conversation_id = ANY($1::text[])
+                       )
+                       UPDATE conversations SET archived_at = $4 WHERE id = ANY($1::text[])""",
+                    ids, [len(grouped.get(id, [])) for id in ids], payloads, int(time.time() * 1000)
+                )
+        conversation_archive.inc(len(ids), backend="PostgresStorage", direction="archive")
+        return len(ids)
+
+    async def _maintain_message_partitions(self, drop_before: int):
+        """Create the upcoming monthly partitions and drop old ones that archiving emptied."""
+        async with self.pool.acquire() as conn:
+            for year, month in upcoming_months(int(time.time() * 1000)):
+                try:
+                    await conn.execute(create_partition_sql(year, month))
+                except asyncpg.PostgresError as e:
+                    # Typically rows for that month already sit in the default partition
+                    log.warning("Could not create message partition", year=year, month=month, error=e)
+            if not drop_before:
+                return
+            partitions = await conn.fetch(
+                """SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                   WHERE i.inhparent = to_regclass('messages')"""
+            )
+            for row in partitions:
+                month = parse_partition_name(row['relname'])
+                if month is None or partition_bounds(*month)[1] > drop_before:
+                    continue
+                async with conn.transaction():
+                    await conn.execute(f"LOCK TABLE {row['relname']} IN ACCESS EXCLUSIVE MODE")
+                    if await conn.fetchval(f"SELECT NOT EXISTS (SELECT 1 FROM {row['relname']})"):
+                        await conn.execute(f"DROP TABLE {row['relname']}")
+                        log.info("Dropped empty message partition", partition=row['relname'])
+
+    async def get_conversation_summaries(
+        self, user_email: Optional[str] = None,
+        limit: int = 50, cursor: Optional[str] = None
+    ) -> ConversationPage:
+        position = decode_cursor(cursor)
+        where_clauses = []
+        values = []
+        if user_email:
+            values.append(user_email)
+            where_clauses.append(f"c.user_email = ${len(values)}")
+        if position:
+            values.extend(position)
+            where_clauses.append(f"(c.updated_at, c.id) < (${len(values) - 1}, ${len(values)})")
+        values.append(limit + 1)
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                f"""SELECT c.id, c.title, c.endpoint_id, c.domain_id, c.site_id, c.updated_at,
+                           c.message_count
+                    FROM conversations c
+                    {where_sql}
+                    ORDER BY c.updated_at DESC, c.id DESC
+                    LIMIT ${len(values)}""",
+                *values
+            )
+        summaries = [
+            ConversationSummary(
+                id=row['id'],
+                title=row['title'],
+                endpointId=row['endpoint_id'],
+                domainId=row['domain_id'],
+                siteId=row['site_id'],
+                updatedAt=row['updated_at'],
+                messageCount=row['message_count']
+            )
+            for row in rows
+        ]
+        return build_conversation_page(summaries, limit)
+
+    async def search_conversations(
+        self, user_email: Optional[str], query: str,
+        limit: int = 20, cursor: Optional[str] = None
+    ) -> SearchPage:
+        offset = decode_search_cursor(cursor)
+        values = [query]
+        user_sql = ""
+        if user_email:
+            values.append(user_email)
+            user_sql = f"AND c.user_email = ${len(values)}"
+        values.extend([limit + 1, offset])
+
+        async with self.pool.acquire() as conn:
+            # Archived conversations have no hot messages, so they are not searched
+            rows = await conn.fetch(
+                f"""SELECT * FROM (
+                        SELECT DISTINCT ON (m.conversation_id)
+                               m.conversation_id, c.title, m.id, m.role, m.content, m.timestamp, m.codec, m.content_blob,
+                               ts_rank_cd(m.search_vector, q.query) AS rank,
+                               COUNT(*) OVER (PARTITION BY m.conversation_id) AS matches
+                        FROM messages m
+                        JOIN conversations c ON c.id = m.conversation_id
+                        CROSS JOIN websearch_to_tsquery('english', $1) AS q(query)
+                        WHERE m.search_vector @@ q.query {user_sql}
+                        ORDER BY m.conversation_id, rank DESC, m.timestamp DESC
+                    ) best
+                    ORDER BY rank DESC, timestamp DESC, conversation_id
+                    LIMIT ${len(values) - 1} OFFSET ${len(values)}""",
+                *values
+            )
+            messages = await self._messages_from_rows(conn, rows)
+        wanted = query_terms(query)
+        results = [
+            build_search_result(row['conversation_id'], row['title'], message, wanted, row['matches'], row['rank'])
+            for row, message in zip(rows, messages)
+        ]
+        return build_search_page(results, limit, offset)
+
     async def get_conversation(self, id: str) -> Optional[Conversation]:
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow("SELECT * FROM conversations WHERE id = $1", id)
             if not row:
                 return None
             
+            self.codec.remember_domain(id, row['domain_id'])
+            if row['archived_at']:
+                await self._rehydrate(conn, id)
             messages = await self._get_messages(conn, id)
             return Conversation(
                 id=row['id'],
@@ -198,6 +506,39 @@ class PostgresStorage(IStorage):
                 updatedAt=row['updated_at']
             )
 
+    async def get_conversation_summary(self, id: str) -> Optional[ConversationSummary]:
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """SELECT c.id, c.title, c.endpoint_id, c.domain_id, c.site_id, c.updated_at,
+                          c.message_count
+                   FROM conversations c
+                   WHERE c.id = $1""",
+                id
+            )
+        if not row:
+            return None
+        self.codec.remember_domain(id, row['domain_id'])
+        return ConversationSummary(
+            id=row['id'],
+            title=row['title'],
+            endpointId=row['endpoint_id'],
+            domainId=row['domain_id'],
+            siteId=row['site_id'],
+            updatedAt=row['updated_at'],
+            messageCount=row['message_count']
+        )
+
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> list[Message]:
+        if limit <= 0:
+            return []
+        query = "SELECT * FROM messages WHERE conversation_id = $1 ORDER BY timestamp DESC LIMIT $2"
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(query, conversation_id, limit)
+            # Archived conversations have no hot messages; restore and read again
+            if not rows and await self._rehydrate(conn, conversation_id):
+                rows = await conn.fetch(query, conversation_id, limit)
+            return await self._messages_from_rows(conn, list(reversed(rows)))
+
     async def create_conversation(
         self, endpoint_id: str, title: str,
         domain_id: Optional[str] = None, site_id: Optional[str] = None,
@@ -212,6 +553,7 @@ class PostgresStorage(IStorage):
                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)""",
                 conv_id, title, endpoint_id, domain_id, site_id, user_email, now, now
             )
+        self.codec.remember_domain(conv_id, domain_id)
         
         return Conversation(
             id=conv_id,
@@ -227,17 +569,20 @@ class PostgresStorage(IStorage):
 
     async def add_message(self, conversation_id: str, message: InsertMessage) -> Message:
         msg_id = str(uuid4())
+        content, codec, blob = self.codec.encode(message.content, self.codec.domain_of(conversation_id))
         
         async with self.pool.acquire() as conn:
             await conn.execute(
-                """INSERT INTO messages (id, conversation_id, role, content, timestamp)
-                   VALUES ($1, $2, $3, $4, $5)""",
-                msg_id, conversation_id, message.role.value, message.content, message.timestamp
+                """INSERT INTO messages (id, conversation_id, role, content, timestamp, codec, content_blob, search_vector)
+                   VALUES ($1, $2, $3, $4, $5, $6, $7, to_tsvector('english', $8))""",
+                msg_id, conversation_id, message.role.value, content, message.timestamp, codec, blob, message.content
             )
-            await conn.execute(
-                "UPDATE conversations SET updated_at = $1 WHERE id = $2",
+            archived_at = await conn.fetchval(
+                "UPDATE conversations SET updated_at = $1 WHERE id = $2 RETURNING archived_at",
                 int(time.time() * 1000), conversation_id
             )
+            if archived_at:
+                await self._rehydrate(conn, conversation_id)
         
         return Message(
             id=msg_id,
@@ -246,6 +591,55 @@ class PostgresStorage(IStorage):
             timestamp=message.timestamp
         )
 
+    async def record_chat_turn(
+        self, conversation_id: str, messages: list[InsertMessage],
+        new_conversation: Optional[Conversation] = None
+    ) -> list[Message]:
+        new_messages = [
+            Message(id=str(uuid4()), role=m.role, content=m.content, timestamp=m.timestamp)
+            for m in messages
+        ]
+        if new_conversation:
+            self.codec.remember_domain(conversation_id, new_conversation.domainId)
+        message_columns = self._message_columns(new_messages, self.codec.domain_of(conversation_id))
+        now = int(time.time() * 1000)
+        
+        # A single statement is atomic on its own, so the whole turn costs one round-trip
+        async with self.pool.acquire() as conn:
+            if new_conversation:
+                await conn.execute(
+                    """WITH conversation AS (
+                           INSERT INTO conversations (id, title, endpoint_id, domain_id, site_id, user_email, created_at, updated_at)
+                           VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                       )
+                       INSERT INTO messages (id, conversation_id, role, content, timestamp, codec, content_blob, search_vector)
+                       SELECT m.id, $1, m.role, m.content, m.timestamp, m.codec, m.content_blob,
+                              to_tsvector('english', COALESCE(m.search_text, m.content))
+                       FROM unnest($9::text[], $10::text[], $11::text[], $12::bigint[], $13::text[], $14::bytea[], $15::text[])
+                           AS m(id, role, content, timestamp, codec, content_blob, search_text)""",
+                    conversation_id, new_conversation.title, new_conversation.endpointId,
+                    new_conversation.domainId, new_conversation.siteId, new_conversation.userEmail,
+                    new_conversation.createdAt, now, *message_columns
+                )
+            else:
+                archived_at = await conn.fetchval(
+                    """WITH inserted AS (
+                           INSERT INTO messages (id, conversation_id, role, content, timestamp, codec, content_blob, search_vector)
+                           SELECT m.id, $1, m.role, m.content, m.timestamp, m.codec, m.content_blob,
+                                  to_tsvector('english', COALESCE(m.search_text, m.content))
+                           FROM unnest($3::text[], $4::text[], $5::text[], $6::bigint[], $7::text[], $8::bytea[], $9::text[])
+                               AS m(id, role, content, timestamp, codec, content_blob, search_text)
+                       )
+                       UPDATE conversations SET updated_at = $2 WHERE id = $1
+                       RETURNING archived_at""",
+                    conversation_id, now, *message_columns
+                )
+                # Written to while (or just after) being archived: bring the history back
+                if archived_at:
+                    await self._rehydrate(conn, conversation_id)
+        
+        return new_messages
+
     async def update_conversation(self, id: str, updates: dict) -> Optional[Conversation]:
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow("SELECT * FROM conversations WHERE id = $1", id)
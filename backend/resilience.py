@@ -0,0 +1,268 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+from .log import get_logger
+from .tracing import tracer
+
+T = TypeVar("T")
+log = get_logger("resilience")
+
+
+MAX_RETRIES = int(os.getenv("ENDPOINT_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY = float(os.getenv("ENDPOINT_RETRY_BASE_DELAY_SECONDS", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("ENDPOINT_RETRY_MAX_DELAY_SECONDS", "8"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("ENDPOINT_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("ENDPOINT_BREAKER_RESET_SECONDS", "30"))
+# Percentile of recent latencies after which a second, hedged request is sent; 0 disables hedging
+HEDGE_PERCENTILE = float(os.getenv("ENDPOINT_HEDGE_PERCENTILE", "0"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class EndpointError(Exception):
+    """A serving endpoint call that failed with an HTTP status or a transport error."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+    @classmethod
+    def from_response(cls, response: httpx.Response, body: str) -> "EndpointError":
+        return cls(
+            f"Databricks API error: {response.status_code} - {body}",
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers.get("retry-after"))
+        )
+
+
+class CircuitOpenError(EndpointError):
+    """Raised without calling the endpoint while its circuit breaker is open."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds; the header may be delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through once the reset period has passed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    def retry_in(self) -> float:
+        if self.state != self.OPEN or self.opened_at is None:
+            return 0.0
+        return max(self.opened_at + self.reset_seconds - time.monotonic(), 0.0)
+
+    def before_call(self, endpoint: str):
+        if self.state == self.OPEN:
+            if self.retry_in() > 0:
+                raise CircuitOpenError(
+                    f"Endpoint {endpoint} is unavailable (circuit open)",
+                    status_code=503, retry_after=self.retry_in()
+                )
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(
+                    f"Endpoint {endpoint} is unavailable (recovery probe in progress)",
+                    status_code=503, retry_after=1.0
+                )
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a half-open probe that neither proved nor disproved endpoint health (e.g. a 4xx)."""
+        self._probe_in_flight = False
+
+
+class EndpointHealth:
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.rejected = 0
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+    def hedge_delay(self) -> Optional[float]:
+        if HEDGE_PERCENTILE <= 0 or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.percentile(HEDGE_PERCENTILE)
+
+    def snapshot(self, endpoint: str) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "endpoint": endpoint,
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "retry_in_seconds": round(self.breaker.retry_in(), 1),
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "rejected": self.rejected,
+            "latency_p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000) if p95 is not None else None,
+        }
+
+
+class EndpointResilience:
+    """Per-endpoint retries with jittered backoff, optional hedging and a circuit breaker."""
+
+    def __init__(self, max_retries: int = MAX_RETRIES, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._endpoints: dict[str, EndpointHealth] = {}
+
+    def health(self, endpoint: str) -> EndpointHealth:
+        if endpoint not in self._endpoints:
+            self._endpoints[endpoint] = EndpointHealth()
+        return self._endpoints[endpoint]
+
+    def snapshot(self) -> list[dict]:
+        return [health.snapshot(name) for name, health in sorted(self._endpoints.items())]
+
+    def _backoff(self, attempt: int, error: EndpointError) -> Optional[float]:
+        """Delay before the next attempt, or None when the server asked us to wait longer than we would."""
+        if error.retry_after is not None:
+            return error.retry_after if error.retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(self, endpoint: str, send: Callable[[], Awaitable[T]], hedge: bool = False) -> T:
+        """Run `send` under the endpoint's breaker, retrying retryable EndpointErrors.
+
+        `send` must raise EndpointError for HTTP failures; transport errors are wrapped here.
+        Hedging issues a duplicate request once the first one outlives the configured latency
+        percentile, so only use it for side-effect free calls.
+        """
+        health = self.health(endpoint)
+        attempt = 0
+        while True:
+            try:
+                health.breaker.before_call(endpoint)
+            except CircuitOpenError:
+                health.rejected += 1
+                raise
+
+            health.calls += 1
+            started = time.monotonic()
+            try:
+                with tracer.span("endpoint.attempt", **{"databricks.endpoint": endpoint, "attempt": attempt + 1}) as span:
+                    hedge_delay = health.hedge_delay() if hedge else None
+                    if hedge_delay is None:
+                        result = await self._attempt(send)
+                    else:
+                        result = await self._hedged(send, hedge_delay, health)
+                    span.set_attribute("hedged", hedge_delay is not None)
+            except EndpointError as e:
+                health.failures += 1
+                if not e.retryable:
+                    health.breaker.release()
+                    raise
+                # Rate limiting is back-pressure, not ill health
+                if e.status_code == 429:
+                    health.breaker.release()
+                else:
+                    health.breaker.record_failure()
+                delay = self._backoff(attempt, e) if attempt < self.max_retries else None
+                if delay is None or health.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                attempt += 1
+                health.retries += 1
+                log.warning(
+                    "Endpoint call failed, retrying", endpoint=endpoint, attempt=attempt,
+                    status=e.status_code or "transport", retry_in_s=round(delay, 2)
+                )
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                health.breaker.release()
+                raise
+
+            health.latencies.append(time.monotonic() - started)
+            health.breaker.record_success()
+            return result
+
+    @staticmethod
+    async def _attempt(send: Callable[[], Awaitable[T]]) -> T:
+        try:
+            return await send()
+        except httpx.TransportError as e:
+            raise EndpointError(f"{type(e).__name__}: {e}") from e
+
+    async def _hedged(self, send: Callable[[], Awaitable[T]], delay: float, health: EndpointHealth) -> T:
+        primary = asyncio.ensure_future(self._attempt(send))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        health.hedges += 1
+        tracer.current_span().add_event("hedge", delay_ms=round(delay * 1000))
+        pending = {primary, asyncio.ensure_future(self._attempt(send))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+endpoint_resilience = EndpointResilience()
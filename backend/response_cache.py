@@ -0,0 +1,211 @@
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?.!]+$")
+
+
+def normalize(text: str) -> str:
+    """Case, whitespace and trailing punctuation do not change what is being asked."""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", text.strip().lower()))
+
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by can could do does for from how i in is it me my of on or please "
+    "show tell the to us was we what whats what's when where which who why will with you your".split()
+)
+
+
+def content_words(text: str) -> frozenset[str]:
+    return frozenset(word.strip(",;:'\"()") for word in text.split()) - _STOPWORDS
+
+
+def jaccard(a: frozenset[str], b: frozenset[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def ngram_vector(text: str, n: int = 3) -> dict[str, float]:
+    """Unit-length vector of character n-grams and words, for cosine similarity."""
+    padded = f" {text} "
+    grams = Counter(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+    grams.update(f"w:{word}" for word in text.split())
+    norm = math.sqrt(sum(c * c for c in grams.values())) or 1.0
+    return {gram: count / norm for gram, count in grams.items()}
+
+
+def cosine(a: dict[str, float], b: dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(gram, 0.0) for gram, weight in a.items())
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    content: str
+    stored_at: float
+    context_key: str
+    vector: Optional[dict[str, float]]
+    words: frozenset[str]
+
+
+class ResponseCache:
+    """Opt-in cache of assistant responses for repeated prompts.
+
+    Exact entries are keyed on the caller, the endpoint and the whole normalized payload
+    (system prompt, included history and the new message). Entries are never shared between
+    callers: an answer produced with one user's token may draw on data only they can read,
+    and a hit skips the endpoint's own permission check. The optional similarity tier matches
+    a new message against earlier messages the same caller sent with the same endpoint,
+    system prompt and history, using
+    character n-gram cosine similarity. Both the n-gram cosine and the overlap of content
+    words must reach the threshold, so "definition of OEE" never answers "definition of TRIFR".
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        domains: set[str],
+        ttl: float,
+        max_entries: int,
+        similarity_threshold: float = 0.0,
+        max_candidates: int = 200
+    ):
+        self.enabled = enabled
+        self.domains = domains
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.max_candidates = max_candidates
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._by_context: dict[str, OrderedDict[str, None]] = {}
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def enabled_for(self, domain_id: Optional[str]) -> bool:
+        return self.enabled and ("*" in self.domains or (domain_id or "generic") in self.domains)
+
+    @staticmethod
+    def _keys(endpoint_id: str, user_key: str, messages: list[dict]) -> tuple[str, str, str]:
+        """(exact key, context key, normalized final user message)."""
+        normalized = [(m["role"], normalize(m["content"])) for m in messages]
+        context_key = _digest([user_key, endpoint_id, normalized[:-1]])
+        question = normalized[-1][1]
+        return _digest([context_key, question]), context_key, question
+
+    def get(self, endpoint_id: str, user_key: str, domain_id: Optional[str], messages: list[dict]) -> Optional[str]:
+        if not self.enabled_for(domain_id):
+            return None
+        key, context_key, question = self._keys(endpoint_id, user_key, messages)
+
+        entry = self._live(key)
+        if entry:
+            self.exact_hits += 1
+            return entry.content
+
+        if self.similarity_threshold > 0:
+            vector, words = ngram_vector(question), content_words(question)
+            best_key, best_score = None, self.similarity_threshold
+            for candidate_key in reversed(self._by_context.get(context_key, {})):
+                candidate = self._entries.get(candidate_key)
+                if candidate and candidate.vector and jaccard(words, candidate.words) >= self.similarity_threshold:
+                    score = cosine(vector, candidate.vector)
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+            entry = self._live(best_key) if best_key else None
+            if entry:
+                self.similar_hits += 1
+                return entry.content
+
+        self.misses += 1
+        return None
+
+    def put(self, endpoint_id: str, user_key: str, domain_id: Optional[str], messages: list[dict], content: str):
+        if not self.enabled_for(domain_id) or not content:
+            return
+        key, context_key, question = self._keys(endpoint_id, user_key, messages)
+        vector = ngram_vector(question) if self.similarity_threshold > 0 else None
+        self._remove(key)
+        self._entries[key] = CachedResponse(content, time.monotonic(), context_key, vector, content_words(question))
+        candidates = self._by_context.setdefault(context_key, OrderedDict())
+        candidates[key] = None
+        if len(candidates) > self.max_candidates:
+            self._remove(next(iter(candidates)))
+            self.evictions += 1
+        self.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _live(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        candidates = self._by_context.get(entry.context_key)
+        if candidates is not None:
+            candidates.pop(key, None)
+            if not candidates:
+                del self._by_context[entry.context_key]
+
+    def clear(self):
+        self._entries.clear()
+        self._by_context.clear()
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.similar_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "domains": sorted(self.domains),
+            "similarity_threshold": self.similarity_threshold,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+response_cache = ResponseCache(
+    enabled=_env_flag("RESPONSE_CACHE_ENABLED"),
+    domains={d.strip() for d in os.getenv("RESPONSE_CACHE_DOMAINS", "*").split(",") if d.strip()},
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000")),
+    similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0")),
+)
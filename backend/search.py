@@ -0,0 +1,365 @@
+import base64
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from .models import Message, SearchPage, SearchResult
+
+
+SNIPPET_CHARS = 160
+# Owners compact their postings once this fraction of their documents is deleted; the whole
+# index is renumbered, freeing per-document and per-conversation state, at the same fraction
+COMPACT_DEAD_FRACTION = 0.25
+# Approximate memory of the index's parts, for InvertedIndex.memory_bytes
+_TERM_BYTES = 300
+_POSTING_BYTES = 6
+_DOCUMENT_BYTES = 32
+_CONVERSATION_BYTES = 160
+
+_WORD = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from had has have how i if in into is it its me my "
+    "no not of on or our so than that the their them then there these they this to was we were what "
+    "when where which who why will with you your".split()
+)
+
+
+def _normalize(word: str) -> str:
+    """Lowercase and strip plural endings; the only stemming the in-process index does."""
+    word = word.lower()
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def terms(text: str) -> list[str]:
+    return [t for t in (_normalize(w) for w in _WORD.findall(text)) if t not in STOPWORDS]
+
+
+def query_terms(query: str) -> list[str]:
+    return list(dict.fromkeys(terms(query)))
+
+
+def snippet(text: str, wanted: list[str], width: int = SNIPPET_CHARS) -> tuple[str, list[tuple[int, int]]]:
+    """Up to `width` characters of text around the first matched word, and where the matches are."""
+    wanted_set = set(wanted)
+    spans = [(m.start(), m.end()) for m in _WORD.finditer(text) if _normalize(m.group()) in wanted_set]
+    start, end = 0, len(text)
+    if end > width:
+        if spans:
+            start = max(0, spans[0][0] - width // 4)
+            if start:
+                start = text.rfind(" ", 0, start) + 1
+        end = min(len(text), start + width)
+        if end < len(text):
+            space = text.rfind(" ", start + width // 2, end)
+            end = space if space > 0 else end
+    prefix = "…" if start else ""
+    suffix = "…" if end < len(text) else ""
+    shift = len(prefix) - start
+    highlights = [(s + shift, e + shift) for s, e in spans if s >= start and e <= end]
+    return prefix + text[start:end].replace("\n", " ") + suffix, highlights
+
+
+def build_search_result(
+    conversation_id: str, title: str, message: Message, wanted: list[str], matches: int, rank: float
+) -> SearchResult:
+    text, highlights = snippet(message.content, wanted)
+    return SearchResult(
+        conversationId=conversation_id, conversationTitle=title, messageId=message.id,
+        role=message.role, snippet=text, highlights=highlights, timestamp=message.timestamp,
+        matches=matches, rank=round(rank, 4)
+    )
+
+
+def encode_search_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"search:{offset}".encode()).decode()
+
+
+def decode_search_cursor(cursor: Optional[str]) -> int:
+    """Offset of a search results cursor. Raises ValueError for malformed cursors."""
+    if not cursor:
+        return 0
+    try:
+        kind, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        if kind != "search" or int(offset) < 0:
+            raise ValueError
+        return int(offset)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_search_page(results: list[SearchResult], limit: int, offset: int) -> SearchPage:
+    """Trim a limit+1 fetch to a page, setting nextCursor when more results exist."""
+    if len(results) <= limit:
+        return SearchPage(items=results)
+    return SearchPage(items=results[:limit], nextCursor=encode_search_cursor(offset + limit))
+
+
+@dataclass
+class SearchHit:
+    conversation_id: str
+    message_id: str
+    timestamp: int
+    rank: float
+    matches: int
+
+
+class InvertedIndex:
+    """Incremental inverted index over message text, for backends without full-text search.
+
+    Postings are kept per conversation owner, so a user's search only reads postings of
+    their own conversations. A posting list is a pair of compact arrays (document numbers,
+    ascending since documents are only appended, and term frequencies). Removing a
+    conversation only marks it deleted; an owner's postings are compacted once enough of
+    their documents are dead, and the whole index is renumbered once enough of all
+    documents or conversations are, so its memory follows the live data. Ranking is BM25 over the owner's messages, and each
+    conversation is represented by its best matching message.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._postings: dict[Optional[str], dict[str, tuple[array, array]]] = {}
+        self._owner_docs: Counter[Optional[str]] = Counter()
+        self._owner_length: Counter[Optional[str]] = Counter()
+        self._owner_dead: Counter[Optional[str]] = Counter()
+        self._conversation_number: dict[str, int] = {}
+        self._conversation_ids: list[str] = []
+        self._conversation_owner: list[Optional[str]] = []
+        self._conversation_docs = array("I")
+        self._conversation_length = array("Q")
+        self._deleted = bytearray()
+        self._doc_conversation = array("I")
+        self._doc_length = array("H")
+        self._doc_timestamp = array("q")
+        self._doc_message: list[str] = []
+        self._dead_conversations = 0
+        # Estimated from the parts above; dead entries count until they are compacted away
+        self.memory_bytes = 0
+        self.documents = 0
+        self.compactions = 0
+        self.renumberings = 0
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self._conversation_number
+
+    def add_conversation(self, conversation_id: str, owner: Optional[str]):
+        if conversation_id in self._conversation_number:
+            return
+        self._conversation_number[conversation_id] = len(self._conversation_ids)
+        self._conversation_ids.append(conversation_id)
+        self._conversation_owner.append(owner)
+        self._conversation_docs.append(0)
+        self._conversation_length.append(0)
+        self._deleted.append(0)
+        self.memory_bytes += _CONVERSATION_BYTES
+
+    def add(self, conversation_id: str, message_id: str, text: str, timestamp: int) -> bool:
+        """Index a message of a known conversation; False if the conversation is not indexed."""
+        number = self._conversation_number.get(conversation_id)
+        if number is None:
+            return False
+        counts = Counter(terms(text))
+        doc = len(self._doc_message)
+        owner = self._conversation_owner[number]
+        postings = self._postings.setdefault(owner, {})
+        for term, tf in counts.items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array("I"), array("B"))
+                self.memory_bytes += _TERM_BYTES
+            entry[0].append(doc)
+            entry[1].append(min(tf, 255))
+        length = sum(counts.values())
+        self._doc_conversation.append(number)
+        self._doc_length.append(min(length, 65535))
+        self._doc_timestamp.append(timestamp)
+        self._doc_message.append(message_id)
+        self._conversation_docs[number] += 1
+        self._conversation_length[number] += length
+        self._owner_docs[owner] += 1
+        self._owner_length[owner] += length
+        self.documents += 1
+        self.memory_bytes += _DOCUMENT_BYTES + _POSTING_BYTES * len(counts)
+        return True
+
+    def remove_conversation(self, conversation_id: str):
+        number = self._conversation_number.pop(conversation_id, None)
+        if number is None:
+            return
+        owner = self._conversation_owner[number]
+        self._deleted[number] = 1
+        docs = self._conversation_docs[number]
+        self._owner_docs[owner] -= docs
+        self._owner_length[owner] -= self._conversation_length[number]
+        self._owner_dead[owner] += docs
+        self._dead_conversations += 1
+        self.documents -= docs
+        if (len(self._doc_message) - self.documents > COMPACT_DEAD_FRACTION * len(self._doc_message)
+                or self._dead_conversations > COMPACT_DEAD_FRACTION * len(self._conversation_ids)):
+            self._renumber()
+        elif self._owner_dead[owner] > COMPACT_DEAD_FRACTION * (self._owner_docs[owner] + self._owner_dead[owner]):
+            self._compact(owner)
+
+    def _compact(self, owner: Optional[str]):
+        deleted, doc_conversation = self._deleted, self._doc_conversation
+        postings = self._postings.get(owner, {})
+        for term in list(postings):
+            docs, tfs = postings[term]
+            keep = [i for i, doc in enumerate(docs) if not deleted[doc_conversation[doc]]]
+            self.memory_bytes -= _POSTING_BYTES * (len(docs) - len(keep))
+            if not keep:
+                del postings[term]
+                self.memory_bytes -= _TERM_BYTES
+            elif len(keep) < len(docs):
+                postings[term] = (array("I", (docs[i] for i in keep)), array("B", (tfs[i] for i in keep)))
+        self._owner_dead[owner] = 0
+        self.compactions += 1
+
+    def _renumber(self):
+        """Drop deleted conversations and their documents, renumbering the rest in order.
+
+        The mapping keeps numbers ascending, so every posting list stays sorted.
+        """
+        deleted = self._deleted
+        conversation_map = array("q", [-1]) * len(self._conversation_ids)
+        ids, owners = [], []
+        conversation_docs, conversation_length = array("I"), array("Q")
+        for old, conversation_id in enumerate(self._conversation_ids):
+            if deleted[old]:
+                continue
+            conversation_map[old] = len(ids)
+            ids.append(conversation_id)
+            owners.append(self._conversation_owner[old])
+            conversation_docs.append(self._conversation_docs[old])
+            conversation_length.append(self._conversation_length[old])
+
+        doc_map = array("q", [-1]) * len(self._doc_message)
+        doc_conversation, doc_length, doc_timestamp = array("I"), array("H"), array("q")
+        doc_message = []
+        for old, number in enumerate(self._doc_conversation):
+            if deleted[number]:
+                continue
+            doc_map[old] = len(doc_message)
+            doc_conversation.append(conversation_map[number])
+            doc_length.append(self._doc_length[old])
+            doc_timestamp.append(self._doc_timestamp[old])
+            doc_message.append(self._doc_message[old])
+
+        for owner in list(self._postings):
+            postings = self._postings[owner]
+            for term in list(postings):
+                docs, tfs = postings[term]
+                keep = [i for i, doc in enumerate(docs) if doc_map[doc] >= 0]
+                if keep:
+                    postings[term] = (array("I", (doc_map[docs[i]] for i in keep)), array("B", (tfs[i] for i in keep)))
+                else:
+                    del postings[term]
+            if not postings:
+                del self._postings[owner]
+        for owner in [owner for owner, docs in self._owner_docs.items() if not docs]:
+            del self._owner_docs[owner], self._owner_length[owner]
+        self._owner_dead.clear()
+
+        self._conversation_ids, self._conversation_owner = ids, owners
+        self._conversation_number = {conversation_id: i for i, conversation_id in enumerate(ids)}
+        self._conversation_docs, self._conversation_length = conversation_docs, conversation_length
+        self._deleted = bytearray(len(ids))
+        self._doc_conversation, self._doc_length = doc_conversation, doc_length
+        self._doc_timestamp, self._doc_message = doc_timestamp, doc_message
+        self._dead_conversations = 0
+        self.memory_bytes = (
+            _TERM_BYTES * sum(len(postings) for postings in self._postings.values())
+            + _POSTING_BYTES * sum(len(docs) for postings in self._postings.values() for docs, _ in postings.values())
+            + _DOCUMENT_BYTES * len(doc_message) + _CONVERSATION_BYTES * len(ids)
+        )
+        self.renumberings += 1
+
+    def _score_owner(self, owner: Optional[str], wanted: list[str], best: dict, matches: Counter):
+        postings = self._postings.get(owner)
+        if not postings:
+            return
+        lists = [postings.get(term) for term in wanted]
+        if any(entry is None for entry in lists):
+            return
+        lists.sort(key=lambda entry: len(entry[0]))
+        n = max(self._owner_docs[owner], 1)
+        avgdl = max(self._owner_length[owner] / n, 1)
+        idfs = [math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for docs, _ in lists]
+
+        docs, tfs = lists[0]
+        candidates = {doc: [tf] for doc, tf in zip(docs, tfs) if not self._deleted[self._doc_conversation[doc]]}
+        for docs, tfs in lists[1:]:
+            if not candidates:
+                return
+            if len(candidates) * 16 < len(docs):
+                found = {}
+                for doc, freqs in candidates.items():
+                    i = bisect_left(docs, doc)
+                    if i < len(docs) and docs[i] == doc:
+                        freqs.append(tfs[i])
+                        found[doc] = freqs
+            else:
+                frequencies = dict(zip(docs, tfs))
+                found = {}
+                for doc, freqs in candidates.items():
+                    tf = frequencies.get(doc)
+                    if tf is not None:
+                        freqs.append(tf)
+                        found[doc] = freqs
+            candidates = found
+
+        k1, b = self.K1, self.B
+        for doc, freqs in candidates.items():
+            norm = k1 * (1 - b + b * self._doc_length[doc] / avgdl)
+            score = sum(idf * tf * (k1 + 1) / (tf + norm) for idf, tf in zip(idfs, freqs))
+            number = self._doc_conversation[doc]
+            matches[number] += 1
+            current = best.get(number)
+            if current is None or (score, self._doc_timestamp[doc]) > (current[0], self._doc_timestamp[current[1]]):
+                best[number] = (score, doc)
+
+    def search(
+        self, wanted: list[str], user_email: Optional[str], limit: int, offset: int = 0
+    ) -> list[SearchHit]:
+        """Conversations matching all terms, best first; up to `limit` after skipping `offset`.
+
+        With a user, only their conversations are searched; without one, everyone's.
+        """
+        if not wanted:
+            return []
+        best: dict[int, tuple[float, int]] = {}
+        matches: Counter[int] = Counter()
+        for owner in ([user_email] if user_email else list(self._postings)):
+            self._score_owner(owner, wanted, best, matches)
+        top = heapq.nsmallest(
+            offset + limit, best.items(),
+            key=lambda item: (-item[1][0], -self._doc_timestamp[item[1][1]], item[0])
+        )
+        return [
+            SearchHit(
+                conversation_id=self._conversation_ids[number], message_id=self._doc_message[doc],
+                timestamp=self._doc_timestamp[doc], rank=score, matches=matches[number]
+            )
+            for number, (score, doc) in top[offset:]
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._conversation_number),
+            "documents": self.documents,
+            "terms": sum(len(postings) for postings in self._postings.values()),
+            "postings": sum(len(docs) for postings in self._postings.values() for docs, _ in postings.values()),
+            "compactions": self.compactions,
+            "renumberings": self.renumberings,
+            "memory_bytes": self.memory_bytes,
+        }
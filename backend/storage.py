@@ -1,11 +1,71 @@
-from abc import ABC, abstractmethod
-from typing import Optional
+from abc import ABC, abstractmethod, update_abstractmethods
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 from uuid import uuid4
 from .models import (
-    Message, InsertMessage, Conversation, Domain, InsertDomain,
-    Site, Endpoint, InsertEndpoint, Config, MessageRole, EndpointType
+    Message, InsertMessage, Conversation, ConversationSummary, ConversationPage, SearchPage,
+    Domain, InsertDomain, Site, Endpoint, InsertEndpoint, Config, MessageRole, EndpointType
 )
+import asyncio
+import base64
+import os
 import time
+from .conversation_index import ConversationIndex
+from .log import get_logger
+from .search import InvertedIndex, build_search_page, build_search_result, decode_search_cursor, query_terms
+
+log = get_logger("storage")
+
+# Approximate memory cap for MemStorage conversations; 0 keeps everything
+MEM_STORAGE_MAX_MB = float(os.getenv("MEM_STORAGE_MAX_MB", "0"))
+# Rough per-object overhead of a pydantic model on top of its text
+_OBJECT_OVERHEAD = 300
+
+
+def encode_cursor(updated_at: int, id: str) -> str:
+    """Encode a (updated_at, id) keyset position as an opaque pagination cursor."""
+    return base64.urlsafe_b64encode(f"{updated_at}:{id}".encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[tuple[int, str]]:
+    """Decode a pagination cursor. Raises ValueError for malformed cursors."""
+    if not cursor:
+        return None
+    try:
+        updated_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        return int(updated_at), id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_conversation(
+    endpoint_id: str, title: str,
+    domain_id: Optional[str] = None, site_id: Optional[str] = None,
+    user_email: Optional[str] = None
+) -> Conversation:
+    """Build a new, not yet persisted, conversation with a fresh id."""
+    now = int(time.time() * 1000)
+    return Conversation(
+        id=str(uuid4()),
+        title=title,
+        messages=[],
+        endpointId=endpoint_id,
+        domainId=domain_id,
+        siteId=site_id,
+        userEmail=user_email,
+        createdAt=now,
+        updatedAt=now
+    )
+
+
+def build_conversation_page(summaries: list[ConversationSummary], limit: int) -> ConversationPage:
+    """Trim a limit+1 keyset fetch to a page, setting nextCursor when more rows exist."""
+    if len(summaries) <= limit:
+        return ConversationPage(items=summaries)
+    items = summaries[:limit]
+    last = items[-1]
+    return ConversationPage(items=items, nextCursor=encode_cursor(last.updatedAt, last.id))
 
 
 class IStorage(ABC):
@@ -17,10 +77,36 @@ class IStorage(ABC):
     async def get_conversations(self, user_email: Optional[str] = None) -> list[Conversation]:
         pass
 
+    @abstractmethod
+    async def get_conversation_summaries(
+        self, user_email: Optional[str] = None,
+        limit: int = 50, cursor: Optional[str] = None
+    ) -> ConversationPage:
+        """List conversations without messages, newest first, keyset-paginated on (updatedAt, id)."""
+        pass
+
     @abstractmethod
     async def get_conversation(self, id: str) -> Optional[Conversation]:
         pass
 
+    @abstractmethod
+    async def get_conversation_summary(self, id: str) -> Optional[ConversationSummary]:
+        """Conversation metadata and message count, without loading messages."""
+        pass
+
+    @abstractmethod
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> list[Message]:
+        """The newest `limit` messages of a conversation, in chronological order."""
+        pass
+
+    @abstractmethod
+    async def search_conversations(
+        self, user_email: Optional[str], query: str,
+        limit: int = 20, cursor: Optional[str] = None
+    ) -> SearchPage:
+        """Conversations whose messages match `query`, best match first, with a snippet of that message."""
+        pass
+
     @abstractmethod
     async def create_conversation(
         self, endpoint_id: str, title: str,
@@ -33,6 +119,15 @@ class IStorage(ABC):
     async def add_message(self, conversation_id: str, message: InsertMessage) -> Message:
         pass
 
+    @abstractmethod
+    async def record_chat_turn(
+        self, conversation_id: str, messages: list[InsertMessage],
+        new_conversation: Optional[Conversation] = None
+    ) -> list[Message]:
+        """Persist a whole chat turn at once: create `new_conversation` when given,
+        insert `messages` in order and bump the conversation's updatedAt."""
+        pass
+
     @abstractmethod
     async def update_conversation(self, id: str, updates: dict) -> Optional[Conversation]:
         pass
@@ -97,22 +192,187 @@ class IStorage(ABC):
     async def set_config(self, config: Config) -> Config:
         pass
 
+    @property
+    def backend_name(self) -> str:
+        return type(self).__name__
+
+    def pool_stats(self) -> dict[str, int]:
+        """Connection pool utilisation by state; empty for backends without a pool."""
+        return {}
+
+
+def _forward(name: str):
+    async def method(self, *args, **kwargs):
+        return await self._call(name, *args, **kwargs)
+    method.__name__ = name
+    method.__qualname__ = f"DelegatingStorage.{name}"
+    return method
+
+
+class DelegatingStorage(IStorage):
+    """Wraps another IStorage, routing every IStorage method through `_call`.
+
+    Subclasses override `_call` to add behaviour around all backends at once; attributes
+    outside the IStorage interface (initialize, shutdown, ...) are passed straight through.
+    """
+
+    def __init__(self, delegate: IStorage):
+        self._delegate = delegate
+
+    async def _call(self, name: str, *args, **kwargs):
+        return await getattr(self._delegate, name)(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._delegate, name)
+
+    @property
+    def delegate(self) -> IStorage:
+        return self._delegate
+
+    @property
+    def backend_name(self) -> str:
+        return self._delegate.backend_name
+
+    def pool_stats(self) -> dict[str, int]:
+        return self._delegate.pool_stats()
+
+
+for _name in IStorage.__abstractmethods__:
+    setattr(DelegatingStorage, _name, _forward(_name))
+update_abstractmethods(DelegatingStorage)
+
+
+class _ConversationLock:
+    """A conversation's write lock, shared by the callers that hold or await it."""
 
-class MemStorage(IStorage):
     def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+        # Set by delete_conversation so callers still waiting do not bring the conversation back
+        self.deleted = False
+
+
+class MemStorage(IStorage):
+    """In-process storage with per-user indexes sorted by updatedAt.
+
+    Writes to a conversation are serialized by a per-conversation lock. With a memory cap
+    (MEM_STORAGE_MAX_MB), the least recently used conversations that are not being
+    written are evicted once the estimated size, which includes their share of the search
+    index, exceeds it. Messages are kept in an inverted index for search.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
         self.conversations: dict[str, Conversation] = {}
         self.domains: dict[str, Domain] = {}
         self.sites: dict[str, Site] = {}
         self.endpoints: dict[str, Endpoint] = {}
         self.config = Config()
         self._databricks_endpoints_loaded = False
+        self._index = ConversationIndex()
+        self.search_index = InvertedIndex()
+        self._locks: dict[str, _ConversationLock] = {}
+        self._recency: OrderedDict[str, None] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self.memory_bytes = 0
+        self.max_bytes = int(MEM_STORAGE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.evictions = 0
         self._initialize_defaults()
 
+    @staticmethod
+    def _message_size(message: Message) -> int:
+        return len(message.content) + _OBJECT_OVERHEAD
+
+    @asynccontextmanager
+    async def _lock(self, conversation_id: str) -> AsyncIterator["_ConversationLock"]:
+        """Hold the conversation's lock; the entry is dropped once no caller holds or awaits it."""
+        entry = self._locks.get(conversation_id)
+        if entry is None:
+            entry = self._locks[conversation_id] = _ConversationLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield entry
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._locks[conversation_id]
+
+    def _used(self, conversation_id: str):
+        if conversation_id in self._recency:
+            self._recency.move_to_end(conversation_id)
+
+    def _grow(self, conversation_id: str, size: int):
+        self._sizes[conversation_id] = self._sizes.get(conversation_id, 0) + size
+        self.memory_bytes += size
+
+    def _insert(self, conversation: Conversation):
+        self.conversations[conversation.id] = conversation
+        self._index.add(conversation)
+        indexed = self.search_index.memory_bytes
+        self.search_index.add_conversation(conversation.id, conversation.userEmail)
+        for message in conversation.messages:
+            self.search_index.add(conversation.id, message.id, message.content, message.timestamp)
+        self._recency[conversation.id] = None
+        self._grow(conversation.id, len(conversation.title) + _OBJECT_OVERHEAD
+                   + sum(self._message_size(m) for m in conversation.messages)
+                   + self.search_index.memory_bytes - indexed)
+
+    def _append_messages(self, conversation: Conversation, messages: list[Message]):
+        conversation.messages.extend(messages)
+        indexed = self.search_index.memory_bytes
+        for message in messages:
+            self.search_index.add(conversation.id, message.id, message.content, message.timestamp)
+        self._grow(conversation.id, sum(self._message_size(m) for m in messages)
+                   + self.search_index.memory_bytes - indexed)
+
+    def _forget(self, conversation_id: str) -> Optional[Conversation]:
+        conversation = self.conversations.pop(conversation_id, None)
+        self._index.remove(conversation_id)
+        self.search_index.remove_conversation(conversation_id)
+        self._recency.pop(conversation_id, None)
+        self.memory_bytes -= self._sizes.pop(conversation_id, 0)
+        return conversation
+
+    def _touch(self, conversation: Conversation, at: Optional[int] = None):
+        conversation.updatedAt = at or int(time.time() * 1000)
+        self._index.touch(conversation)
+        self._used(conversation.id)
+
+    def _enforce_memory_cap(self):
+        if not self.max_bytes or self.memory_bytes <= self.max_bytes:
+            return
+        for conversation_id in list(self._recency):
+            if self.memory_bytes <= self.max_bytes:
+                break
+            if conversation_id in self._locks:
+                continue
+            self._evict(conversation_id)
+
+    def _evict(self, conversation_id: str):
+        """Drop a cold conversation to stay under the memory cap; subclasses may keep it elsewhere."""
+        self._forget(conversation_id)
+        self.evictions += 1
+        log.debug("Evicted cold conversation", conversation_id=conversation_id, memory_bytes=self.memory_bytes)
+
+    async def _journal(self, op: str, **data):
+        """Called after each write is applied, still under the conversation lock.
+
+        A no-op here; durable subclasses record the write and return once it is persisted.
+        """
+
+    def memory_stats(self) -> dict:
+        return {
+            "conversations": len(self.conversations),
+            "memory_bytes": self.memory_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
     async def refresh_endpoints_from_databricks(self) -> list[Endpoint]:
         from .databricks_client import databricks_client
         
         if not databricks_client.is_configured():
-            print("Databricks not configured, keeping default endpoints")
+            log.info("Databricks not configured, keeping default endpoints")
             return list(self.endpoints.values())
         
         try:
@@ -123,12 +383,12 @@ class MemStorage(IStorage):
                 for endpoint in db_endpoints:
                     self.endpoints[endpoint.id] = endpoint
                 self._databricks_endpoints_loaded = True
-                print(f"Loaded {len(db_endpoints)} endpoints from Databricks")
+                log.info("Loaded endpoints from Databricks", count=len(db_endpoints))
             else:
-                print("No endpoints from Databricks, keeping defaults")
+                log.info("No endpoints from Databricks, keeping defaults")
                 
         except Exception as e:
-            print(f"Error refreshing endpoints from Databricks: {e}")
+            log.warning("Error refreshing endpoints from Databricks", error=e)
             
         return list(self.endpoints.values())
 
@@ -175,14 +435,60 @@ class MemStorage(IStorage):
                 self.endpoints[endpoint.id] = endpoint
 
     async def get_conversations(self, user_email: Optional[str] = None) -> list[Conversation]:
-        conversations = list(self.conversations.values())
-        if user_email:
-            conversations = [c for c in conversations if c.userEmail == user_email]
-        return sorted(conversations, key=lambda c: c.updatedAt, reverse=True)
+        return [self.conversations[id] for id in self._index.newest_first(user_email)]
+
+    async def get_conversation_summaries(
+        self, user_email: Optional[str] = None,
+        limit: int = 50, cursor: Optional[str] = None
+    ) -> ConversationPage:
+        position = decode_cursor(cursor)
+        summaries = [
+            ConversationSummary(
+                id=c.id, title=c.title, endpointId=c.endpointId,
+                domainId=c.domainId, siteId=c.siteId,
+                updatedAt=c.updatedAt, messageCount=len(c.messages)
+            )
+            for c in (self.conversations[id] for id in self._index.newest_first(user_email, position, limit + 1))
+        ]
+        return build_conversation_page(summaries, limit)
 
     async def get_conversation(self, id: str) -> Optional[Conversation]:
+        self._used(id)
         return self.conversations.get(id)
 
+    async def get_conversation_summary(self, id: str) -> Optional[ConversationSummary]:
+        c = self.conversations.get(id)
+        if not c:
+            return None
+        self._used(id)
+        return ConversationSummary(
+            id=c.id, title=c.title, endpointId=c.endpointId,
+            domainId=c.domainId, siteId=c.siteId,
+            updatedAt=c.updatedAt, messageCount=len(c.messages)
+        )
+
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> list[Message]:
+        conversation = self.conversations.get(conversation_id)
+        if not conversation or limit <= 0:
+            return []
+        self._used(conversation_id)
+        return conversation.messages[-limit:]
+
+    async def search_conversations(
+        self, user_email: Optional[str], query: str,
+        limit: int = 20, cursor: Optional[str] = None
+    ) -> SearchPage:
+        offset = decode_search_cursor(cursor)
+        wanted = query_terms(query)
+        results = []
+        for hit in self.search_index.search(wanted, user_email, limit + 1, offset):
+            conversation = self.conversations[hit.conversation_id]
+            message = next(m for m in reversed(conversation.messages) if m.id == hit.message_id)
+            results.append(build_search_result(
+                conversation.id, conversation.title, message, wanted, hit.matches, hit.rank
+            ))
+        return build_search_page(results, limit, offset)
+
     async def create_conversation(
         self, endpoint_id: str, title: str,
         domain_id: Optional[str] = None, site_id: Optional[str] = None,
@@ -201,41 +507,68 @@ class MemStorage(IStorage):
             createdAt=now,
             updatedAt=now
         )
-        self.conversations[conv_id] = conversation
+        self._insert(conversation)
+        await self._journal("conversation", conversation=conversation)
+        self._enforce_memory_cap()
         return conversation
 
     async def add_message(self, conversation_id: str, message: InsertMessage) -> Message:
-        conversation = self.conversations.get(conversation_id)
-        if not conversation:
-            raise ValueError("Conversation not found")
-        
-        msg_id = str(uuid4())
-        new_message = Message(
-            id=msg_id,
-            role=message.role,
-            content=message.content,
-            timestamp=message.timestamp
-        )
-        conversation.messages.append(new_message)
-        conversation.updatedAt = int(time.time() * 1000)
-        return new_message
+        return (await self.record_chat_turn(conversation_id, [message]))[0]
+
+    async def record_chat_turn(
+        self, conversation_id: str, messages: list[InsertMessage],
+        new_conversation: Optional[Conversation] = None
+    ) -> list[Message]:
+        async with self._lock(conversation_id) as lock:
+            created = None
+            # A conversation deleted while this call waited for the lock stays deleted
+            if new_conversation and not lock.deleted and conversation_id not in self.conversations:
+                created = new_conversation.model_copy(update={"messages": []})
+                self._insert(created)
+            conversation = self.conversations.get(conversation_id)
+            if not conversation:
+                raise ValueError("Conversation not found")
+
+            new_messages = [
+                Message(id=str(uuid4()), role=m.role, content=m.content, timestamp=m.timestamp)
+                for m in messages
+            ]
+            # Journal the new conversation as created: the record's messages are appended on replay
+            journaled = created.model_copy(update={"messages": []}) if created else None
+            self._append_messages(conversation, new_messages)
+            self._touch(conversation)
+            await self._journal(
+                "turn", id=conversation_id, conversation=journaled,
+                messages=new_messages, updatedAt=conversation.updatedAt
+            )
+        self._enforce_memory_cap()
+        return new_messages
 
     async def update_conversation(self, id: str, updates: dict) -> Optional[Conversation]:
-        conversation = self.conversations.get(id)
-        if not conversation:
+        if id not in self.conversations:
             return None
-        
-        for key, value in updates.items():
-            if hasattr(conversation, key):
-                setattr(conversation, key, value)
-        conversation.updatedAt = int(time.time() * 1000)
+
+        async with self._lock(id):
+            conversation = self.conversations.get(id)
+            if not conversation:
+                return None
+            for key, value in updates.items():
+                if hasattr(conversation, key):
+                    setattr(conversation, key, value)
+            self._touch(conversation)
+            await self._journal("update", id=id, updates=updates, updatedAt=conversation.updatedAt)
         return conversation
 
     async def delete_conversation(self, id: str) -> bool:
-        if id in self.conversations:
-            del self.conversations[id]
-            return True
-        return False
+        if id not in self.conversations:
+            return False
+        async with self._lock(id) as lock:
+            if id not in self.conversations:
+                return False
+            lock.deleted = True
+            self._forget(id)
+            await self._journal("delete", id=id)
+        return True
 
     async def get_domains(self) -> list[Domain]:
         return list(self.domains.values())
@@ -254,6 +587,7 @@ class MemStorage(IStorage):
         
         new_domain = Domain(id=domain_id, **domain.model_dump())
         self.domains[domain_id] = new_domain
+        await self._journal("domain", domain=new_domain)
         return new_domain
 
     async def update_domain(self, id: str, updates: dict) -> Optional[Domain]:
@@ -265,11 +599,13 @@ class MemStorage(IStorage):
         updated_data.update(updates)
         updated_domain = Domain(**updated_data)
         self.domains[id] = updated_domain
+        await self._journal("domain", domain=updated_domain)
         return updated_domain
 
     async def delete_domain(self, id: str) -> bool:
         if id in self.domains:
             del self.domains[id]
+            await self._journal("domain_delete", id=id)
             return True
         return False
 
@@ -299,6 +635,7 @@ class MemStorage(IStorage):
         
         new_endpoint = Endpoint(id=endpoint_id, **endpoint.model_dump())
         self.endpoints[endpoint_id] = new_endpoint
+        await self._journal("endpoint", endpoint=new_endpoint)
         return new_endpoint
 
     async def update_endpoint(self, id: str, updates: dict) -> Optional[Endpoint]:
@@ -310,11 +647,13 @@ class MemStorage(IStorage):
         updated_data.update(updates)
         updated_endpoint = Endpoint(**updated_data)
         self.endpoints[id] = updated_endpoint
+        await self._journal("endpoint", endpoint=updated_endpoint)
         return updated_endpoint
 
     async def delete_endpoint(self, id: str) -> bool:
         if id in self.endpoints:
             del self.endpoints[id]
+            await self._journal("endpoint_delete", id=id)
             return True
         return False
 
@@ -323,40 +662,57 @@ class MemStorage(IStorage):
 
     async def set_config(self, config: Config) -> Config:
         self.config = config
+        await self._journal("config", config=config)
         return self.config
 
 
 storage_instance: Optional[IStorage] = None
 
 
-async def initialize_storage() -> IStorage:
-    global storage_instance
+async def _create_local_storage() -> IStorage:
+    """Durable write-ahead-log storage when LOCAL_STORAGE_DIR is set, otherwise plain memory."""
+    from .wal_storage import LOCAL_STORAGE_DIR, WalStorage
+    if LOCAL_STORAGE_DIR:
+        try:
+            wal_storage = WalStorage(LOCAL_STORAGE_DIR)
+            await wal_storage.initialize()
+            log.info("Using local write-ahead log storage", directory=LOCAL_STORAGE_DIR)
+            return wal_storage
+        except Exception as e:
+            log.exception("Failed to initialize local storage, falling back to in-memory storage", error=e)
+    log.info("Using in-memory storage")
+    return MemStorage()
+
+
+async def _create_storage() -> IStorage:
     import os
     
-    print(f"[STORAGE] Checking environment variables...")
-    print(f"[STORAGE] PGHOST: {os.environ.get('PGHOST', 'not set')}")
-    print(f"[STORAGE] PGDATABASE: {os.environ.get('PGDATABASE', 'not set')}")
-    print(f"[STORAGE] DATABRICKS_CLIENT_ID: {'set' if os.environ.get('DATABRICKS_CLIENT_ID') else 'not set'}")
-    print(f"[STORAGE] DATABRICKS_CLIENT_SECRET: {'set' if os.environ.get('DATABRICKS_CLIENT_SECRET') else 'not set'}")
-    
+    from .migrations import MigrationPrivilegeError
+
     # Try LakeBase SDK first (Databricks Apps with OAuth token management)
     from .lakebase_sdk_storage import is_lakebase_configured, LakebaseSDKStorage
-    print(f"[STORAGE] is_lakebase_configured: {is_lakebase_configured()}")
+    log.info(
+        "Selecting storage backend",
+        pghost=os.environ.get("PGHOST", "not set"),
+        pgdatabase=os.environ.get("PGDATABASE", "not set"),
+        client_id_set=bool(os.environ.get("DATABRICKS_CLIENT_ID")),
+        client_secret_set=bool(os.environ.get("DATABRICKS_CLIENT_SECRET")),
+        lakebase_configured=is_lakebase_configured()
+    )
     
     if is_lakebase_configured():
         try:
-            print("[STORAGE] Attempting LakeBase SDK storage initialization...")
+            log.info("Attempting LakeBase SDK storage initialization")
             lakebase_sdk_storage = LakebaseSDKStorage()
             await lakebase_sdk_storage.initialize()
-            storage_instance = lakebase_sdk_storage
-            print("[STORAGE] SUCCESS - Using LakeBase SDK storage (Databricks with OAuth)")
-            await storage_instance.refresh_endpoints_from_databricks()
-            return storage_instance
+            log.info("Using LakeBase SDK storage (Databricks with OAuth)")
+            await lakebase_sdk_storage.refresh_endpoints_from_databricks()
+            return lakebase_sdk_storage
+        except MigrationPrivilegeError:
+            # The database is there; falling back would silently stop persisting conversations
+            raise
         except Exception as e:
-            import traceback
-            print(f"[STORAGE] Failed to initialize LakeBase SDK storage: {e}")
-            print(f"[STORAGE] Traceback: {traceback.format_exc()}")
-            print("[STORAGE] Falling back to other storage options")
+            log.exception("Failed to initialize LakeBase SDK storage, falling back to other storage options", error=e)
     
     # Try simple PostgreSQL (if PGPASSWORD is available)
     from .postgres_storage import get_postgres_url, PostgresStorage
@@ -365,13 +721,13 @@ async def initialize_storage() -> IStorage:
         try:
             postgres_storage = PostgresStorage(postgres_url)
             await postgres_storage.initialize()
-            storage_instance = postgres_storage
-            print("Using PostgreSQL storage")
-            await storage_instance.refresh_endpoints_from_databricks()
-            return storage_instance
+            log.info("Using PostgreSQL storage")
+            await postgres_storage.refresh_endpoints_from_databricks()
+            return postgres_storage
+        except MigrationPrivilegeError:
+            raise
         except Exception as e:
-            print(f"Failed to initialize PostgreSQL storage: {e}")
-            print("Falling back to other storage options")
+            log.warning("Failed to initialize PostgreSQL storage, falling back to other storage options", error=e)
     
     # Try LakeBase SQL warehouse (legacy approach)
     from .lakebase_storage import create_lakebase_config, LakeBaseStorage
@@ -380,21 +736,41 @@ async def initialize_storage() -> IStorage:
         try:
             lakebase_storage = LakeBaseStorage(lakebase_config)
             await lakebase_storage.initialize()
-            storage_instance = lakebase_storage
-            print("Using LakeBase SQL warehouse storage")
+            storage = lakebase_storage
+            log.info("Using LakeBase SQL warehouse storage")
         except Exception as e:
-            print(f"Failed to initialize LakeBase storage: {e}")
-            print("Falling back to in-memory storage")
-            storage_instance = MemStorage()
+            log.warning("Failed to initialize LakeBase storage, falling back to local storage", error=e)
+            storage = await _create_local_storage()
     else:
-        storage_instance = MemStorage()
-        print("Using in-memory storage")
+        storage = await _create_local_storage()
     
-    await storage_instance.refresh_endpoints_from_databricks()
+    await storage.refresh_endpoints_from_databricks()
     
+    return storage
+
+
+async def initialize_storage() -> IStorage:
+    global storage_instance
+    from .metrics import InstrumentedStorage
+    from .storage_cache import STORAGE_CACHE_CONVERSATIONS, CachedStorage, cache_enabled
+
+    backend = await _create_storage()
+    # In-memory backends already serve conversations from memory
+    if not isinstance(backend, MemStorage) and cache_enabled(backend):
+        backend = CachedStorage(backend)
+        await backend.start()
+        log.info("Caching conversations", backend=backend.backend_name, max_entries=STORAGE_CACHE_CONVERSATIONS)
+    storage_instance = InstrumentedStorage(backend)
     return storage_instance
 
 
+async def close_storage():
+    """Release the backend's connections and flush anything it buffers, if it supports closing."""
+    close = getattr(storage_instance, "close", None)
+    if close is not None:
+        await close()
+
+
 def get_storage() -> IStorage:
     global storage_instance
     if not storage_instance:
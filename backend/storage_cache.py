@@ -0,0 +1,425 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+from .log import get_logger
+from .metrics import db_statements, storage_cache
+from .models import Conversation, ConversationSummary, InsertMessage, Message
+from .storage import DelegatingStorage, IStorage
+
+
+# Conversations kept by the read-through cache in front of database backends; 0 disables it.
+# Unset, only backends that can share invalidations are cached, since others go stale for up to the TTL.
+STORAGE_CACHE_CONVERSATIONS_SET = "STORAGE_CACHE_CONVERSATIONS" in os.environ
+STORAGE_CACHE_CONVERSATIONS = int(os.getenv("STORAGE_CACHE_CONVERSATIONS", "1000"))
+# Entries are reloaded after this long, which bounds staleness when no invalidation arrives
+STORAGE_CACHE_TTL_SECONDS = float(os.getenv("STORAGE_CACHE_TTL_SECONDS", "300"))
+# "postgres" shares invalidations between workers with LISTEN/NOTIFY; "off" relies on the TTL
+STORAGE_CACHE_INVALIDATION = os.getenv("STORAGE_CACHE_INVALIDATION", "postgres").lower()
+# Newest messages kept per conversation for context windows, when its full history is not cached
+RECENT_MESSAGES_CAP = 200
+INVALIDATION_CHANNEL = "strata_conversation_cache"
+RECONNECT_SECONDS = 5.0
+KEEPALIVE_SECONDS = 30.0
+
+log = get_logger("storage.cache")
+
+
+def cache_enabled(backend: IStorage) -> bool:
+    """Whether initialize_storage should put a CachedStorage in front of `backend`."""
+    if STORAGE_CACHE_CONVERSATIONS <= 0:
+        return False
+    if STORAGE_CACHE_CONVERSATIONS_SET:
+        return True
+    return STORAGE_CACHE_INVALIDATION == "postgres" and hasattr(backend, "connect_listener")
+
+
+class PostgresInvalidation:
+    """Cross-worker invalidation over Postgres LISTEN/NOTIFY.
+
+    Every worker listens on one channel over a dedicated connection, which the storage
+    backend opens through `connect`. A write publishes the conversation id together with
+    the publishing worker's origin, so workers skip their own notifications. While
+    disconnected, notifications are lost, so `on_reset` is called on every (re)connect
+    and the caller drops everything it cached.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        connect: Callable[[], Awaitable["asyncpg.Connection"]],
+        on_invalidate: Callable[[str], None],
+        on_reset: Callable[[], None],
+    ):
+        self.backend = backend
+        self.origin = uuid4().hex[:12]
+        self._connect = connect
+        self._on_invalidate = on_invalidate
+        self._on_reset = on_reset
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def _notified(self, connection, pid, channel, payload: str):
+        origin, _, conversation_id = payload.partition(":")
+        if origin != self.origin and conversation_id:
+            self.received += 1
+            self._on_invalidate(conversation_id)
+
+    async def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = await self._connect()
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(INVALIDATION_CHANNEL, self._notified)
+                self._conn = conn
+                self._on_reset()
+                log.info("Listening for cache invalidations", backend=self.backend, channel=INVALIDATION_CHANNEL)
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        # A silently dropped connection is only noticed when it is used
+                        async with self._lock:
+                            await conn.execute("SELECT 1")
+                log.warning("Cache invalidation connection closed", backend=self.backend)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Cache invalidation channel failed", backend=self.backend, error=e)
+            finally:
+                self._conn = None
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            self._on_reset()
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def publish(self, conversation_id: str):
+        conn = self._conn
+        if conn is None:
+            return
+        try:
+            async with self._lock:
+                await conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, f"{self.origin}:{conversation_id}")
+            db_statements.inc(backend=self.backend)
+            self.published += 1
+        except Exception as e:
+            # Other workers fall back to the TTL for this write
+            log.warning("Publishing cache invalidation failed", backend=self.backend, error=e)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+@dataclass
+class _Entry:
+    summary: ConversationSummary
+    cached_at: float
+    # Full history, once get_conversation loaded it
+    conversation: Optional[Conversation] = None
+    # Newest messages, from get_recent_messages, when the full history is not cached
+    recent: Optional[list[Message]] = None
+
+    def recent_messages(self, limit: int) -> Optional[list[Message]]:
+        if self.conversation is not None:
+            return self.conversation.messages[-limit:] if limit > 0 else []
+        if self.recent is not None and (len(self.recent) >= limit or len(self.recent) == self.summary.messageCount):
+            return self.recent[-limit:] if limit > 0 else []
+        return None
+
+
+def _summary_of(conversation: Conversation) -> ConversationSummary:
+    return ConversationSummary(
+        id=conversation.id, title=conversation.title, endpointId=conversation.endpointId,
+        domainId=conversation.domainId, siteId=conversation.siteId,
+        updatedAt=conversation.updatedAt, messageCount=len(conversation.messages)
+    )
+
+
+class CachedStorage(DelegatingStorage):
+    """Read-through LRU cache of conversations in front of a database backend.
+
+    One entry per conversation serves get_conversation, get_conversation_summary and
+    get_recent_messages, so a chat turn on a recently used conversation reads nothing
+    from the database. Writes made through this instance update the cached entry
+    (write-through) and deletes drop it. Writes made by other workers reach this one
+    through `invalidation` when the backend supports it; entries also expire after
+    `ttl` seconds. Callers get copies, so they can never modify a cached entry.
+
+    A read that misses can race with a write to the same conversation; each in-flight
+    load remembers the conversation's version, and its result is only cached if no
+    write or invalidation happened meanwhile.
+    """
+
+    def __init__(
+        self,
+        delegate: IStorage,
+        max_entries: int = STORAGE_CACHE_CONVERSATIONS,
+        ttl: float = STORAGE_CACHE_TTL_SECONDS,
+        invalidation: str = STORAGE_CACHE_INVALIDATION,
+    ):
+        super().__init__(delegate)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        # conversation id -> [loads in flight, version]; only while a load is in flight
+        self._loads: dict[str, list[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        connect = getattr(delegate, "connect_listener", None)
+        self.invalidation: Optional[PostgresInvalidation] = None
+        if invalidation == "postgres" and connect is not None:
+            self.invalidation = PostgresInvalidation(
+                delegate.backend_name, connect, self._invalidated_elsewhere, self.clear
+            )
+
+    async def start(self):
+        if self.invalidation:
+            self.invalidation.start()
+
+    async def close(self):
+        if self.invalidation:
+            await self.invalidation.close()
+        close = getattr(self._delegate, "close", None)
+        if close is not None:
+            await close()
+
+    def _lookup(self, id: str) -> Optional[_Entry]:
+        entry = self._entries.get(id)
+        if entry is not None and time.monotonic() - entry.cached_at >= self.ttl:
+            del self._entries[id]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(id)
+        return entry
+
+    def _hit(self, operation: str):
+        self.hits += 1
+        storage_cache.inc(operation=operation, result="hit")
+
+    def _miss(self, operation: str):
+        self.misses += 1
+        storage_cache.inc(operation=operation, result="miss")
+
+    def _begin_load(self, id: str) -> int:
+        load = self._loads.setdefault(id, [0, 0])
+        load[0] += 1
+        return load[1]
+
+    def _end_load(self, id: str, version: int) -> bool:
+        """Whether the value just loaded is still current and may be cached."""
+        load = self._loads[id]
+        load[0] -= 1
+        if load[0] == 0:
+            del self._loads[id]
+        return load[1] == version
+
+    def _changed(self, id: str):
+        load = self._loads.get(id)
+        if load is not None:
+            load[1] += 1
+
+    def _store(self, id: str, entry: _Entry):
+        self._entries[id] = entry
+        self._entries.move_to_end(id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, id: str, source: str = "local"):
+        self._changed(id)
+        if self._entries.pop(id, None) is not None:
+            self.invalidations += 1
+            storage_cache.inc(operation="invalidate", result=source)
+
+    def _invalidated_elsewhere(self, id: str):
+        self.invalidate(id, source="remote")
+
+    def clear(self):
+        for id in self._loads:
+            self._changed(id)
+        self._entries.clear()
+
+    async def _publish(self, id: str):
+        if self.invalidation:
+            await self.invalidation.publish(id)
+
+    async def get_conversation(self, id: str) -> Optional[Conversation]:
+        entry = self._lookup(id)
+        if entry is not None and entry.conversation is not None:
+            self._hit("get_conversation")
+            conversation = entry.conversation
+            return conversation.model_copy(update={"messages": list(conversation.messages)})
+        self._miss("get_conversation")
+        version = self._begin_load(id)
+        try:
+            conversation = await self._call("get_conversation", id)
+        finally:
+            current = self._end_load(id, version)
+        if conversation is not None and current:
+            self._store(id, _Entry(
+                summary=_summary_of(conversation), cached_at=time.monotonic(),
+                conversation=conversation.model_copy(update={"messages": list(conversation.messages)})
+            ))
+        return conversation
+
+    async def get_conversation_summary(self, id: str) -> Optional[ConversationSummary]:
+        entry = self._lookup(id)
+        if entry is not None:
+            self._hit("get_conversation_summary")
+            return entry.summary.model_copy()
+        self._miss("get_conversation_summary")
+        version = self._begin_load(id)
+        try:
+            summary = await self._call("get_conversation_summary", id)
+        finally:
+            current = self._end_load(id, version)
+        if summary is not None and current:
+            self._store(id, _Entry(summary=summary.model_copy(), cached_at=time.monotonic()))
+        return summary
+
+    async def get_recent_messages(self, conversation_id: str, limit: int) -> list[Message]:
+        entry = self._lookup(conversation_id)
+        messages = entry.recent_messages(limit) if entry is not None else None
+        if messages is not None:
+            self._hit("get_recent_messages")
+            return list(messages)
+        self._miss("get_recent_messages")
+        version = self._begin_load(conversation_id)
+        try:
+            messages = await self._call("get_recent_messages", conversation_id, limit)
+        finally:
+            current = self._end_load(conversation_id, version)
+        # Only attached to a cached summary, which tells whether these are all the messages
+        entry = self._entries.get(conversation_id)
+        if current and entry is not None and entry.conversation is None:
+            if entry.recent is None or len(messages) > len(entry.recent):
+                entry.recent = list(messages[-RECENT_MESSAGES_CAP:])
+        return messages
+
+    def _write_through(self, id: str, messages: list[Message]):
+        """Append messages a write stored to the cached entry, as the backend just did."""
+        self._changed(id)
+        entry = self._entries.get(id)
+        if entry is None:
+            return
+        now = int(time.time() * 1000)
+        summary = entry.summary.model_copy(update={
+            "updatedAt": now, "messageCount": entry.summary.messageCount + len(messages)
+        })
+        if entry.conversation is not None:
+            entry.conversation = entry.conversation.model_copy(update={
+                "messages": entry.conversation.messages + messages, "updatedAt": now
+            })
+        if entry.recent is not None:
+            complete = len(entry.recent) == entry.summary.messageCount
+            keep = min(len(entry.recent) + len(messages), RECENT_MESSAGES_CAP) if complete else len(entry.recent)
+            entry.recent = (entry.recent + messages)[-keep:]
+        entry.summary = summary
+
+    async def create_conversation(
+        self, endpoint_id: str, title: str,
+        domain_id: Optional[str] = None, site_id: Optional[str] = None,
+        user_email: Optional[str] = None
+    ) -> Conversation:
+        conversation = await self._call("create_conversation", endpoint_id, title, domain_id, site_id, user_email)
+        self._store(conversation.id, _Entry(
+            summary=_summary_of(conversation), cached_at=time.monotonic(),
+            conversation=conversation.model_copy(update={"messages": list(conversation.messages)})
+        ))
+        return conversation
+
+    async def add_message(self, conversation_id: str, message: InsertMessage) -> Message:
+        try:
+            stored = await self._call("add_message", conversation_id, message)
+        except Exception:
+            self.invalidate(conversation_id)
+            raise
+        self._write_through(conversation_id, [stored])
+        await self._publish(conversation_id)
+        return stored
+
+    async def record_chat_turn(
+        self, conversation_id: str, messages: list[InsertMessage],
+        new_conversation: Optional[Conversation] = None
+    ) -> list[Message]:
+        try:
+            stored = await self._call("record_chat_turn", conversation_id, messages, new_conversation)
+        except Exception:
+            # The write may have been applied before it failed
+            self.invalidate(conversation_id)
+            raise
+        self._write_through(conversation_id, list(stored))
+        await self._publish(conversation_id)
+        return stored
+
+    async def update_conversation(self, id: str, updates: dict) -> Optional[Conversation]:
+        self.invalidate(id)
+        version = self._begin_load(id)
+        try:
+            conversation = await self._call("update_conversation", id, updates)
+        finally:
+            current = self._end_load(id, version)
+        # Backends return the updated conversation with its history
+        if conversation is not None and current:
+            self._store(id, _Entry(
+                summary=_summary_of(conversation), cached_at=time.monotonic(),
+                conversation=conversation.model_copy(update={"messages": list(conversation.messages)})
+            ))
+        await self._publish(id)
+        return conversation
+
+    async def delete_conversation(self, id: str) -> bool:
+        self.invalidate(id)
+        deleted = await self._call("delete_conversation", id)
+        self.invalidate(id)
+        await self._publish(id)
+        return deleted
+
+    def cache_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        invalidation = self.invalidation
+        return {
+            "enabled": True,
+            "backend": self.backend_name,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "invalidation_channel": {
+                "connected": invalidation.connected,
+                "published": invalidation.published,
+                "received": invalidation.received,
+                "reconnects": invalidation.reconnects,
+            } if invalidation else None,
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from .log import get_logger
+from .metrics import token_refresh_duration
+
+
+DEFAULT_TOKEN_LIFETIME = 3600
+REFRESH_MARGIN = float(os.getenv("DATABRICKS_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 60.0
+
+log = get_logger("token")
+
+
+@dataclass
+class AccessToken:
+    value: str
+    expires_in: Optional[float] = None
+
+    @classmethod
+    def from_oauth_response(cls, data: dict) -> "AccessToken":
+        return cls(value=data["access_token"], expires_in=data.get("expires_in"))
+
+
+class TokenManager:
+    """Caches an OAuth token and refreshes it ahead of expiry in the background.
+
+    `get_token` only fetches inline when there is no usable token at all, so in steady
+    state token fetches stay off the request path. Concurrent refreshes share one fetch.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fetch: Callable[[], Awaitable[AccessToken]],
+        refresh_margin: float = REFRESH_MARGIN,
+        default_lifetime: float = DEFAULT_TOKEN_LIFETIME
+    ):
+        self.name = name
+        self._fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.default_lifetime = default_lifetime
+        self._token: Optional[str] = None
+        self._expires_at: float = 0
+        self._refresh_at: float = 0
+        self._refresh: Optional[asyncio.Task] = None
+        self._background: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.failures = 0
+
+    @property
+    def current(self) -> Optional[str]:
+        """Last fetched token, without awaiting; for sync callers such as connect hooks."""
+        return self._token
+
+    @property
+    def expires_in(self) -> Optional[float]:
+        return self._seconds_left() if self._token else None
+
+    def _seconds_left(self) -> float:
+        return self._expires_at - time.monotonic()
+
+    async def get_token(self) -> str:
+        if self._token and self._seconds_left() > 0:
+            if self._background is None and time.monotonic() >= self._refresh_at:
+                self._refresh_in_background()
+            return self._token
+        return await self.refresh()
+
+    async def refresh(self) -> str:
+        """Fetch a new token, joining a refresh that is already running."""
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._do_refresh())
+        return await asyncio.shield(self._refresh)
+
+    async def force_refresh(self, stale: Optional[str] = None) -> str:
+        """Refresh after the server rejected `stale`, unless another caller already replaced it."""
+        if stale is not None and self._token and self._token != stale:
+            return self._token
+        return await self.refresh()
+
+    async def _do_refresh(self) -> str:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            token = await self._fetch()
+            outcome = "ok"
+            lifetime = token.expires_in if token.expires_in and token.expires_in > 0 else self.default_lifetime
+            now = time.monotonic()
+            self._token = token.value
+            self._expires_at = now + lifetime
+            # Short-lived tokens refresh at half-life so the margin never exceeds the lifetime
+            self._refresh_at = self._expires_at - min(self.refresh_margin, lifetime / 2)
+            self.refreshes += 1
+            return token.value
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self._refresh = None
+            token_refresh_duration.observe(time.perf_counter() - started, token=self.name, outcome=outcome)
+
+    def _refresh_in_background(self):
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._do_refresh())
+            self._refresh.add_done_callback(self._log_failure)
+
+    def _log_failure(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("Token refresh failed", token=self.name, error=task.exception())
+
+    async def start(self):
+        """Fetch the first token and keep it fresh until `close`."""
+        if self._background is None:
+            try:
+                await self.get_token()
+            except Exception as e:
+                log.warning("Initial token fetch failed", token=self.name, error=e)
+            self._background = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        delay = RETRY_DELAY
+        while True:
+            try:
+                await asyncio.sleep(max(self._refresh_at - time.monotonic(), 0))
+                await self.refresh()
+                delay = RETRY_DELAY
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                log.warning("Token refresh failed, retrying", token=self.name, retry_in_s=delay, error=e)
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    break
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    async def close(self):
+        if self._background:
+            self._background.cancel()
+            try:
+                await self._background
+            except asyncio.CancelledError:
+                pass
+            self._background = None
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "has_token": self._token is not None,
+            "expires_in_seconds": round(self._seconds_left(), 1) if self._token else None,
+            "background_refresh": self._background is not None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
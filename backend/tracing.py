@@ -0,0 +1,242 @@
+import atexit
+import json
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from .log import get_logger
+
+
+# OTLP/JSON lines, one per finished trace; tracing is off while unset
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "anglo-strata")
+
+log = get_logger("tracing")
+
+
+def _attribute_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: dict[str, Any]) -> list[dict]:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class _Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.finished: list["Span"] = []
+
+
+class Span:
+    """One timed operation, shaped after the OpenTelemetry span model."""
+
+    # OTLP status codes
+    UNSET, OK, ERROR = 0, 1, 2
+
+    def __init__(self, name: str, trace: _Trace, parent: Optional["Span"], attributes: dict[str, Any], kind: int = 1):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.events: list[dict] = []
+        self.status = self.UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any):
+        self.events.append({"name": name, "timeUnixNano": str(time.time_ns()), "attributes": _attributes(attributes)})
+
+    def record_exception(self, error: BaseException):
+        self.status = self.ERROR
+        self.status_message = str(error)[:200]
+        self.add_event("exception", **{"exception.type": type(error).__name__, "exception.message": str(error)[:200]})
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.trace.finished.append(self)
+        if self.parent_span_id is None:
+            tracer.export(self.trace)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message} if self.status_message else {"code": self.status},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.events:
+            span["events"] = self.events
+        return span
+
+
+class _NoopSpan:
+    """Stands in for a span when the request is not traced, so callers never branch."""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, **attributes: Any):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class JsonlExporter:
+    """Writes each finished trace as an OTLP/JSON `resourceSpans` line from a background thread.
+
+    The file can be replayed into an OpenTelemetry collector (otlpjsonfile receiver).
+    """
+
+    def __init__(self, path: str, max_queue: int = TRACE_QUEUE_SIZE):
+        self.path = path
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        self.exported = 0
+        self.dropped = 0
+        atexit.register(self.close)
+
+    def submit(self, trace: _Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as out:
+            while True:
+                trace = self._queue.get()
+                if trace is None:
+                    break
+                try:
+                    out.write(json.dumps(self._payload(trace), separators=(",", ":")) + "\n")
+                    if self._queue.empty():
+                        out.flush()
+                    self.exported += 1
+                except Exception as e:
+                    log.warning("Exporting trace failed", trace_id=trace.trace_id, error=e)
+
+    @staticmethod
+    def _payload(trace: _Trace) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": "strata"},
+                "spans": [span.to_otlp() for span in trace.finished],
+            }],
+        }]}
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+class Tracer:
+    def __init__(self, exporter: Optional[JsonlExporter], sample_rate: float = TRACE_SAMPLE_RATE):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_trace(self, name: str, **attributes: Any) -> Optional[Span]:
+        """Start a root span, or return None when tracing is off or the trace is sampled out."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        return Span(name, _Trace(secrets.token_hex(16)), None, attributes, kind=2)
+
+    @contextmanager
+    def activate(self, span: Optional[Span]) -> Iterator[None]:
+        """Make `span` the parent of spans started in this context, without ending it."""
+        token = _current_span.set(span)
+        try:
+            yield
+        finally:
+            _current_span.reset(token)
+
+    def start_span(self, name: str, **attributes: Any):
+        """Child span of the current span that the caller ends; for work spanning generator yields."""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(name, parent.trace, parent, attributes)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Child span of the current span; a no-op outside a traced request."""
+        parent = _current_span.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        span = Span(name, parent.trace, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def current_span(self):
+        return _current_span.get() or NOOP_SPAN
+
+    def export(self, trace: _Trace):
+        if self.exporter:
+            self.exporter.submit(trace)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "export_path": TRACE_EXPORT_PATH or None,
+            "sample_rate": self.sample_rate,
+            "exported": self.exporter.exported if self.exporter else 0,
+            "dropped": self.exporter.dropped if self.exporter else 0,
+        }
+
+
+tracer = Tracer(JsonlExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None)
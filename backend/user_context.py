@@ -8,6 +8,7 @@ class UserContext:
     email: Optional[str] = None
     access_token: Optional[str] = None
     display_name: Optional[str] = None
+    request_id: Optional[str] = None
     
     @property
     def is_authenticated(self) -> bool:
@@ -31,7 +32,8 @@ def get_user_context(request: Request) -> UserContext:
     return UserContext(
         email=email,
         access_token=access_token,
-        display_name=display_name
+        display_name=display_name,
+        request_id=getattr(request.state, "request_id", None)
     )
 
 
@@ -0,0 +1,362 @@
+import asyncio
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from typing import Any, BinaryIO, Optional
+
+from pydantic import BaseModel
+
+from .log import get_logger
+from .models import Config, Conversation, Domain, Endpoint, Message
+from .storage import MemStorage
+
+
+# Directory for the write-ahead log and snapshots; local durable storage is off while unset
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "")
+# Extra time a commit waits to gather more records before fsync; writes that arrive
+# while an fsync is in flight are always batched into the next one
+WAL_GROUP_COMMIT_MS = float(os.getenv("WAL_GROUP_COMMIT_MS", "0"))
+WAL_FSYNC = os.getenv("WAL_FSYNC", "true").lower() == "true"
+# Log bytes written since the last snapshot before a new snapshot compacts them
+WAL_SNAPSHOT_MB = float(os.getenv("WAL_SNAPSHOT_MB", "64"))
+
+log = get_logger("storage.wal")
+
+# Each record is framed as <payload length><crc32 of payload><JSON payload>
+_HEADER = struct.Struct("<II")
+_SEGMENT = re.compile(r"^wal-(\d{8})\.log$")
+_SNAPSHOT = re.compile(r"^snapshot-(\d{8})\.dat$")
+
+
+def _segment_name(generation: int) -> str:
+    return f"wal-{generation:08d}.log"
+
+
+def _snapshot_name(generation: int) -> str:
+    return f"snapshot-{generation:08d}.dat"
+
+
+def _json_default(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+
+def encode_record(event: dict) -> bytes:
+    payload = json.dumps(event, default=_json_default, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(path: str) -> tuple[list[dict], int]:
+    """Decode the records of one file through mmap.
+
+    Returns the records and the offset just past the last intact one; a torn or corrupt
+    tail (a crash mid-write) ends the scan there.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return [], 0
+        records = []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            while offset + _HEADER.size <= size:
+                length, checksum = _HEADER.unpack_from(mm, offset)
+                end = offset + _HEADER.size + length
+                if end > size:
+                    break
+                payload = mm[offset + _HEADER.size:end]
+                if zlib.crc32(payload) != checksum:
+                    break
+                records.append(json.loads(payload))
+                offset = end
+        return records, offset
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """Append-only segment files with group commit.
+
+    `append` buffers a record and waits until a background task has written and fsynced
+    the batch it landed in, so concurrent writers share one fsync. `rotate` starts a new
+    segment; records buffered for the old one are still committed to it first.
+    """
+
+    def __init__(self, directory: str, generation: int, fsync: bool = WAL_FSYNC,
+                 group_commit_ms: float = WAL_GROUP_COMMIT_MS):
+        self.directory = directory
+        self.generation = generation
+        self.fsync = fsync
+        self.group_commit_ms = group_commit_ms
+        self._file = self._open(generation)
+        self._chunks: list[bytes] = []
+        self._waiters: list[asyncio.Future] = []
+        self._sealed: list[tuple[BinaryIO, list[bytes], list[asyncio.Future]]] = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._writer = asyncio.create_task(self._run())
+        self.bytes_since_rotation = 0
+        self.records = 0
+        self.commits = 0
+
+    def _open(self, generation: int) -> BinaryIO:
+        return open(os.path.join(self.directory, _segment_name(generation)), "ab", buffering=0)
+
+    async def append(self, event: dict):
+        if self._closing:
+            raise RuntimeError("Write-ahead log is closed")
+        record = encode_record(event)
+        waiter = asyncio.get_running_loop().create_future()
+        self._chunks.append(record)
+        self._waiters.append(waiter)
+        self.bytes_since_rotation += len(record)
+        self.records += 1
+        self._wakeup.set()
+        await waiter
+
+    def rotate(self) -> int:
+        """Switch appends to a new segment and return its generation."""
+        self._sealed.append((self._file, self._chunks, self._waiters))
+        self._chunks, self._waiters = [], []
+        self.generation += 1
+        self._file = self._open(self.generation)
+        self.bytes_since_rotation = 0
+        self._wakeup.set()
+        return self.generation
+
+    def _write(self, file: BinaryIO, data: bytes, close: bool):
+        if data:
+            file.write(data)
+            if self.fsync:
+                os.fsync(file.fileno())
+        if close:
+            file.close()
+
+    async def _commit(self, file: BinaryIO, chunks: list[bytes], waiters: list[asyncio.Future], close: bool = False):
+        try:
+            await asyncio.to_thread(self._write, file, b"".join(chunks), close)
+            self.commits += 1
+        except Exception as e:
+            log.exception("Write-ahead log commit failed", records=len(chunks), error=e)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if self.group_commit_ms and not self._closing:
+                await asyncio.sleep(self.group_commit_ms / 1000)
+            self._wakeup.clear()
+            while self._sealed:
+                await self._commit(*self._sealed.pop(0), close=True)
+            if self._chunks:
+                chunks, waiters = self._chunks, self._waiters
+                self._chunks, self._waiters = [], []
+                await self._commit(self._file, chunks, waiters)
+            if self._closing and not self._chunks and not self._sealed:
+                return
+
+    async def close(self):
+        self._closing = True
+        self._wakeup.set()
+        await self._writer
+        self._file.close()
+
+    def stats(self) -> dict:
+        return {
+            "generation": self.generation,
+            "records": self.records,
+            "commits": self.commits,
+            "bytes_since_snapshot": self.bytes_since_rotation,
+            "fsync": self.fsync,
+        }
+
+
+class WalStorage(MemStorage):
+    """MemStorage made durable by a local write-ahead log plus compacted snapshots.
+
+    Every write is applied in memory and appended to the log before the call returns.
+    Startup loads the newest snapshot and replays the log segments written after it.
+    Once the log since the last snapshot grows past WAL_SNAPSHOT_MB, a new snapshot
+    replaces it. All state stays in memory, so the MemStorage memory cap does not apply.
+    """
+
+    def __init__(self, directory: str = LOCAL_STORAGE_DIR, snapshot_bytes: Optional[int] = None):
+        super().__init__(max_bytes=0)
+        self.directory = directory
+        self.snapshot_bytes = int(WAL_SNAPSHOT_MB * 1024 * 1024) if snapshot_bytes is None else snapshot_bytes
+        self.wal: Optional[WriteAheadLog] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self.snapshots = 0
+
+    def _files(self, pattern: re.Pattern) -> list[tuple[int, str]]:
+        found = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    async def initialize(self):
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.perf_counter()
+        generation, replayed, replayed_bytes = await asyncio.to_thread(self._recover)
+        self.wal = WriteAheadLog(self.directory, generation)
+        # Replayed segments are part of the log since the last snapshot
+        self.wal.bytes_since_rotation = replayed_bytes
+        log.info(
+            "Recovered local storage", directory=self.directory, conversations=len(self.conversations),
+            records=replayed, generation=generation, duration_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+
+    def _recover(self) -> tuple[int, int, int]:
+        """Load the newest snapshot and replay later segments.
+
+        Returns the generation for new appends and the number of records and bytes replayed.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+
+        base = 0
+        replayed = replayed_bytes = 0
+        snapshots = self._files(_SNAPSHOT)
+        if snapshots:
+            base, path = snapshots[-1]
+            records, _ = read_records(path)
+            self.domains.clear()
+            self.endpoints.clear()
+            for event in records:
+                self._apply(event)
+
+        segments = [(generation, path) for generation, path in self._files(_SEGMENT) if generation >= base]
+        for generation, path in segments:
+            records, good = read_records(path)
+            if good < os.path.getsize(path):
+                log.warning("Truncating torn write-ahead log tail", segment=path, valid_bytes=good)
+                os.truncate(path, good)
+            for event in records:
+                self._apply(event)
+            replayed += len(records)
+            replayed_bytes += good
+        # Appends go to a fresh segment so a recovered file is never written again
+        last = max([base - 1] + [generation for generation, _ in segments])
+        return last + 1, replayed, replayed_bytes
+
+    def _apply(self, event: dict):
+        op = event["op"]
+        if op == "conversation":
+            conversation = Conversation(**event["conversation"])
+            self._forget(conversation.id)
+            self._insert(conversation)
+        elif op == "turn":
+            if event.get("conversation"):
+                # Older records carry the turn's messages inside the conversation too
+                self._insert(Conversation(**{**event["conversation"], "messages": []}))
+            conversation = self.conversations.get(event["id"])
+            if conversation is None:
+                return
+            self._append_messages(conversation, [Message(**m) for m in event["messages"]])
+            self._touch(conversation, event["updatedAt"])
+        elif op == "update":
+            conversation = self.conversations.get(event["id"])
+            if conversation is None:
+                return
+            for key, value in event["updates"].items():
+                if hasattr(conversation, key):
+                    setattr(conversation, key, value)
+            self._touch(conversation, event["updatedAt"])
+        elif op == "delete":
+            self._forget(event["id"])
+        elif op == "domain":
+            domain = Domain(**event["domain"])
+            self.domains[domain.id] = domain
+        elif op == "domain_delete":
+            self.domains.pop(event["id"], None)
+        elif op == "endpoint":
+            endpoint = Endpoint(**event["endpoint"])
+            self.endpoints[endpoint.id] = endpoint
+        elif op == "endpoint_delete":
+            self.endpoints.pop(event["id"], None)
+        elif op == "config":
+            self.config = Config(**event["config"])
+
+    async def _journal(self, op: str, **data):
+        if self.wal is None:
+            return
+        await self.wal.append({"op": op, **data})
+        if self.snapshot_bytes and self.wal.bytes_since_rotation >= self.snapshot_bytes and self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self.snapshot())
+
+    def _capture(self) -> list[dict]:
+        """Copy the current state as snapshot events; messages are never mutated, so lists are copied shallowly."""
+        events: list[dict] = [{"op": "config", "config": self.config}]
+        events += [{"op": "domain", "domain": domain} for domain in self.domains.values()]
+        events += [{"op": "endpoint", "endpoint": endpoint} for endpoint in self.endpoints.values()]
+        events += [
+            {"op": "conversation", "conversation": c.model_copy(update={"messages": list(c.messages)})}
+            for c in self.conversations.values()
+        ]
+        return events
+
+    def _write_snapshot(self, generation: int, events: list[dict]):
+        path = os.path.join(self.directory, _snapshot_name(generation))
+        with open(path + ".tmp", "wb") as f:
+            for event in events:
+                f.write(encode_record(event))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_directory(self.directory)
+
+        for older, old_path in self._files(_SNAPSHOT) + self._files(_SEGMENT):
+            if older < generation:
+                os.remove(old_path)
+
+    async def snapshot(self):
+        """Compact the log: rotate to a new segment and write the state as of the rotation."""
+        try:
+            # Rotating and capturing in the same step (no await between them) makes the
+            # snapshot contain exactly the writes logged to earlier segments
+            generation = self.wal.rotate()
+            events = self._capture()
+            started = time.perf_counter()
+            await asyncio.to_thread(self._write_snapshot, generation, events)
+            self.snapshots += 1
+            log.info(
+                "Wrote local storage snapshot", generation=generation, conversations=len(self.conversations),
+                duration_ms=round((time.perf_counter() - started) * 1000, 1)
+            )
+        except Exception as e:
+            log.exception("Writing local storage snapshot failed", error=e)
+        finally:
+            self._snapshot_task = None
+
+    async def close(self):
+        if self.wal is None:
+            return
+        if self._snapshot_task is not None:
+            await self._snapshot_task
+        if self.wal.bytes_since_rotation:
+            await self.snapshot()
+        await self.wal.close()
+        self.wal = None
+
+    def wal_stats(self) -> dict:
+        return {**(self.wal.stats() if self.wal else {}), "directory": self.directory, "snapshots": self.snapshots}
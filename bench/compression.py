@@ -0,0 +1,142 @@
+"""Measure message compression on a synthetic corpus of mining-domain chats.
+
+Generates assistant answers for each business domain, trains per-domain dictionaries on
+one half and stores the other half through backend.compression.MessageCodec. Reports the
+bytes stored (which is also what reading a conversation's history transfers) and the
+encode and decode throughput for each codec:
+
+    python -m bench.compression --conversations 200 --output bench/results/compression.json
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from backend.compression import MessageCodec, train_dictionary, zstd_available
+
+
+SITES = ["Kumba", "Sishen", "Mogalakwena", "Unki", "Amandelbult", "Quellaveco", "Minas-Rio", "Los Bronces", "Moranbah"]
+DOMAIN_TERMS = {
+    "mining-ops": ["haul truck availability", "shovel utilisation", "drill and blast cycle", "bench height",
+                   "payload compliance", "shift handover", "dispatch system", "fleet productivity", "pit dewatering"],
+    "geological": ["resource estimation", "block model", "drillhole spacing", "grade control", "ore body continuity",
+                   "variography", "JORC classification", "core logging", "structural interpretation"],
+    "processing": ["flotation recovery", "mill throughput", "SAG mill power draw", "cyclone overflow", "concentrate grade",
+                   "reagent dosage", "tailings density", "crusher availability", "thickener underflow"],
+    "sustainability": ["water recycling rate", "Scope 1 emissions", "tailings storage facility", "community engagement",
+                       "biodiversity offset", "energy intensity", "rehabilitation plan", "ESG disclosure", "dust suppression"],
+    "supply-chain": ["critical spares inventory", "lead time", "supplier performance", "rail logistics",
+                     "port stockpile", "procurement contract", "warehouse turnover", "freight cost", "demand forecast"],
+    "finance": ["unit cost per tonne", "capital expenditure", "EBITDA margin", "cash cost", "working capital",
+                "budget variance", "sustaining capex", "realised price", "cost curve position"],
+}
+OPENERS = [
+    "Here is an overview of {term} at {site} and the main levers to improve it.",
+    "Based on the data for {site}, {term} is the key driver this quarter.",
+    "To improve {term} at {site}, I recommend focusing on the following areas.",
+]
+BULLETS = [
+    "- **{Term}**: review {term2} weekly and compare against the {pct}% target for {site}.",
+    "- **Monitoring**: track {term} per shift; a {pct}% deviation should trigger an investigation.",
+    "- **Root cause**: variability in {term2} explains most of the gap in {term}.",
+    "- **Action**: align the maintenance plan with {term2} to recover roughly {num} tonnes per day.",
+    "- **Risk**: lower {term} increases exposure on {term2}, especially during the wet season.",
+]
+CLOSERS = [
+    "Overall, addressing {term} and {term2} together should lift performance at {site} by {pct}%.",
+    "Let me know if you would like a breakdown by shift, equipment class or month.",
+    "I can also prepare a summary of these recommendations for the weekly operations review.",
+]
+
+
+def synthetic_answer(rng: random.Random, domain: str) -> str:
+    terms = DOMAIN_TERMS[domain]
+
+    def fill(template: str) -> str:
+        term, term2 = rng.sample(terms, 2)
+        return template.format(term=term, Term=term.capitalize(), term2=term2, site=rng.choice(SITES),
+                               pct=rng.randint(2, 30), num=rng.randint(100, 9000))
+
+    lines = [fill(rng.choice(OPENERS)), ""]
+    for section in range(rng.randint(2, 4)):
+        lines.append(f"### {rng.choice(terms).capitalize()}")
+        lines.extend(fill(rng.choice(BULLETS)) for _ in range(rng.randint(3, 7)))
+        lines.append("")
+    lines.append(fill(rng.choice(CLOSERS)))
+    return "\n".join(lines)
+
+
+def corpus(conversations: int, messages: int, seed: int) -> dict[str, list[str]]:
+    rng = random.Random(seed)
+    per_domain = max(conversations // len(DOMAIN_TERMS), 1)
+    return {
+        domain: [synthetic_answer(rng, domain) for _ in range(per_domain * messages)]
+        for domain in DOMAIN_TERMS
+    }
+
+
+def measure(name: str, codec: MessageCodec, evaluation: dict[str, list[str]]) -> dict:
+    raw = stored = 0
+    encoded = []
+    started = time.perf_counter()
+    for domain, texts in evaluation.items():
+        for text in texts:
+            content, codec_name, blob = codec.encode(text, domain)
+            encoded.append((content, codec_name, blob, text))
+            raw += len(text.encode("utf-8"))
+            stored += len(content.encode("utf-8")) + len(blob or b"")
+    encode_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for content, codec_name, blob, text in encoded:
+        if codec.decode(content, codec_name, blob) != text:
+            raise AssertionError(f"{name}: round trip changed a message")
+    decode_seconds = time.perf_counter() - started
+    return {
+        "codec": name,
+        "raw_bytes": raw,
+        "stored_bytes": stored,
+        "reduction": round(1 - stored / raw, 4),
+        "encode_mb_s": round(raw / 1e6 / encode_seconds, 1),
+        "decode_mb_s": round(raw / 1e6 / decode_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=4, help="Assistant messages per conversation")
+    parser.add_argument("--min-bytes", type=int, default=1024, help="MESSAGE_COMPRESSION_MIN_BYTES")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    messages = corpus(args.conversations, args.messages, args.seed)
+    training = {domain: texts[: len(texts) // 2] for domain, texts in messages.items()}
+    evaluation = {domain: texts[len(texts) // 2:] for domain, texts in messages.items()}
+
+    algorithms = ["zlib"] + (["zstd"] if zstd_available() else [])
+    results = [measure("plain", MessageCodec("off"), evaluation)]
+    for algorithm in algorithms:
+        results.append(measure(algorithm, MessageCodec(algorithm, args.min_bytes, use_dictionaries=False), evaluation))
+        codec = MessageCodec(algorithm, args.min_bytes)
+        for dictionary_id, (domain, samples) in enumerate(training.items(), start=1):
+            codec.add_dictionary(dictionary_id, domain, algorithm, train_dictionary(algorithm, samples))
+        results.append(measure(f"{algorithm} + domain dictionary", codec, evaluation))
+
+    print(f"{sum(len(t) for t in evaluation.values())} assistant messages, "
+          f"{len(DOMAIN_TERMS)} domains, threshold {args.min_bytes} bytes"
+          + ("" if zstd_available() else " (zstandard not installed; zstd rows skipped)"))
+    print(f"{'codec':<28}{'stored':>12}{'reduction':>11}{'encode MB/s':>13}{'decode MB/s':>13}")
+    for r in results:
+        print(f"{r['codec']:<28}{r['stored_bytes']:>12}{r['reduction']:>10.1%}{r['encode_mb_s']:>13}{r['decode_mb_s']:>13}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as out:
+            json.dump({"config": vars(args), "results": results}, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
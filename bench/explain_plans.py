@@ -0,0 +1,156 @@
+"""Check that the conversation and message queries use the indexes from backend/migrations.py.
+
+Creates a scratch schema, runs the migrations through PostgresStorage, seeds it, then
+captures the SQL that each storage read actually sends and runs EXPLAIN on it. Fails when
+a plan sequentially scans or sorts, or when the sidebar listing is not an index-only scan:
+
+    python -m bench.explain_plans --postgres-url postgresql://postgres:pw@127.0.0.1:5432/strata
+    python -m bench.explain_plans --postgres-container
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+from urllib.parse import urlencode, urlparse
+
+import asyncpg
+
+from backend.models import InsertMessage, MessageRole
+from backend.postgres_storage import PostgresStorage
+from backend.storage import build_conversation
+
+from .run import POSTGRES_CONTAINER, free_port, start_postgres_container
+
+
+SCHEMA = "strata_explain"
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def problems(plan: dict, index_only: bool) -> list[str]:
+    found = []
+    for node in plan_nodes(plan):
+        kind = node["Node Type"]
+        if kind == "Seq Scan":
+            found.append(f"sequential scan on {node['Relation Name']}")
+        elif kind in ("Sort", "Incremental Sort"):
+            found.append(f"sort on {', '.join(node.get('Sort Key', []))}")
+        elif index_only and kind == "Index Scan" and node.get("Relation Name") == "conversations":
+            found.append(f"{node['Index Name']} scan reads the table (expected an index-only scan)")
+    return found
+
+
+def describe(plan: dict) -> str:
+    parts = []
+    for node in plan_nodes(plan):
+        if "Index Name" in node:
+            parts.append(f"{node['Node Type']} using {node['Index Name']}")
+        elif node["Node Type"] not in ("Limit", "Result"):
+            parts.append(node["Node Type"])
+    return " > ".join(parts) or "Result"
+
+
+async def seed(storage: PostgresStorage, conversations: int, messages: int, users: int) -> list[str]:
+    ids = []
+    for i in range(conversations):
+        conversation = build_conversation("bench-endpoint", f"Conversation {i}", "mining-ops", "kumba", f"user{i % users}@bench")
+        turn = [
+            InsertMessage(role=MessageRole.user if j % 2 == 0 else MessageRole.assistant, content=f"message {j}", timestamp=j)
+            for j in range(messages)
+        ]
+        await storage.record_chat_turn(conversation.id, turn, new_conversation=conversation)
+        ids.append(conversation.id)
+    async with storage.pool.acquire() as conn:
+        # Index-only scans depend on the visibility map that VACUUM sets
+        await conn.execute("VACUUM ANALYZE conversations")
+        await conn.execute("VACUUM ANALYZE messages")
+    return ids
+
+
+async def check(url: str, conversations: int, messages: int, users: int) -> bool:
+    parsed = urlparse(url)
+    query = f"{parsed.query}&" if parsed.query else ""
+    storage_url = parsed._replace(query=query + urlencode({"search_path": SCHEMA})).geturl()
+
+    admin = await asyncpg.connect(url)
+    await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await admin.execute(f"CREATE SCHEMA {SCHEMA}")
+
+    storage = PostgresStorage(storage_url)
+    captured: list[tuple[str, tuple]] = []
+    try:
+        await storage.initialize()
+        ids = await seed(storage, conversations, messages, users)
+
+        # Route reads through one logged connection so every statement they send is captured
+        async def capture(conn):
+            conn.add_query_logger(lambda record: captured.append((record.query, record.args)))
+        await storage.pool.close()
+        storage.pool = await asyncpg.create_pool(storage_url, min_size=1, max_size=1, init=capture)
+        page = await storage.get_conversation_summaries("user1@bench", limit=20)
+
+        reads = [
+            ("sidebar, first page", True, lambda: storage.get_conversation_summaries("user1@bench", limit=20)),
+            ("sidebar, next page", True,
+             lambda: storage.get_conversation_summaries("user1@bench", limit=20, cursor=page.nextCursor)),
+            ("sidebar, all users", True, lambda: storage.get_conversation_summaries(None, limit=20)),
+            ("conversation summary", False, lambda: storage.get_conversation_summary(ids[0])),
+            ("context window", False, lambda: storage.get_recent_messages(ids[0], 20)),
+            ("conversation with history", False, lambda: storage.get_conversation(ids[0])),
+        ]
+
+        ok = True
+        explain = await asyncpg.connect(storage_url)
+        try:
+            for name, index_only, read in reads:
+                captured.clear()
+                await read()
+                statements = [(q, a) for q, a in captured if q.lstrip().upper().startswith("SELECT")]
+                for statement, args in statements:
+                    raw = await explain.fetchval(f"EXPLAIN (FORMAT JSON) {statement}", *(args or ()))
+                    plan = json.loads(raw)[0]["Plan"]
+                    found = problems(plan, index_only)
+                    ok = ok and not found
+                    print(f"{'FAIL' if found else 'ok  '}  {name}: {describe(plan)}")
+                    for problem in found:
+                        print(f"        {problem}")
+        finally:
+            await explain.close()
+        return ok
+    finally:
+        if storage.pool:
+            await storage.pool.close()
+        await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await admin.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--postgres-url", help="Postgres to check against; a scratch schema is created and dropped")
+    parser.add_argument("--postgres-container", action="store_true", help="Start a throwaway postgres:16 container with docker")
+    parser.add_argument("--conversations", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=10, help="Messages per conversation")
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+    if not args.postgres_url and not args.postgres_container:
+        parser.error("Pass --postgres-url or --postgres-container")
+
+    url = args.postgres_url
+    try:
+        if not url:
+            env = start_postgres_container(free_port())
+            url = f"postgresql://{env['PGUSER']}:{env['PGPASSWORD']}@{env['PGHOST']}:{env['PGPORT']}/{env['PGDATABASE']}"
+        ok = asyncio.run(check(url, args.conversations, args.messages, args.users))
+    finally:
+        if args.postgres_container and not args.postgres_url:
+            subprocess.run(["docker", "stop", POSTGRES_CONTAINER], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Mock Databricks workspace for benchmarks.
+
+Serves the endpoint listing, serving-endpoint invocations (JSON or SSE streaming) and the
+OAuth token endpoint with configurable latency and injected errors:
+
+    python -m bench.mock_databricks --port 8700 --latency-ms 300 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+from dataclasses import asdict, dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+WORDS = (
+    "ore grade recovery throughput haul truck shovel crusher mill flotation concentrate tailings "
+    "safety shift plan blast drill bench pit stockpile conveyor maintenance availability"
+).split()
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    rate_limit_rate: float = 0.0
+    response_words: int = 60
+    stream_chunks: int = 20
+    chunk_delay_ms: float = 10.0
+    endpoints: int = 12
+
+
+def _endpoint_listing(count: int) -> list[dict]:
+    """A mix of agent, foundation and custom endpoints, all READY."""
+    endpoints = []
+    for i in range(count):
+        kind = ("agent", "foundation", "custom")[i % 3]
+        endpoint = {"name": f"bench-{kind}-{i}", "state": {"ready": "READY"}, "config": {"served_entities": []}}
+        if kind == "agent":
+            endpoint["task"] = "agent/v1/chat"
+        elif kind == "foundation":
+            endpoint["config"]["served_entities"] = [{"name": "llm", "external_model": {"name": "llm"}}]
+        endpoints.append(endpoint)
+    return endpoints
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock Databricks")
+    stats = {"listings": 0, "invocations": 0, "streams": 0, "errors": 0, "rate_limited": 0, "tokens": 0}
+
+    async def model_latency():
+        delay = random.uniform(config.latency_ms - config.jitter_ms, config.latency_ms + config.jitter_ms)
+        await asyncio.sleep(max(delay, 0) / 1000)
+
+    def injected_error():
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse({"error_code": "REQUEST_LIMIT_EXCEEDED"}, status_code=429, headers={"Retry-After": "1"})
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error_code": "TEMPORARILY_UNAVAILABLE"}, status_code=config.error_status)
+        return None
+
+    @app.get("/api/2.0/serving-endpoints")
+    async def list_endpoints():
+        stats["listings"] += 1
+        return {"endpoints": _endpoint_listing(config.endpoints)}
+
+    @app.post("/oidc/v1/token")
+    async def token():
+        stats["tokens"] += 1
+        return {"access_token": "mock-token", "token_type": "Bearer", "expires_in": 3600}
+
+    @app.post("/serving-endpoints/{name}/invocations")
+    async def invoke(name: str, request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error is not None:
+            await model_latency()
+            return error
+        words = [random.choice(WORDS) for _ in range(config.response_words)]
+
+        if not body.get("stream"):
+            stats["invocations"] += 1
+            await model_latency()
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}}]}
+
+        stats["streams"] += 1
+
+        async def events():
+            # Time to first token is the configured latency; the rest arrives in chunks
+            await model_latency()
+            per_chunk = max(len(words) // max(config.stream_chunks, 1), 1)
+            for start in range(0, len(words), per_chunk):
+                delta = " ".join(words[start:start + per_chunk]) + " "
+                yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': delta}}]})}\n\n"
+                await asyncio.sleep(config.chunk_delay_ms / 1000)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return {**stats, "config": asdict(config)}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    defaults = MockConfig()
+    for field, value in asdict(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    config = MockConfig(**{field: getattr(args, field) for field in asdict(defaults)})
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""Load test the backend against a mock Databricks workspace.
+
+Starts bench.mock_databricks and, for each storage backend, a uvicorn instance of
+backend.main, then drives /api/chat, /api/conversations and /api/endpoints at a fixed
+concurrency. Reports throughput, latency percentiles and per-request storage calls,
+SQL statements and Databricks calls (read from /api/metrics), and writes the results
+as JSON so later runs can be compared against them:
+
+    python -m bench.run --backends mem --requests 500 --concurrency 16 --output bench/baseline.json
+    python -m bench.run --backends mem,postgres --postgres-container --baseline bench/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlparse
+
+import httpx
+
+
+SCENARIOS = ("chat", "chat_stream", "conversations", "endpoints")
+POSTGRES_CONTAINER = "strata-bench-postgres"
+_SAMPLE = re.compile(r"^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(max(math.ceil(p * len(ordered)) - 1, 0), len(ordered) - 1)]
+
+
+def parse_metrics(text: str) -> dict[str, float]:
+    """Sum Prometheus samples per metric name, across all label sets."""
+    totals: dict[str, float] = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            name = match["name"]
+            totals[name] = totals.get(name, 0.0) + float(match["value"])
+    return totals
+
+
+@dataclass
+class ScenarioResult:
+    latencies: list[float] = field(default_factory=list)
+    first_byte: list[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: dict[str, int] = field(default_factory=dict)
+
+    def record(self, started: float, status: int, first_byte: Optional[float] = None):
+        self.latencies.append(time.perf_counter() - started)
+        if first_byte is not None:
+            self.first_byte.append(first_byte - started)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if status >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed: float, before: dict[str, float], after: dict[str, float]) -> dict:
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+
+        def per_request(metric: str) -> float:
+            return round((after.get(metric, 0.0) - before.get(metric, 0.0)) / count, 2) if count else 0.0
+
+        summary = {
+            "requests": count,
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "duration_s": round(elapsed, 3),
+            "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            "storage_calls_per_request": per_request("strata_storage_operation_duration_seconds_count"),
+            "db_statements_per_request": per_request("strata_db_statements_total"),
+            "databricks_calls_per_request": per_request("strata_databricks_request_duration_seconds_count"),
+        }
+        if self.first_byte:
+            summary["ttfb_p50_ms"] = round(percentile(sorted(self.first_byte), 0.50) * 1000, 2)
+            summary["ttfb_p95_ms"] = round(percentile(sorted(self.first_byte), 0.95) * 1000, 2)
+        return summary
+
+
+class LoadDriver:
+    def __init__(self, base_url: str, users: int, endpoint_name: str):
+        self.base_url = base_url
+        self.users = [f"bench-user-{i}@example.com" for i in range(users)]
+        self.endpoint_name = endpoint_name
+        self.conversations: dict[str, list[str]] = {user: [] for user in self.users}
+
+    def headers(self, user: str) -> dict:
+        return {"X-Forwarded-Email": user, "X-Forwarded-Access-Token": "bench-user-token"}
+
+    def chat_body(self, user: str, message: str, new: bool) -> dict:
+        body = {"message": message, "endpointId": self.endpoint_name, "domainId": "mining-ops"}
+        if not new and self.conversations[user]:
+            body["conversationId"] = random.choice(self.conversations[user])
+        return body
+
+    async def seed(self, client: httpx.AsyncClient, conversations_per_user: int, turns: int):
+        """Give every user some history so listing and follow-up turns touch real rows."""
+        async def seed_user(user: str):
+            for c in range(conversations_per_user):
+                response = await client.post(
+                    "/api/chat", json=self.chat_body(user, f"Seed conversation {c}", new=True), headers=self.headers(user)
+                )
+                response.raise_for_status()
+                conversation_id = response.json()["conversationId"]
+                self.conversations[user].append(conversation_id)
+                for t in range(turns - 1):
+                    body = {**self.chat_body(user, f"Follow-up {t}", new=True), "conversationId": conversation_id}
+                    (await client.post("/api/chat", json=body, headers=self.headers(user))).raise_for_status()
+
+        await asyncio.gather(*(seed_user(user) for user in self.users))
+
+    async def one_request(self, client: httpx.AsyncClient, scenario: str, result: ScenarioResult, n: int):
+        user = self.users[n % len(self.users)]
+        started = time.perf_counter()
+        try:
+            if scenario == "chat":
+                # Alternate between new conversations and follow-ups in existing ones
+                body = self.chat_body(user, f"What was the throughput on shift {n}?", new=n % 2 == 0)
+                response = await client.post("/api/chat", json=body, headers=self.headers(user))
+                result.record(started, response.status_code)
+            elif scenario == "chat_stream":
+                body = self.chat_body(user, f"Summarise the maintenance plan for truck {n}", new=n % 2 == 0)
+                first_byte = None
+                async with client.stream("POST", "/api/chat/stream", json=body, headers=self.headers(user)) as response:
+                    async for _ in response.aiter_bytes():
+                        if first_byte is None:
+                            first_byte = time.perf_counter()
+                result.record(started, response.status_code, first_byte)
+            elif scenario == "conversations":
+                response = await client.get("/api/conversations", headers=self.headers(user))
+                result.record(started, response.status_code)
+            elif scenario == "endpoints":
+                response = await client.get("/api/endpoints", headers=self.headers(user))
+                result.record(started, response.status_code)
+        except httpx.HTTPError:
+            result.record(started, 599)
+
+    async def run(self, client: httpx.AsyncClient, scenario: str, requests: int, concurrency: int) -> dict:
+        result = ScenarioResult()
+        before = parse_metrics((await client.get("/api/metrics")).text)
+        counter = iter(range(requests))
+
+        async def worker():
+            for n in counter:
+                await self.one_request(client, scenario, result, n)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        after = parse_metrics((await client.get("/api/metrics")).text)
+        return result.summary(elapsed, before, after)
+
+
+def wait_for(url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before becoming ready")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def stop(process: Optional[subprocess.Popen]):
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def start_postgres_container(port: int) -> dict[str, str]:
+    subprocess.run(
+        ["docker", "run", "-d", "--rm", "--name", POSTGRES_CONTAINER,
+         "-e", "POSTGRES_PASSWORD=bench", "-e", "POSTGRES_DB=strata", "-p", f"{port}:5432", "postgres:16-alpine"],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        ready = subprocess.run(
+            ["docker", "exec", POSTGRES_CONTAINER, "pg_isready", "-U", "postgres", "-d", "strata"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if ready.returncode == 0:
+            break
+        time.sleep(0.5)
+    else:
+        raise TimeoutError("Postgres container did not become ready")
+    return {"PGHOST": "127.0.0.1", "PGPORT": str(port), "PGDATABASE": "strata", "PGUSER": "postgres",
+            "PGPASSWORD": "bench", "PGSSLMODE": "disable"}
+
+
+def postgres_env_from_url(url: str) -> dict[str, str]:
+    parsed = urlparse(url)
+    return {
+        "PGHOST": parsed.hostname or "127.0.0.1",
+        "PGPORT": str(parsed.port or 5432),
+        "PGDATABASE": parsed.path.lstrip("/") or "postgres",
+        "PGUSER": parsed.username or "postgres",
+        "PGPASSWORD": parsed.password or "",
+        "PGSSLMODE": "disable",
+    }
+
+
+def backend_env(backend: str, mock_url: str, postgres_env: Optional[dict[str, str]], extra: dict[str, str]) -> dict[str, str]:
+    # Strip anything that would make initialize_storage pick a different backend
+    env = {key: value for key, value in os.environ.items()
+           if not key.startswith(("PG", "DATABRICKS_", "LAKEBASE_"))}
+    env.update({
+        "DATABRICKS_HOST": mock_url,
+        "DATABRICKS_TOKEN": "bench-service-token",
+        "LOG_LEVEL": "WARNING",
+        "PYTHONUNBUFFERED": "1",
+    })
+    if backend == "postgres":
+        if not postgres_env:
+            raise ValueError("The postgres backend needs --postgres-url or --postgres-container")
+        env.update(postgres_env)
+    env.update(extra)
+    return env
+
+
+async def bench_backend(args, backend: str, mock_url: str, postgres_env: Optional[dict[str, str]]) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    extra = dict(item.split("=", 1) for item in args.env)
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        env=backend_env(backend, mock_url, postgres_env, extra)
+    )
+    try:
+        wait_for(f"{base_url}/api/domains", app)
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            storage_type = (await client.get("/api/debug/config")).json().get("storage_type")
+            expected = {"mem": "MemStorage", "postgres": "PostgresStorage"}[backend]
+            if storage_type != expected:
+                raise RuntimeError(f"Backend {backend} started with {storage_type} instead of {expected}")
+
+            driver = LoadDriver(base_url, args.users, args.endpoint)
+            await driver.seed(client, args.seed_conversations, args.seed_turns)
+            results = {}
+            for scenario in args.scenarios:
+                # Warm caches and connection pools before measuring
+                await driver.run(client, scenario, min(args.warmup, args.requests), args.concurrency)
+                results[scenario] = await driver.run(client, scenario, args.requests, args.concurrency)
+                print(format_row(backend, scenario, results[scenario]))
+            return results
+    finally:
+        stop(app)
+
+
+def format_row(backend: str, scenario: str, r: dict) -> str:
+    return (
+        f"{backend:<9} {scenario:<14} {r['throughput_rps']:>9.1f} rps  "
+        f"p50 {r['p50_ms']:>8.1f}  p95 {r['p95_ms']:>8.1f}  p99 {r['p99_ms']:>8.1f} ms  "
+        f"err {r['errors']:>4}  storage/req {r['storage_calls_per_request']:>5.1f}  "
+        f"sql/req {r['db_statements_per_request']:>5.1f}  dbx/req {r['databricks_calls_per_request']:>4.1f}"
+    )
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of the current run against a saved baseline."""
+    regressions = []
+    for backend, scenarios in results.items():
+        for scenario, current in scenarios.items():
+            base = baseline.get("results", {}).get(backend, {}).get(scenario)
+            if not base:
+                continue
+            label = f"{backend}/{scenario}"
+            for metric in ("p50_ms", "p95_ms", "p99_ms"):
+                if base[metric] and current[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(f"{label} {metric}: {base[metric]} -> {current[metric]}")
+            if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"{label} throughput_rps: {base['throughput_rps']} -> {current['throughput_rps']}")
+            for metric in ("db_statements_per_request", "storage_calls_per_request"):
+                # Round-trip counts are deterministic enough to flag any increase
+                if current[metric] > base.get(metric, 0) + 0.05:
+                    regressions.append(f"{label} {metric}: {base.get(metric)} -> {current[metric]}")
+            if current["errors"] > base["errors"]:
+                regressions.append(f"{label} errors: {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="mem", help="Comma-separated: mem,postgres")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=300, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=30, help="Unmeasured requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--seed-conversations", type=int, default=5, help="Conversations created per user before measuring")
+    parser.add_argument("--seed-turns", type=int, default=3, help="Chat turns per seeded conversation")
+    parser.add_argument("--endpoint", default="bench-foundation-1", help="Serving endpoint name used for chat")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra backend environment")
+    parser.add_argument("--mock-latency-ms", type=float, default=200.0)
+    parser.add_argument("--mock-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--mock-stream-chunks", type=int, default=20)
+    parser.add_argument("--mock-chunk-delay-ms", type=float, default=10.0)
+    parser.add_argument("--postgres-url", help="Existing Postgres to benchmark, e.g. postgresql://postgres:pw@127.0.0.1:5432/strata")
+    parser.add_argument("--postgres-container", action="store_true", help="Start a throwaway postgres:16 container with docker")
+    parser.add_argument("--output", default="bench/results/latest.json", help="Where to write this run's JSON")
+    parser.add_argument("--baseline", help="Compare against this earlier JSON output")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before flagging a regression")
+    args = parser.parse_args(argv)
+    args.backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"Unknown scenario {scenario}")
+    for backend in args.backends:
+        if backend not in ("mem", "postgres"):
+            parser.error(f"Unknown backend {backend}")
+    return args
+
+
+async def main_async(args) -> int:
+    mock_port = free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    mock = subprocess.Popen([
+        sys.executable, "-m", "bench.mock_databricks", "--port", str(mock_port),
+        "--latency-ms", str(args.mock_latency_ms), "--jitter-ms", str(args.mock_jitter_ms),
+        "--error-rate", str(args.mock_error_rate), "--rate-limit-rate", str(args.mock_rate_limit_rate),
+        "--stream-chunks", str(args.mock_stream_chunks), "--chunk-delay-ms", str(args.mock_chunk_delay_ms),
+    ])
+    postgres_env = postgres_env_from_url(args.postgres_url) if args.postgres_url else None
+    started_container = False
+    try:
+        wait_for(f"{mock_url}/mock/stats", mock)
+        if "postgres" in args.backends and args.postgres_container and not postgres_env:
+            postgres_env = start_postgres_container(free_port())
+            started_container = True
+
+        results = {}
+        for backend in args.backends:
+            results[backend] = await bench_backend(args, backend, mock_url, postgres_env)
+    finally:
+        stop(mock)
+        if started_container:
+            subprocess.run(["docker", "stop", POSTGRES_CONTAINER], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {
+            key: value for key, value in vars(args).items()
+            if key not in ("output", "baseline", "postgres_url")
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as out:
+        json.dump(report, out, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+
+def main():
+    sys.exit(asyncio.run(main_async(parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Measure conversation search at scale.
+
+The in-process mode builds backend.search.InvertedIndex (used by MemStorage and the SQL
+warehouse backend) over synthetic mining-domain chats and reports the indexing rate,
+memory and query latency percentiles, scoped to one user and across all users. The
+Postgres mode seeds the same corpus into a scratch schema, times
+PostgresStorage.search_conversations and checks with EXPLAIN that it uses the GIN index:
+
+    python -m bench.search --messages 1000000 --output bench/results/search.json
+    python -m bench.search --messages 1000000 --postgres-container
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import subprocess
+import time
+from urllib.parse import urlencode, urlparse
+
+from backend.search import InvertedIndex, query_terms
+
+from .compression import BULLETS, CLOSERS, DOMAIN_TERMS, OPENERS, SITES
+from .run import POSTGRES_CONTAINER, free_port, percentile, start_postgres_container
+
+
+SCHEMA = "strata_search_bench"
+MESSAGES_PER_CONVERSATION = 10
+QUESTIONS = [
+    "What is driving {term} at {site} this month?",
+    "How does {term} compare with {term2} across the sites?",
+    "Can you summarise the {term} trend for {site}?",
+    "Why did {term} drop during the wet season?",
+]
+QUERIES = [
+    "flotation recovery", "haul truck", "tailings", "Mogalakwena shovel utilisation",
+    "supplier lead time", "EBITDA margin Kumba", "grade control drillhole", "dust suppression",
+]
+
+
+def synthetic_message(rng: random.Random, domain: str, question: bool) -> str:
+    """A short chat message: a question, or an answer of a few lines."""
+    terms = DOMAIN_TERMS[domain]
+
+    def fill(template: str) -> str:
+        term, term2 = rng.sample(terms, 2)
+        return template.format(term=term, Term=term.capitalize(), term2=term2, site=rng.choice(SITES),
+                               pct=rng.randint(2, 30), num=rng.randint(100, 9000))
+
+    if question:
+        return fill(rng.choice(QUESTIONS))
+    lines = [fill(rng.choice(OPENERS))]
+    lines.extend(fill(rng.choice(BULLETS)) for _ in range(rng.randint(1, 3)))
+    lines.append(fill(rng.choice(CLOSERS)))
+    return "\n".join(lines)
+
+
+def messages(count: int, users: int, seed: int):
+    """(conversation id, user, message id, text, timestamp) for `count` synthetic messages."""
+    rng = random.Random(seed)
+    domains = list(DOMAIN_TERMS)
+    for n in range(count):
+        conversation = n // MESSAGES_PER_CONVERSATION
+        domain = domains[conversation % len(domains)]
+        yield (f"c{conversation}", f"user{conversation % users}@bench", f"m{n}",
+               synthetic_message(rng, domain, n % 2 == 0), n)
+
+
+def rss_mb() -> float:
+    # ru_maxrss is the peak RSS in KiB on Linux; the index only grows, so peak is current
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def latencies(search, users: int, scoped: bool, rounds: int) -> dict:
+    timings = []
+    for i in range(rounds):
+        query = QUERIES[i % len(QUERIES)]
+        user = f"user{i % users}@bench" if scoped else None
+        started = time.perf_counter()
+        search(query, user)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "queries": rounds,
+        "p50_ms": round(percentile(timings, 0.5), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "max_ms": round(timings[-1], 2),
+    }
+
+
+def bench_in_process(args) -> dict:
+    gc.collect()
+    rss_before = rss_mb()
+    index = InvertedIndex()
+    started = time.perf_counter()
+    for conversation_id, user, message_id, text, timestamp in messages(args.messages, args.users, args.seed):
+        if conversation_id not in index:
+            index.add_conversation(conversation_id, user)
+        index.add(conversation_id, message_id, text, timestamp)
+    build_seconds = time.perf_counter() - started
+
+    def search(query, user):
+        return index.search(query_terms(query), user, args.limit)
+
+    return {
+        "backend": "in-process",
+        "messages": args.messages,
+        "build_seconds": round(build_seconds, 1),
+        "messages_per_second": round(args.messages / build_seconds),
+        "rss_growth_mb": round(rss_mb() - rss_before, 1),
+        "index": index.stats(),
+        "scoped": latencies(search, args.users, True, args.queries),
+        "all_users": latencies(search, args.users, False, args.queries),
+    }
+
+
+async def bench_postgres(args, url: str) -> dict:
+    import asyncpg
+
+    from backend.postgres_storage import PostgresStorage
+
+    parsed = urlparse(url)
+    query = f"{parsed.query}&" if parsed.query else ""
+    storage_url = parsed._replace(query=query + urlencode({"search_path": SCHEMA})).geturl()
+
+    admin = await asyncpg.connect(url)
+    await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await admin.execute(f"CREATE SCHEMA {SCHEMA}")
+    storage = PostgresStorage(storage_url)
+    try:
+        await storage.initialize()
+        started = time.perf_counter()
+        async with storage.pool.acquire() as conn:
+            conversations = {}
+            rows = []
+            for conversation_id, user, message_id, text, timestamp in messages(args.messages, args.users, args.seed):
+                conversations.setdefault(conversation_id, (conversation_id, "Bench", "mining-ops", user, timestamp, timestamp))
+                rows.append((message_id, conversation_id, "user" if timestamp % 2 == 0 else "assistant", text, timestamp))
+            await conn.copy_records_to_table(
+                "conversations", records=list(conversations.values()),
+                columns=["id", "title", "domain_id", "user_email", "created_at", "updated_at"]
+            )
+            await conn.copy_records_to_table(
+                "messages", records=rows, columns=["id", "conversation_id", "role", "content", "timestamp"]
+            )
+            # Bulk COPY skips the insert path, so compute the vectors the way it would
+            await conn.execute("UPDATE messages SET search_vector = to_tsvector('english', content)")
+            await conn.execute("VACUUM ANALYZE conversations")
+            await conn.execute("VACUUM ANALYZE messages")
+        seed_seconds = time.perf_counter() - started
+
+        timings = {}
+        for scoped in (True, False):
+            samples = []
+            for i in range(args.queries):
+                user = f"user{i % args.users}@bench" if scoped else None
+                began = time.perf_counter()
+                await storage.search_conversations(user, QUERIES[i % len(QUERIES)], args.limit)
+                samples.append((time.perf_counter() - began) * 1000)
+            samples.sort()
+            timings["scoped" if scoped else "all_users"] = {
+                "queries": args.queries,
+                "p50_ms": round(percentile(samples, 0.5), 2),
+                "p95_ms": round(percentile(samples, 0.95), 2),
+                "max_ms": round(samples[-1], 2),
+            }
+
+        explain = await asyncpg.connect(storage_url)
+        try:
+            plan = await explain.fetchval(
+                """EXPLAIN (FORMAT JSON) SELECT m.id FROM messages m
+                   WHERE m.search_vector @@ websearch_to_tsquery('english', $1)""",
+                QUERIES[0]
+            )
+        finally:
+            await explain.close()
+        uses_gin = "idx_messages_search" in plan
+        return {
+            "backend": "postgres",
+            "messages": args.messages,
+            "seed_seconds": round(seed_seconds, 1),
+            "uses_gin_index": uses_gin,
+            **timings,
+        }
+    finally:
+        await storage.close()
+        await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await admin.close()
+
+
+def print_result(r: dict):
+    print(f"{r['backend']}: {r['messages']} messages")
+    if r["backend"] == "in-process":
+        print(f"  indexed in {r['build_seconds']}s ({r['messages_per_second']} messages/s), "
+              f"RSS +{r['rss_growth_mb']} MB, {r['index']['terms']} terms, {r['index']['postings']} postings")
+    else:
+        print(f"  seeded in {r['seed_seconds']}s, GIN index used: {r['uses_gin_index']}")
+    for scope in ("scoped", "all_users"):
+        t = r[scope]
+        print(f"  {scope:<10} p50 {t['p50_ms']:>8} ms   p95 {t['p95_ms']:>8} ms   max {t['max_ms']:>8} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200, help="Queries per scope")
+    parser.add_argument("--limit", type=int, default=20, help="Results per page")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--postgres-url", help="Also benchmark Postgres; a scratch schema is created and dropped")
+    parser.add_argument("--postgres-container", action="store_true", help="Start a throwaway postgres:16 container with docker")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = [bench_in_process(args)]
+    print_result(results[0])
+
+    url = args.postgres_url
+    if url or args.postgres_container:
+        try:
+            if not url:
+                env = start_postgres_container(free_port())
+                url = f"postgresql://{env['PGUSER']}:{env['PGPASSWORD']}@{env['PGHOST']}:{env['PGPORT']}/{env['PGDATABASE']}"
+            results.append(asyncio.run(bench_postgres(args, url)))
+            print_result(results[-1])
+        finally:
+            if args.postgres_container and not args.postgres_url:
+                subprocess.run(["docker", "stop", POSTGRES_CONTAINER], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as out:
+            json.dump({"config": vars(args), "results": results}, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
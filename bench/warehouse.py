@@ -0,0 +1,180 @@
+"""Check that a slow SQL warehouse query does not stall unrelated requests.
+
+Runs the app in process on LakeBaseStorage, with the connector replaced by a stub whose
+conversation queries block for `--query-seconds`, as a slow warehouse would. It measures
+`/api/domains` (served from memory) at a fixed concurrency, first on its own and then
+while `/api/conversations` requests keep the slow query in flight. It exits non-zero if
+the p99 under load exceeds the idle p99 by more than `--tolerance` plus `--slack-ms`:
+
+    python -m bench.warehouse --output bench/results/warehouse.json
+    python -m bench.warehouse --on-event-loop   # the regression this guards against
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+from backend import main as app_module
+from backend.lakebase_storage import LakeBaseConfig, LakeBaseStorage
+from backend.metrics import InstrumentedStorage
+from backend.storage import MemStorage
+
+from .run import percentile
+
+
+class SlowCursor:
+    """DB-API cursor stub: conversation queries block the calling thread, others return nothing."""
+
+    def __init__(self, query_seconds: float):
+        self.query_seconds = query_seconds
+
+    def execute(self, operation: str, parameters=None):
+        if "FROM conversations" in operation:
+            time.sleep(self.query_seconds)
+
+    def fetchall(self):
+        return []
+
+    def fetchmany(self, size: int):
+        return []
+
+    def close(self):
+        pass
+
+
+class SlowConnection:
+    def __init__(self, query_seconds: float):
+        self.query_seconds = query_seconds
+
+    def cursor(self) -> SlowCursor:
+        return SlowCursor(self.query_seconds)
+
+    def close(self):
+        pass
+
+
+class SlowWarehouse(LakeBaseStorage):
+    def __init__(self, config: LakeBaseConfig, query_seconds: float, on_event_loop: bool):
+        super().__init__(config)
+        self.query_seconds = query_seconds
+        self.on_event_loop = on_event_loop
+
+    def _connect(self) -> SlowConnection:
+        return SlowConnection(self.query_seconds)
+
+    async def _run(self, work):
+        if self.on_event_loop:
+            # What the backend did before its warehouse I/O moved to the executor
+            return work(self._thread_connection().cursor())
+        return await super()._run(work)
+
+
+async def drive(client: httpx.AsyncClient, requests: int, concurrency: int) -> list[float]:
+    timings: list[float] = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            (await client.get("/api/domains")).raise_for_status()
+            timings.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    timings.sort()
+    return timings
+
+
+def summary(timings: list[float], elapsed: float) -> dict:
+    return {
+        "requests": len(timings),
+        "rps": round(len(timings) / elapsed, 1),
+        "p50_ms": round(percentile(timings, 0.5), 2),
+        "p99_ms": round(percentile(timings, 0.99), 2),
+        "max_ms": round(timings[-1], 2),
+    }
+
+
+async def bench(args) -> dict:
+    config = LakeBaseConfig(
+        server_hostname="warehouse.bench", http_path="/sql/bench", catalog="main", schema="bench",
+        token="bench", max_concurrency=args.sql_max_concurrency
+    )
+    warehouse = SlowWarehouse(config, args.query_seconds, args.on_event_loop)
+    warehouse.memory_cache["domains"] = {d.id: d for d in await MemStorage().get_domains()}
+    app_module.storage = InstrumentedStorage(warehouse)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await drive(client, args.concurrency * 10, args.concurrency)
+            started = time.perf_counter()
+            idle = summary(await drive(client, args.requests, args.concurrency), time.perf_counter() - started)
+
+            stop = asyncio.Event()
+            slow_queries = 0
+
+            async def slow_reader(n: int):
+                nonlocal slow_queries
+                headers = {"X-Forwarded-Email": f"user{n}@bench"}
+                while not stop.is_set():
+                    (await client.get("/api/conversations", headers=headers)).raise_for_status()
+                    slow_queries += 1
+
+            readers = [asyncio.create_task(slow_reader(n)) for n in range(args.slow_queries)]
+            # Let the slow queries reach the warehouse before measuring
+            await asyncio.sleep(min(args.query_seconds / 2, 0.1))
+            started = time.perf_counter()
+            loaded = summary(await drive(client, args.requests, args.concurrency), time.perf_counter() - started)
+            stop.set()
+            await asyncio.gather(*readers)
+    finally:
+        await warehouse.close()
+        app_module.storage = None
+
+    limit = idle["p99_ms"] * (1 + args.tolerance) + args.slack_ms
+    return {
+        "mode": "event-loop" if args.on_event_loop else "executor",
+        "idle": idle,
+        "slow_query_in_flight": {**loaded, "slow_queries_completed": slow_queries},
+        "p99_limit_ms": round(limit, 2),
+        "passed": loaded["p99_ms"] <= limit,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="/api/domains requests per phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--slow-queries", type=int, default=2, help="get_conversations calls kept in flight")
+    parser.add_argument("--query-seconds", type=float, default=2.0, help="How long each slow query blocks")
+    parser.add_argument("--sql-max-concurrency", type=int, default=4, help="DATABRICKS_SQL_MAX_CONCURRENCY")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative p99 growth")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="Allowed absolute p99 growth")
+    parser.add_argument("--on-event-loop", action="store_true",
+                        help="Run warehouse work on the event loop, to show the test catches it")
+    parser.add_argument("--output", help="Write the result as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(bench(args))
+    print(f"{result['mode']}: /api/domains at concurrency {args.concurrency}, "
+          f"{args.slow_queries} x {args.query_seconds}s get_conversations in flight")
+    for phase in ("idle", "slow_query_in_flight"):
+        r = result[phase]
+        print(f"  {phase:<21} {r['rps']:>8} req/s   p50 {r['p50_ms']:>8} ms   p99 {r['p99_ms']:>8} ms   "
+              f"max {r['max_ms']:>8} ms")
+    print(f"  p99 limit {result['p99_limit_ms']} ms: {'ok' if result['passed'] else 'REGRESSION'}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as out:
+            json.dump({"config": vars(args), "result": result}, out, indent=2)
+    if not result["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()